@@ -1,11 +1,27 @@
-from model import knn_model
-from data_source import data_source
+from feed import feed_client, feed_loader
+from scheduler import task_scheduler
 
 import asyncio
+import os
+import sys
 from aiohttp import web
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень проекта
+from restoringvalues.registry import load_installations
+
 model_delay = 3000
 
+# Откуда брать батчи: "csv" - файлы Reciever-а, "feed" - прямая раздача Reciever-а,
+# "ring" - бинарные кольцевые буферы Reciever-а
+transport = os.getenv("BUSINESS_TRANSPORT", "csv")
+
+# Сколько процессов-исполнителей заполняют пропуски (0 - всё в процессе с HTTP-API)
+workers = int(os.getenv("BUSINESS_WORKERS", os.cpu_count() or 1))
+
+# Потоковый режим knn_model (окно последних строк, дозаполнение только новых строк).
+# По умолчанию выключен: батчи Reciever-а короткие (10 строк), и заполнение без окна на них не дороже
+streaming = os.getenv("BUSINESS_STREAMING", "0") == "1"
+
 # ----------------------
 #  HTTP‐API для управления
 # ----------------------
@@ -39,26 +55,35 @@ async def init_app():
 
 async def prediction_loop():
     while True:
-        for task in tasks:
-            batch, batch_true = task[1].load_batches() # Реальный запуск
-            batch_filled, metrics = task[0].imputation(batch, batch_true)
-            task[1].write_out(batch_filled, metrics)
+        await scheduler.tick()
 
         await asyncio.sleep(model_delay/1000)
 
 if __name__ == "__main__":
-    tasks = []
+    # Задачи: (аргументы knn_model, аргументы data_source)
+    specs = []
+    for inst in load_installations():
+        main = f"data_port_{inst.port_main}.csv"
+
+        # Реальный прогон установки
+        specs.append(({"streaming": streaming}, (main, None, f"data_out_{inst.port_main}.csv", f"data_out_{inst.port_main}_long.csv", None)))
 
-    # Реальный прогон для установок 1 и 2
-    tasks.append((knn_model(), data_source("data_port_8092.csv", None, "data_out_8092.csv", "data_out_8092_long.csv", None)))
-    tasks.append((knn_model(), data_source("data_port_8094.csv", None, "data_out_8094.csv", "data_out_8094_long.csv", None)))
+        # Тестовый запуск с вычислением метрик (если у установки есть эталонный порт)
+        if inst.port_test is not None:
+            test = inst.port_test
+            specs.append(({"streaming": streaming}, (main, f"data_port_{test}.csv", f"data_out_{test}.csv", f"data_out_{test}_long.csv", f"data_metrics_{test}.csv")))
 
-    # Тестовый запуск с вычислением метрик
-    tasks.append((knn_model(), data_source("data_port_8092.csv", "data_port_8093.csv", "data_out_8093.csv", "data_out_8093_long.csv", "data_metrics_8093.csv")))
-    tasks.append((knn_model(), data_source("data_port_8094.csv", "data_port_8095.csv", "data_out_8095.csv", "data_out_8095_long.csv", "data_metrics_8095.csv")))
+    # Прямую раздачу слушает главный процесс и передаёт батчи исполнителям
+    feed = feed_client() if transport == "feed" else None
+    loaders = [feed_loader(feed, *source_args[:2]) for _, source_args in specs] if feed is not None else None
+    scheduler = task_scheduler(specs, workers=workers, transport=transport, loaders=loaders)
 
     loop = asyncio.get_event_loop()
 
+    # 0) Подписываемся на прямую раздачу Reciever-а
+    if feed is not None:
+        loop.create_task(feed.run())
+
     # 1) Стартуем цикл прогнозирования
     loop.create_task(prediction_loop())
 
@@ -1,14 +1,24 @@
+from feed import change_notifier, port_from_path, feed_port
+
 import pandas as pd
 import os
+import sys
 import numpy as np
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень проекта
+from restoringvalues.rollup import rollup_set
+from restoringvalues.sink import make_sink
+
 class data_source:
     path_main = None
     path_test = None
     path_out = None
     path_metrics = None
 
-    def __init__(self, path_main, path_test, path_out, path_out_long, path_metrics):
+    def __init__(self, path_main, path_test, path_out, path_out_long, path_metrics, feed=None):
+        """
+        :param feed: feed_client - брать батчи напрямую у Reciever-а, а не из его CSV
+        """
         self.path_main = path_main
         self.path_test = path_test
         self.path_out = path_out
@@ -17,31 +27,41 @@ class data_source:
 
         self.dir_reciever = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Reciever")
         self.dir_business = os.path.dirname(os.path.abspath(__file__))
-        self.out_long = None
+        # Заполненная история: CSV или Parquet (BUSINESS_SINK)
+        self.sink = make_sink(os.path.join(self.dir_business, self.path_out_long)) if self.path_out else None
+        # Агрегаты заполненных данных по минутам/часам/суткам для длинных диапазонов GUI
+        self.rollups = rollup_set(self.dir_business, os.path.splitext(self.path_out)[0]) if self.path_out else None
 
-    def load_batches(self):
-        batch_main = None
-        if self.path_main is not None:
-            batch_main = pd.read_csv(os.path.join(self.dir_reciever, self.path_main))
+        # После записи результатов - событие подписчикам прямой раздачи Reciever-а (GUI)
+        self.notifier = change_notifier() if feed_port and self.path_out else None
 
-        batch_test = None
-        if self.path_test is not None:
-            batch_test = pd.read_csv(os.path.join(self.dir_reciever, self.path_test))
+        self.feed = feed
+        if self.feed is not None:
+            for path in (self.path_main, self.path_test):
+                if path is not None:
+                    self.feed.subscribe(path)
 
-        return batch_main, batch_test
+    def load_batch(self, path):
+        if path is None:
+            return None
+        if self.feed is not None:
+            return self.feed.load(path)
+        return pd.read_csv(os.path.join(self.dir_reciever, path))
 
-    def write_out(self, batch, metrics):
+    def load_batches(self):
+        return self.load_batch(self.path_main), self.load_batch(self.path_test)
+
+    def write_out(self, batch, metrics, raw=None):
+        """
+        :param raw: батч до заполнения - по нему в агрегатах считаются заполненные значения
+        """
         if self.path_out is not None and batch is not None:
             out_path = os.path.join(self.dir_business, self.path_out)
-            out_path_long = os.path.join(self.dir_business, self.path_out_long)
-            if self.out_long is None:
-                self.out_long = batch.copy()
-
-            self.out_long = pd.concat([self.out_long, batch]).drop_duplicates(subset="DateTime", keep="last").sort_values("DateTime").tail(1000)
 
             # Сохраняем
-            self.out_long.to_csv(out_path_long, index=False)
+            self.sink.write(batch)
             batch.to_csv(out_path, index=False)
+            self.rollups.fold(batch, raw)
 
         if self.path_metrics is not None:
             if metrics is not None:
@@ -49,6 +69,9 @@ class data_source:
                 metrics_df = pd.DataFrame(metrics_list)
                 metrics_df.to_csv(os.path.join(self.dir_business, self.path_metrics), index=False)
 
+        if self.notifier is not None and batch is not None:
+            self.notifier.notify(port_from_path(self.path_out))
+
 
 
 
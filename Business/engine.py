@@ -0,0 +1,501 @@
+import pandas as pd
+import numpy as np
+
+# Способ, которым было получено значение ячейки
+FILL_NONE = 0      # значение известно (или заполнить не удалось)
+FILL_MIDPOINT = 1  # среднее соседних строк
+FILL_KNN = 2       # взвешенный KNN по времени
+
+KNN_EPS = 1e-5  # чтоб не делить на ноль при совпадении времени
+INDEX_PENDING_LIMIT = 64  # сколько вставок копит time_index перед слиянием
+
+
+def batch_stamps(batch):
+    """Метки времени батча (NaT для нераспознанных)"""
+    return pd.to_datetime(batch.iloc[:, 0], errors="coerce")
+
+
+def batch_to_matrix(batch, stamps=None):
+    """
+    Разобрать батч на вектор времени и матрицу значений.
+
+    :param batch: DataFrame, первая колонка - DateTime, остальные - признаки
+    :param stamps: уже разобранные метки времени батча (см. batch_stamps)
+    :return: times (секунды от минимального времени, NaN для нераспознанных меток),
+             values (float64 матрица, NaN на месте пропусков)
+    """
+    if stamps is None:
+        stamps = batch_stamps(batch)
+    times = (stamps - stamps.min()).dt.total_seconds().to_numpy(dtype=np.float64)
+    values = batch.iloc[:, 1:].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    return times, values
+
+
+def matrix_to_batch(batch, filled):
+    """Вернуть копию батча, в которой колонки с пропусками заменены заполненными"""
+    out = batch.copy()
+    gaps = np.flatnonzero(out.iloc[:, 1:].isna().to_numpy().any(axis=0))
+    for col_idx in gaps:
+        out[out.columns[col_idx + 1]] = filled[:, col_idx]
+    return out
+
+
+def align_truth(original_batch, shape):
+    """Привести эталонный батч к форме (строки, признаки) заполняемого по позициям"""
+    truth = np.full(shape, np.nan)
+    values = original_batch.iloc[:shape[0], 1:shape[1] + 1]
+    values = values.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    truth[:values.shape[0], :values.shape[1]] = values
+    return truth
+
+
+class time_index:
+    """
+    Отсортированный по времени индекс известных значений одной колонки.
+
+    Хранит пары (время, строка), упорядоченные по времени, а при равном
+    времени - по номеру строки. Строится один раз на колонку батча и
+    пополняется по мере заполнения пропусков.
+    """
+
+    def __init__(self, times, rows):
+        times = np.asarray(times, dtype=np.float64)
+        rows = np.asarray(rows, dtype=np.int64)
+        keep = ~np.isnan(times)  # строки без времени в поиске соседей не участвуют
+        times, rows = times[keep], rows[keep]
+        order = np.lexsort((rows, times))
+        self.times = times[order]
+        self.rows = rows[order]
+        # Свежие вставки копятся здесь и вливаются в отсортированные массивы пачкой,
+        # чтобы не копировать весь индекс на каждое заполненное значение
+        self.pending_times = []
+        self.pending_rows = []
+
+    def __len__(self):
+        return self.times.size + len(self.pending_times)
+
+    def insert(self, time, row):
+        """Добавить известное значение строки row"""
+        if np.isnan(time):
+            return
+        self.pending_times.append(time)
+        self.pending_rows.append(row)
+        if len(self.pending_times) >= INDEX_PENDING_LIMIT:
+            self.merge()
+
+    def merge(self):
+        """Влить накопленные вставки в отсортированные массивы"""
+        if not self.pending_times:
+            return
+        times = np.array(self.pending_times, dtype=np.float64)
+        rows = np.array(self.pending_rows, dtype=np.int64)
+        self.pending_times, self.pending_rows = [], []
+
+        order = np.lexsort((rows, times))
+        times, rows = times[order], rows[order]
+        lo = np.searchsorted(self.times, times, side="left")
+        hi = np.searchsorted(self.times, times, side="right")
+        pos = np.array([l + np.searchsorted(self.rows[l:h], r) for l, h, r in zip(lo, hi, rows)], dtype=np.int64)
+        self.times = np.insert(self.times, pos, times)
+        self.rows = np.insert(self.rows, pos, rows)
+
+    def remove(self, rows, times):
+        """Убрать из индекса значения строк rows со временем times (поиск по времени, без прохода по индексу)"""
+        pos = []
+        for row, time in zip(rows, times):
+            if np.isnan(time):
+                continue
+            if row in self.pending_rows:
+                i = self.pending_rows.index(row)
+                del self.pending_rows[i], self.pending_times[i]
+                continue
+            lo = np.searchsorted(self.times, time, side="left")
+            hi = np.searchsorted(self.times, time, side="right")
+            found = np.flatnonzero(self.rows[lo:hi] == row)
+            if found.size:
+                pos.append(lo + found[0])
+        if pos:
+            self.times = np.delete(self.times, pos)
+            self.rows = np.delete(self.rows, pos)
+
+    def drop_before(self, row):
+        """Убрать из индекса все строки с номером меньше row"""
+        self.merge()
+        keep = self.rows >= row
+        self.times, self.rows = self.times[keep], self.rows[keep]
+
+    def nearest(self, time, k):
+        """
+        k ближайших по времени строк: от точки вставки расширяемся в обе стороны,
+        пока не наберём k кандидатов и всех, кто равноудалён с k-м.
+        При равном расстоянии раньше идёт строка с меньшим номером.
+
+        :return: rows, dist - номера строк и расстояния, по возрастанию расстояния
+        """
+        size = self.times.size
+        if np.isnan(time) or len(self) == 0 or k <= 0:
+            return self.rows[:0], self.times[:0]
+
+        lo = hi = 0
+        if size:
+            pos = np.searchsorted(self.times, time)
+            lo, hi = max(pos - k, 0), min(pos + k, size)
+            kth = min(k, hi - lo) - 1
+            reach = np.partition(np.abs(self.times[lo:hi] - time), kth)[kth]
+            while lo > 0 and time - self.times[lo - 1] <= reach:
+                lo -= 1
+            while hi < size and self.times[hi] - time <= reach:
+                hi += 1
+
+        times, rows = self.times[lo:hi], self.rows[lo:hi]
+        if self.pending_times:
+            # Непромерженные вставки - кандидаты наравне с найденными
+            times = np.concatenate((times, self.pending_times))
+            rows = np.concatenate((rows, self.pending_rows))
+
+        dist = np.abs(times - time)
+        order = np.lexsort((rows, dist))[:k]
+        return rows[order], dist[order]
+
+
+def knn_value(index, column, time, k, base=0):
+    """
+    Взвешенный KNN по времени для одного пропуска.
+    Вес соседа - 1 / (разница во времени + KNN_EPS).
+
+    :param base: номер строки в index, соответствующий позиции 0 в column
+    :return: value (NaN, если соседей нет), reach (расстояние до k-го соседа, inf если соседей меньше k)
+    """
+    rows, dist = index.nearest(time, k)
+    if rows.size == 0:
+        return np.nan, np.inf
+    value = np.average(column[rows - base], weights=1 / (dist + KNN_EPS))
+    return value, (dist[-1] if rows.size == k else np.inf)
+
+
+def fill_rows(times, column, missing, index, rows, k=3, base=0, method=None, reach=None):
+    """
+    Заполнить на месте пропуски column в позициях rows (по возрастанию):
+    - если строка не крайняя и оба соседа известны - среднее соседей;
+    - иначе - взвешенный KNN по времени (см. knn_value).
+    Заполненные значения добавляются в index и становятся известными для
+    следующих строк, как и в прежней поячеечной реализации.
+
+    :param missing: маска исходных пропусков колонки
+    :param base: номер строки в index, соответствующий позиции 0 в column
+    :param method: необязательный вектор FILL_*, меняется на месте
+    :param reach: необязательный вектор расстояний до k-го соседа для KNN, меняется на месте
+    """
+    last = column.size - 1
+    for row in rows:
+        if 0 < row < last and not missing[row + 1] and not np.isnan(column[row - 1]):
+            column[row] = (column[row - 1] + column[row + 1]) / 2
+            kind = FILL_MIDPOINT
+        else:
+            column[row], dist = knn_value(index, column, times[row], k, base)
+            kind = FILL_KNN
+            if reach is not None:
+                reach[row] = dist
+        if np.isnan(column[row]):
+            continue
+        index.insert(times[row], row + base)
+        if method is not None:
+            method[row] = kind
+
+
+def fill_column(times, column, k=3, method=None):
+    """
+    Заполнить пропуски одной колонки на месте (см. fill_rows).
+
+    :param times: вектор времени строк в секундах
+    :param column: значения колонки (float64, NaN на месте пропусков), меняется на месте
+    :param method: необязательный вектор FILL_*, меняется на месте
+    """
+    missing = np.isnan(column)
+    index = time_index(times[~missing], np.flatnonzero(~missing))
+    fill_rows(times, column, missing, index, np.flatnonzero(missing), k=k, method=method)
+
+
+def fill_matrix(times, values, k=3):
+    """
+    Заполнить все пропуски батча за один проход.
+
+    Каждая колонка заполняется fill_column со своим индексом времени,
+    поэтому поиск соседей стоит O(log n + k) на пропуск.
+
+    :param times: вектор времени строк в секундах
+    :param values: матрица значений с NaN на месте пропусков
+    :return: filled (заполненная матрица), method (FILL_* для каждой ячейки)
+    """
+    filled = values.copy()
+    method = np.zeros(values.shape, dtype=np.int8)
+
+    for col_idx in np.flatnonzero(np.isnan(values).any(axis=0)):
+        column = filled[:, col_idx].copy()
+        fill_column(times, column, k=k, method=method[:, col_idx])
+        filled[:, col_idx] = column
+
+    return filled, method
+
+
+class stream_imputer:
+    """
+    Потоковое заполнение пропусков.
+
+    Хранит окно из последних строк (исходные значения, заполненные значения,
+    способ заполнения) и индексы времени по колонкам. На каждом тике принимает
+    только строки с новыми DateTime и перезаполняет лишь те ячейки, чьё
+    окружение изменилось:
+    - пропуски в новых строках;
+    - KNN-ячейки, к которым новое значение ближе их k-го соседа;
+    - пропуск в бывшей последней строке, если за ним пришло значение
+      (KNN превращается в среднее соседей);
+    - пропуски, которые раньше заполнить не удалось.
+    В колонке перезаполняется всё начиная с самой ранней такой ячейки,
+    поэтому без усечения окна результат совпадает с fill_matrix по всему окну.
+
+    Чтобы тик стоил O(новых строк), а не O(окна):
+    - окно лежит в заранее выделенных массивах (по колонкам) на 2 * window строк:
+      новые строки пишутся на место, а когда место кончается, в начало
+      сдвигаются последние window строк - одно копирование на window строк;
+    - для каждой колонки помнятся первая ячейка, которую заполнить не удалось,
+      и KNN-ячейки, k-й сосед которых дальше самого позднего времени окна
+      (watch): пока время строк растёт, новое значение может задеть только их.
+      Если пришла строка раньше уже принятых, проверяются все KNN-ячейки колонки.
+    """
+
+    def __init__(self, k=3, window=1000):
+        self.k = k
+        self.window = window
+        self.reset()
+
+    def reset(self, names=None):
+        """Сбросить накопленное окно (например, при смене набора колонок)"""
+        self.names = names
+        self.origin = None  # метка времени, от которой считаются секунды
+        self.base = 0       # номер строки в позиции 0 буфера
+        self.size = 0       # строк в буфере
+        self.latest = -np.inf  # самое позднее время в окне
+        self.seqs = {}      # DateTime -> номер строки
+        self.stamps = []
+        width = 0 if names is None else len(names) - 1
+        self.allocate(2 * max(self.window, 1), width)
+        self.indices = [time_index([], []) for _ in range(width)]
+        self.unfilled = [None] * width  # номер первой строки колонки, которую заполнить не удалось
+        self.watch = [np.empty(0, dtype=np.int64) for _ in range(width)]  # номера KNN-строк колонки под наблюдением
+
+    def allocate(self, capacity, width):
+        """Выделить буфер окна на capacity строк, перенеся в него принятые строки"""
+        times = np.full(capacity, np.nan)
+        raw = np.full((capacity, width), np.nan, order="F")
+        filled = np.full((capacity, width), np.nan, order="F")
+        method = np.zeros((capacity, width), dtype=np.int8, order="F")
+        reach = np.full((capacity, width), np.inf, order="F")
+        if self.size:
+            times[:self.size] = self.times[:self.size]
+            raw[:self.size] = self.raw[:self.size]
+            filled[:self.size] = self.filled[:self.size]
+            method[:self.size] = self.method[:self.size]
+            reach[:self.size] = self.reach[:self.size]
+        self.times, self.raw, self.filled, self.method, self.reach = times, raw, filled, method, reach
+
+    def update(self, batch, values=None, stamps=None, k=None):
+        """
+        Принять очередной батч и вернуть заполненную матрицу значений его строк.
+
+        :param batch: DataFrame, первая колонка - DateTime, остальные - признаки
+        :param values: уже разобранная матрица значений батча (см. batch_to_matrix)
+        :param stamps: уже разобранные метки времени батча (см. batch_stamps)
+        :param k: число соседей KNN (None - прежнее); при смене всё окно перезаполняется
+        :return: float64 матрица того же размера, что batch.iloc[:, 1:]
+        """
+        names = list(batch.columns)
+        if names != self.names:
+            self.reset(names)
+        if k is not None and k != self.k:
+            self.set_k(k)
+        if stamps is None:
+            stamps = batch_stamps(batch)
+        if values is None:
+            _, values = batch_to_matrix(batch, stamps)
+
+        keys = batch.iloc[:, 0].astype(str).tolist()
+        fresh, seen = [], set()
+        for pos, key in enumerate(keys):
+            if key not in self.seqs and key not in seen:
+                fresh.append(pos)
+                seen.add(key)
+        if fresh:
+            self.append([keys[pos] for pos in fresh], stamps.iloc[fresh], values[fresh])
+
+        values = values.copy()
+        for pos, key in enumerate(keys):
+            seq = self.seqs.get(key)
+            if seq is not None:
+                values[pos] = self.filled[seq - self.base]
+        return values
+
+    def set_k(self, k):
+        """Сменить число соседей KNN и перезаполнить окно, чтобы в нём не смешивались два k"""
+        self.k = k
+        for col_idx in range(len(self.indices)):
+            self.refill(col_idx, 0)
+
+    def append(self, keys, stamps, values):
+        """
+        Дописать новые строки в окно и перезаполнить затронутые ячейки.
+
+        :param keys: DateTime строк как в self.seqs
+        :param stamps: разобранные метки времени строк
+        :param values: матрица значений строк
+        """
+        if self.origin is None or pd.isna(self.origin):
+            self.origin = stamps.min()
+        times = (stamps - self.origin).dt.total_seconds().to_numpy(dtype=np.float64)
+
+        self.make_room(len(keys))
+        old = self.size
+        first = self.base + old
+        for seq, key in enumerate(keys, start=first):
+            self.seqs[key] = seq
+        self.stamps.extend(keys)
+
+        self.size = old + len(keys)
+        self.times[old:self.size] = times
+        self.raw[old:self.size] = values
+        self.filled[old:self.size] = values
+        self.method[old:self.size] = FILL_NONE
+        self.reach[old:self.size] = np.inf
+
+        with np.errstate(invalid="ignore"):
+            in_order = not (times < self.latest).any()
+        if not np.isnan(times).all():
+            self.latest = max(self.latest, np.nanmax(times))
+
+        known = ~np.isnan(values)
+        cols, rows = np.nonzero(known.T)
+        time_list = times.tolist()
+        for col_idx, row in zip(cols.tolist(), rows.tolist()):
+            self.indices[col_idx].insert(time_list[row], first + row)
+
+        # Колонки, где есть что проверять: пропуски в новых строках, пропуск перед
+        # ними, незаполненные ячейки или KNN-ячейки под наблюдением
+        check = ~known.all(axis=0)
+        if old:
+            check |= known.any(axis=0) & (np.isnan(self.raw[old - 1]) | (not in_order)
+                                          | np.array([unfilled is not None for unfilled in self.unfilled])
+                                          | np.array([watch.size > 0 for watch in self.watch]))
+        for col_idx in np.flatnonzero(check):
+            start = self.dirty_start(col_idx, old, times, known[:, col_idx], in_order)
+            if start is not None:
+                self.refill(col_idx, start)
+            elif self.watch[col_idx].size:
+                self.prune(col_idx)
+
+    def dirty_start(self, col_idx, old, times, known, in_order):
+        """
+        Самая ранняя позиция колонки, которую нужно перезаполнить (None - нечего).
+
+        :param known: маска известных значений колонки в новых строках
+        """
+        starts = []
+        if not known.all():
+            starts.append(old + np.flatnonzero(~known)[0])
+        if known.any() and old:
+            if np.isnan(self.raw[old - 1, col_idx]) and known[0]:
+                starts.append(old - 1)
+
+            if self.unfilled[col_idx] is not None:
+                starts.append(max(self.unfilled[col_idx] - self.base, 0))
+
+            if in_order:
+                knn = self.watch[col_idx] - self.base
+            else:
+                knn = np.flatnonzero(self.method[:old, col_idx] == FILL_KNN)
+            if knn.size:
+                with np.errstate(invalid="ignore"):
+                    closest = np.abs(self.times[knn, None] - times[None, known]).min(axis=1)
+                    hit = knn[closest < self.reach[knn, col_idx]]
+                if hit.size:
+                    starts.append(hit.min())
+
+        return min(starts) if starts else None
+
+    def refill(self, col_idx, start):
+        """Перезаполнить пропуски колонки начиная с позиции start"""
+        size = self.size
+        missing = np.isnan(self.raw[:size, col_idx])
+        rows = np.flatnonzero(missing[start:]) + start
+        if rows.size == 0:
+            return
+
+        column = self.filled[:size, col_idx]
+        method = self.method[:size, col_idx]
+        reach = self.reach[:size, col_idx]
+        indexed = rows[method[rows] != FILL_NONE]  # ранее заполненные значения лежат в индексе
+        if indexed.size:
+            self.indices[col_idx].remove(indexed + self.base, self.times[indexed])
+        column[rows] = np.nan
+        method[rows] = FILL_NONE
+        reach[rows] = np.inf
+
+        fill_rows(self.times[:size], column, missing, self.indices[col_idx], rows,
+                  k=self.k, base=self.base, method=method, reach=reach)
+
+        # Незаполненные и KNN-ячейки до start не менялись, после start - пересчитаны
+        unfilled = self.unfilled[col_idx]
+        if unfilled is None or unfilled - self.base >= start:
+            failed = rows[(method[rows] == FILL_NONE) & ~np.isnan(self.times[rows])]
+            self.unfilled[col_idx] = failed[0] + self.base if failed.size else None
+        watch = self.watch[col_idx]
+        knn = rows[method[rows] == FILL_KNN] + self.base
+        self.watch[col_idx] = np.concatenate((watch[watch < start + self.base], knn))
+        self.prune(col_idx)
+
+    def prune(self, col_idx):
+        """Убрать из watch KNN-ячейки, k-й сосед которых ближе самого позднего времени окна"""
+        watch = self.watch[col_idx]
+        if watch.size:
+            pos = watch - self.base
+            with np.errstate(invalid="ignore"):
+                keep = ~(self.times[pos] + self.reach[pos, col_idx] <= self.latest)
+            self.watch[col_idx] = watch[keep]
+
+    def make_room(self, rows):
+        """
+        Освободить в буфере место под rows новых строк: в начало сдвигаются
+        последние window строк окна (или буфер растёт, если батч больше окна)
+        """
+        capacity = self.times.size
+        if self.size + rows <= capacity:
+            return
+        extra = max(self.size - self.window, 0)
+        if extra:
+            self.trim(extra)
+        if self.size + rows > capacity:
+            self.allocate(self.size + rows + self.window, self.raw.shape[1])
+
+    def trim(self, extra):
+        """Убрать из окна extra самых старых строк"""
+        for stamp in self.stamps[:extra]:
+            if self.seqs.get(stamp, -1) < self.base + extra:
+                self.seqs.pop(stamp, None)
+        del self.stamps[:extra]
+
+        size = self.size - extra
+        self.times[:size] = self.times[extra:self.size]
+        self.raw[:size] = self.raw[extra:self.size]
+        self.filled[:size] = self.filled[extra:self.size]
+        self.method[:size] = self.method[extra:self.size]
+        self.reach[:size] = self.reach[extra:self.size]
+        self.size = size
+        self.base += extra
+        for col_idx, index in enumerate(self.indices):
+            index.drop_before(self.base)
+            if self.unfilled[col_idx] is not None and self.unfilled[col_idx] < self.base:
+                # Первая незаполненная ячейка ушла из окна - следующую ищем в оставшихся
+                failed = np.flatnonzero((self.method[:size, col_idx] == FILL_NONE) & np.isnan(self.raw[:size, col_idx])
+                                        & ~np.isnan(self.times[:size]))
+                self.unfilled[col_idx] = failed[0] + self.base if failed.size else None
+            watch = self.watch[col_idx]
+            self.watch[col_idx] = watch[watch >= self.base]
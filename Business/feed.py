@@ -0,0 +1,158 @@
+import pandas as pd
+import asyncio
+import websockets
+import json
+import os
+import re
+import socket
+import sys
+from collections import deque
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень проекта
+from restoringvalues.ring_store import ring_reader, ring_path
+
+# Прямая раздача Reciever-а: по умолчанию включена только вместе с BUSINESS_TRANSPORT=feed
+feed_host = os.getenv("RECIEVER_FEED_HOST", "127.0.0.1")
+feed_port = int(os.getenv("RECIEVER_FEED_PORT", 8096 if os.getenv("BUSINESS_TRANSPORT") == "feed" else 0))
+
+
+def port_from_path(path):
+    """Номер порта из имени файла Reciever-а или Business (data_port_<port>.csv, data_out_<port>.csv)"""
+    match = re.search(r"data_(?:port|out)_(\d+)", path)
+    if match is None:
+        raise ValueError(f"Не удалось определить порт по имени {path}")
+    return int(match.group(1))
+
+
+class feed_client:
+    """
+    Подписчик прямой раздачи Reciever-а.
+
+    Держит в памяти такие же буферы, как Reciever пишет в data_port_<port>.csv,
+    и отдаёт их data_source вместо чтения файлов.
+    """
+
+    def __init__(self, host=feed_host, port=feed_port, rows=10):
+        self.uri = f"ws://{host}:{port}"
+        self.rows = rows
+        self.ports = set()
+        self.buffers = {}  # Формат: {port: {'names': list, 'buffer': deque(maxlen=rows)}}
+        self.websocket = None
+
+    def subscribe(self, path):
+        """Подписаться на порт, которому соответствует файл path"""
+        port = port_from_path(path)
+        if port not in self.ports:
+            self.ports.add(port)
+            if self.websocket is not None:
+                asyncio.ensure_future(self.send_subscription())
+        return port
+
+    def load(self, path):
+        """Текущий буфер порта в виде DataFrame (пустой, если данных ещё нет)"""
+        state = self.buffers.get(port_from_path(path))
+        if state is None:
+            return pd.DataFrame(columns=["DateTime"])
+        return pd.DataFrame(list(state['buffer']), columns=["DateTime"] + state['names'])
+
+    def handle(self, message):
+        """Разложить сообщение Reciever-а по буферам"""
+        data = json.loads(message)
+        if 'rows' not in data:
+            return  # событие об изменении (например, записанные результаты Business), строк в нём нет
+        port = data['port']
+        state = self.buffers.get(port)
+        if data.get('reset') or state is None or state['names'] != data['names']:
+            state = {'names': data['names'], 'buffer': deque(maxlen=self.rows)}
+            self.buffers[port] = state
+        state['buffer'].extend(data['rows'])
+
+    async def send_subscription(self):
+        try:
+            await self.websocket.send(json.dumps({'subscribe': sorted(self.ports)}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def run(self):
+        """Получать данные от Reciever-а, переподключаясь при обрыве"""
+        while True:
+            try:
+                async with websockets.connect(self.uri) as websocket:
+                    print(f"Подключено к прямой раздаче {self.uri}")
+                    self.websocket = websocket
+                    await self.send_subscription()
+                    async for message in websocket:
+                        try:
+                            self.handle(message)
+                        except (json.JSONDecodeError, KeyError, TypeError) as e:
+                            print(f"Некорректное сообщение прямой раздачи: {e}")
+            except Exception as e:
+                print(f"Ошибка подключения к {self.uri}: {e}, повторная попытка через 5 секунд...")
+            self.websocket = None
+            await asyncio.sleep(5)
+
+
+class change_notifier:
+    """
+    Уведомление подписчиков прямой раздачи (GUI) о записанных результатах:
+    {"port": порт} по UDP на порт раздачи Reciever-а, который рассылает событие
+    подписчикам этого порта. Если раздача выключена или Reciever не запущен,
+    датаграмма просто теряется.
+    """
+
+    def __init__(self, host=feed_host, port=feed_port):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def notify(self, port):
+        try:
+            self.socket.sendto(json.dumps({'port': port}).encode(), self.address)
+        except OSError:
+            pass
+
+
+class feed_loader:
+    """
+    Загрузка батчей одной задачи из прямой раздачи в главном процессе.
+    Интерфейс чтения тот же, что у data_source (load_batches), но без его
+    выходных файлов: их создают исполнители, которые пишут результаты.
+    """
+
+    def __init__(self, feed, path_main, path_test=None):
+        self.feed = feed
+        self.paths = (path_main, path_test)
+        for path in self.paths:
+            if path is not None:
+                feed.subscribe(path)
+
+    def load_batches(self):
+        return tuple(None if path is None else self.feed.load(path) for path in self.paths)
+
+
+class ring_client:
+    """
+    Чтение батчей из кольцевых буферов Reciever-а (ring_port_<port>.bin).
+    Интерфейс тот же, что у feed_client, текст при чтении не разбирается.
+    """
+
+    def __init__(self, directory=None, rows=10):
+        if directory is None:
+            directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Reciever")
+        self.directory = directory
+        self.rows = rows
+        self.readers = {}  # Формат: {port: ring_reader}
+
+    def subscribe(self, path):
+        return port_from_path(path)
+
+    def load(self, path):
+        """Последние rows строк порта в виде DataFrame (пустой, если буфера ещё нет)"""
+        port = port_from_path(path)
+        reader = self.readers.get(port)
+        if reader is None or reader.changed():
+            try:
+                reader = self.readers[port] = ring_reader(ring_path(self.directory, port))
+            except (OSError, ValueError):
+                self.readers.pop(port, None)
+                return pd.DataFrame(columns=["DateTime"])
+        return reader.frame(self.rows)
@@ -1,102 +1,96 @@
 import pandas as pd
 import numpy as np
+import warnings
+
+from engine import batch_stamps, batch_to_matrix, matrix_to_batch, align_truth, fill_matrix, knn_value, time_index, stream_imputer
 
 class knn_model:
-    mape_inter = []
-    mape_mean = []
+    mape_inter = None # MAPE заполнения по батчам этой модели
+    mape_mean = None # MAPE заполнения средним по батчам этой модели
 
     batch_size = 10
 
+    def __init__(self, streaming=False, window=1000, k=3):
+        """
+        :param streaming: потоковый режим - модель помнит последние строки (от window
+                          до 2 * window) и на каждом тике дозаполняет только новые строки
+                          и ячейки, чьё окружение изменилось (engine.stream_imputer)
+        :param k: число соседей KNN
+        """
+        self.mape_inter = []
+        self.mape_mean = []
+        self.k = k
+        self.stream = stream_imputer(k=k, window=window) if streaming else None
+
     def time_based_knn_impute(self, df, target_col, time_col='DateTime', k=3):
+        """
+        Заполнить все пропуски target_col взвешенным KNN по времени.
+        Соседи ищутся по индексу времени колонки (engine.time_index),
+        заполненные значения сразу становятся известными для следующих строк.
+        """
         df = df.copy()
         df[time_col] = pd.to_datetime(df[time_col])
-        df['TimeNumeric'] = (df[time_col] - df[time_col].min()).dt.total_seconds()  # время в секундах
-
-        for idx in df[df[target_col].isna()].index:
-            time_i = df.loc[idx, 'TimeNumeric']
-
-            # Найдём все строки с непустым значением
-            known = df[df[target_col].notna()].copy()
+        times = (df[time_col] - df[time_col].min()).dt.total_seconds().to_numpy(dtype=np.float64)  # время в секундах
 
-            # Считаем расстояние по времени
-            known['TimeDiff'] = np.abs(known['TimeNumeric'] - time_i)
+        column = df[target_col].to_numpy(dtype=np.float64, copy=True)
+        known = ~np.isnan(column)
+        index = time_index(times[known], np.flatnonzero(known))
 
-            # Берём k ближайших по времени
-            neighbors = known.nsmallest(k, 'TimeDiff')
+        for idx in np.flatnonzero(~known):
+            column[idx], _ = knn_value(index, column, times[idx], k)
+            if not np.isnan(column[idx]):
+                index.insert(times[idx], idx)
 
-            # Взвешенное среднее по времени (меньше время — больше вес)
-            weights = 1 / (neighbors['TimeDiff'] + 1e-5)  # чтоб не делить на ноль
-            imputed_value = np.average(neighbors[target_col], weights=weights)
+        df[target_col] = column
+        return df
 
-            # Подставляем
-            df.at[idx, target_col] = imputed_value
-
-        return df.drop(columns=['TimeNumeric'], errors='ignore')
-    def compare_fill_methods_and_calculate_mape_knn(self, batch, original_batch=None, k=3):
+    def compare_fill_methods_and_calculate_mape_knn(self, batch, original_batch=None, k=None):
         """
         Заполнение пропусков:
-        - В режиме 'test': интерполяция + KNN по времени + MAPE + лог
-        - В режиме 'standard': всё то же самое, но без логов и расчета метрик
+        - В режиме 'test': интерполяция + KNN по времени + MAPE
+        - В режиме 'standard': всё то же самое, но без расчета метрик
+
+        Весь батч заполняется за один проход векторным движком (engine.fill_matrix);
+        значения совпадают с прежней поячеечной реализацией с точностью rtol=1e-9.
+        В потоковом режиме пропуски заполняются по накопленному окну (engine.stream_imputer).
 
         :param batch: DataFrame с пропущенными значениями
         :param original_batch: Оригинальный DataFrame без пропусков
+        :param k: число соседей KNN (None - заданное при создании модели)
         :return: batch_interpolation (заполненный), mape_interpolation, mape_mean_fill
         """
-        batch_interpolation = batch.copy()
-        batch_mean_fill = batch.copy()
-
-        interpolation_errors = []
-        mean_fill_errors = []
-
-        batch_interpolation["TimeNumeric"] = pd.to_datetime(batch_interpolation.iloc[:, 0])
-        batch_interpolation["TimeNumeric"] = (batch_interpolation["TimeNumeric"] - batch_interpolation["TimeNumeric"].min()).dt.total_seconds()
-
-        is_test = not(original_batch is None)
-
-        for col_idx, col in enumerate(batch.columns[1:], start=1):
-            for idx in range(len(batch)):
-                if pd.isna(batch.iloc[idx, col_idx]):
-                    original_value = None if not is_test else original_batch.iloc[idx, col_idx]
-                    interpolated_value = None
-
-                    # Интерполяция
-                    if 0 < idx < len(batch) - 1:
-                        prev_val = batch_interpolation.iloc[idx - 1, col_idx]
-                        next_val = batch_interpolation.iloc[idx + 1, col_idx]
-                        if not pd.isna(prev_val) and not pd.isna(next_val):
-                            interpolated_value = (prev_val + next_val) / 2
-                            batch_interpolation.iat[idx, col_idx] = interpolated_value
-                            if is_test:
-                                #print(f"Интерполяция: строка {idx}, столбец {col_idx}, значение {interpolated_value:.4f}")
-                                if original_value != 0:
-                                    interpolation_errors.append(abs((original_value - interpolated_value) / original_value))
-
-                    # KNN по времени
-                    if interpolated_value is None:
-                        temp_df = batch_interpolation[[batch.columns[0], col]].rename(columns={batch.columns[0]: "DateTime"})
-                        temp_df = self.time_based_knn_impute(temp_df, target_col=col, time_col="DateTime", k=k)
-                        knn_value = temp_df.loc[idx, col]
-                        batch_interpolation.iat[idx, col_idx] = knn_value
-                        interpolated_value = knn_value
-                        if is_test:
-                            #print(f"KNN (по времени): строка {idx}, столбец {col_idx}, значение {knn_value:.4f}")
-                            if original_value != 0:
-                                interpolation_errors.append(abs((original_value - knn_value) / original_value))
-                    if is_test:
-                        # Заполнение средним значением
-                        mean_value = batch_mean_fill.iloc[:, col_idx].mean(skipna=True)
-                        batch_mean_fill.iat[idx, col_idx] = mean_value
-                    if is_test and original_value != 0:
-                        mean_fill_errors.append(abs((original_value - mean_value) / original_value))
-
-        batch_interpolation.drop(columns=["TimeNumeric"], inplace=True, errors='ignore')
-
-        if is_test:
-            mape_interpolation = np.mean(interpolation_errors) if interpolation_errors else None
-            mape_mean_fill = np.mean(mean_fill_errors) if mean_fill_errors else None
-            return batch_interpolation, mape_interpolation, mape_mean_fill
+        k = self.k if k is None else k
+        stamps = batch_stamps(batch)
+        times, values = batch_to_matrix(batch, stamps)
+        if self.stream is not None:
+            filled = self.stream.update(batch, values, stamps, k=k)
         else:
+            filled, _ = fill_matrix(times, values, k=k)
+        batch_interpolation = matrix_to_batch(batch, filled)
+
+        if original_batch is None:
             return batch_interpolation, None, None
+
+        mape_interpolation, mape_mean_fill = self.calculate_mape(values, filled, align_truth(original_batch, values.shape))
+        return batch_interpolation, mape_interpolation, mape_mean_fill
+
+    def calculate_mape(self, values, filled, truth):
+        """
+        MAPE заполнения и MAPE заполнения средним по пропущенным ячейкам.
+        Ячейки с нулевым эталоном не учитываются.
+        """
+        scored = np.isnan(values) & (truth != 0)
+        if not scored.any():
+            return None, None
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)  # колонка целиком из пропусков
+            mean_fill = np.broadcast_to(np.nanmean(values, axis=0), values.shape)
+
+        interpolation_errors = np.abs((truth[scored] - filled[scored]) / truth[scored])
+        mean_fill_errors = np.abs((truth[scored] - mean_fill[scored]) / truth[scored])
+        return np.mean(interpolation_errors), np.mean(mean_fill_errors)
+
     def imputation(self, batch, batch_true=None):
         # Выполняем заполнение
         if batch.shape[0] < self.batch_size:
@@ -0,0 +1,226 @@
+"""
+Микробенчмарк заполнения пропусков knn_model.
+
+Батчи строятся из файлов Simulator-а (PowerConsumption1.csv, energydata_complete.csv)
+нужного размера и числа колонок, пропуски выбрасываются по одному из шаблонов:
+    isolated - одиночные пропуски внутри батча (работает интерполяция по соседям),
+    runs     - длинные серии пропусков (работает KNN),
+    edge     - пропуски в начале и конце батча, где интерполяция неприменима.
+    bursts   - серийные пропуски генератора Simulator-а (restoringvalues.dropout,
+               вероятность пропуска после пропуска в --burst раз выше).
+
+Каждый путь заполнения замеряется отдельно, в отчёте - время на пропущенную ячейку
+и пиковая память (tracemalloc). Генерация детерминирована (--seed), результат можно
+сохранить в JSON (--output) и сравнить со следующим прогоном (--baseline).
+
+Запуск: python Business/model_benchmark.py --sizes 10,100,1000 --paths fill_matrix,test
+"""
+from model import knn_model
+from engine import batch_to_matrix, fill_matrix, FILL_MIDPOINT, FILL_KNN
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень проекта
+from restoringvalues.dropout import dropout_model
+from restoringvalues.dataset import load_dataset
+
+SIMULATOR_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Simulator")
+SOURCES = ["PowerConsumption1.csv", "energydata_complete.csv"]
+PATTERNS = ["isolated", "runs", "edge", "bursts"]
+PATHS = ["fill_matrix", "knn_impute", "standard", "test", "stream", "stream_tick", "imputation"]
+
+
+def load_source(name):
+    """Исходный файл: метки времени (datetime64) и значения"""
+    data = load_dataset(os.path.join(SIMULATOR_DIR, name))
+    return data.stamps.astype("datetime64[ns]"), data.values, data.names
+
+
+def make_truth(source, rows, columns):
+    """
+    Батч без пропусков из rows строк и columns колонок: строки и колонки файла
+    повторяются по кругу, время продолжается с шагом файла
+    """
+    times, values, names = source
+    step = np.median(np.diff(times[:1000]))
+    stamps = times[0] + step * np.arange(rows)
+    data = {"DateTime": pd.DatetimeIndex(stamps).strftime("%Y-%m-%d %H:%M:%S")}
+    for c in range(columns):
+        suffix = f" #{c // len(names) + 1}" if c >= len(names) else ""
+        data[names[c % len(names)] + suffix] = values[np.arange(rows) % len(values), c % len(names)]
+    return pd.DataFrame(data)
+
+
+def make_gaps(rng, shape, chance, pattern, run_length, burst=8.0):
+    """Маска пропусков (True - пропуск) по шаблону"""
+    rows, columns = shape
+    if pattern == "isolated":
+        mask = rng.random(shape) < chance
+        mask[1:] &= ~mask[:-1]  # соседние пропуски разбиваем
+        mask[[0, -1]] = False
+    elif pattern == "runs":
+        starts = rng.random(shape) < chance / run_length
+        mask = np.zeros(shape, dtype=bool)
+        for offset in range(run_length):
+            mask[offset:] |= starts[:rows - offset]
+    elif pattern == "edge":
+        edge = max(1, int(np.ceil(chance * rows / 2)))
+        mask = np.zeros(shape, dtype=bool)
+        mask[:edge] = mask[-edge:] = True
+    elif pattern == "bursts":
+        mask = dropout_model(columns, chance, burst, seed=int(rng.integers(2**32))).take(rows)
+    else:
+        raise ValueError(f"Неизвестный шаблон пропусков {pattern}")
+    # Хотя бы одно известное значение в колонке, иначе заполнять не из чего
+    mask[rows // 2] = False
+    return mask
+
+
+def with_gaps(truth, mask):
+    batch = truth.copy()
+    values = batch.iloc[:, 1:].to_numpy(dtype=np.float64)
+    values[mask] = np.nan
+    batch.iloc[:, 1:] = values
+    return batch
+
+
+def prepare_path(path, batch, truth, shifted):
+    """
+    Подготовка одного прогона пути заполнения (не замеряется):
+    возвращает функцию без аргументов, время которой и замеряется
+    """
+    if path == "fill_matrix":
+        times, values = batch_to_matrix(batch)
+        return lambda: fill_matrix(times, values)
+    if path == "knn_impute":
+        model = knn_model()
+        return lambda: [model.time_based_knn_impute(batch, column) for column in batch.columns[1:]]
+    if path == "standard":
+        model = knn_model()
+        return lambda: model.compare_fill_methods_and_calculate_mape_knn(batch)
+    if path == "test":
+        model = knn_model()
+        return lambda: model.compare_fill_methods_and_calculate_mape_knn(batch, truth)
+    if path == "stream":
+        # Первый тик потоковой модели: всё окно заполняется с нуля
+        model = knn_model(streaming=True, window=len(batch))
+        return lambda: model.compare_fill_methods_and_calculate_mape_knn(batch)
+    if path == "stream_tick":
+        # Установившийся тик: окно уже заполнено, пришла одна новая строка
+        model = knn_model(streaming=True, window=len(batch))
+        model.compare_fill_methods_and_calculate_mape_knn(batch)
+        return lambda: model.compare_fill_methods_and_calculate_mape_knn(shifted)
+    if path == "imputation":
+        model = knn_model()
+
+        def imputation():
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                model.imputation(batch, truth)
+        return imputation
+    raise ValueError(f"Неизвестный путь {path}")
+
+
+def measure(prepare, repeat):
+    """Лучшее время из repeat прогонов и пиковая память отдельного прогона"""
+    best = float("inf")
+    for _ in range(repeat):
+        fn = prepare()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+
+    fn = prepare()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def result_key(result):
+    return tuple(result[k] for k in ("source", "rows", "columns", "chance", "pattern", "path"))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Микробенчмарк заполнения пропусков knn_model")
+    p.add_argument("--sizes", default="10,100,1000,100000", help="Размеры батчей, строк.")
+    p.add_argument("--columns", default="3,6", help="Числа колонок (колонки файла повторяются по кругу).")
+    p.add_argument("--chances", default="0.0125,0.05,0.2", help="Доли пропусков.")
+    p.add_argument("--patterns", default=",".join(PATTERNS), help="Шаблоны пропусков.")
+    p.add_argument("--paths", default=",".join(PATHS), help="Пути заполнения.")
+    p.add_argument("--sources", default=",".join(SOURCES), help="Файлы Simulator-а.")
+    p.add_argument("--run-length", type=int, default=10, help="Длина серии пропусков для шаблона runs.")
+    p.add_argument("--burst", type=float, default=8.0, help="Мультипликатор chance_seq для шаблона bursts.")
+    p.add_argument("--repeat", type=int, default=3, help="Прогонов на замер (берётся лучший).")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--output", default=None, help="JSON с результатами.")
+    p.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения.")
+    args = p.parse_args()
+
+    sizes = [int(v) for v in args.sizes.split(",")]
+    columns_list = [int(v) for v in args.columns.split(",")]
+    chances = [float(v) for v in args.chances.split(",")]
+    patterns, paths = args.patterns.split(","), args.paths.split(",")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = {result_key(r): r for r in json.load(file)["results"]}
+
+    results = []
+    print(f"{'источник':<24}{'строк':>7}{'кол.':>5}{'доля':>8}{'шаблон':>10}{'путь':>13}"
+          f"{'пропусков':>11}{'мс':>10}{'мкс/проп.':>11}{'пик, МБ':>9}")
+    for source_name in args.sources.split(","):
+        source = load_source(source_name)
+        for rows in sizes:
+            for columns in columns_list:
+                truth_long = make_truth(source, rows + 1, columns)
+                truth = truth_long.iloc[:rows].reset_index(drop=True)
+                for chance in chances:
+                    for pattern in patterns:
+                        rng = np.random.default_rng(args.seed)
+                        mask = make_gaps(rng, (rows + 1, columns), chance, pattern, args.run_length, args.burst)
+                        batch_long = with_gaps(truth_long, mask)
+                        batch = batch_long.iloc[:rows].reset_index(drop=True)
+                        shifted = batch_long.iloc[1:].reset_index(drop=True)
+
+                        missing = int(batch.iloc[:, 1:].isna().to_numpy().sum())
+                        _, method = fill_matrix(*batch_to_matrix(batch))
+                        for path in paths:
+                            seconds, peak = measure(lambda: prepare_path(path, batch, truth, shifted), args.repeat)
+                            result = {
+                                "source": source_name, "rows": rows, "columns": columns, "chance": chance,
+                                "pattern": pattern, "path": path, "missing": missing,
+                                "midpoint": int((method == FILL_MIDPOINT).sum()),
+                                "knn": int((method == FILL_KNN).sum()),
+                                "seconds": seconds,
+                                "us_per_missing": seconds * 1e6 / missing if missing else None,
+                                "peak_bytes": peak,
+                            }
+                            results.append(result)
+
+                            per_cell = f"{result['us_per_missing']:.2f}" if missing else "-"
+                            line = (f"{source_name:<24}{rows:>7}{columns:>5}{chance:>8}{pattern:>10}{path:>13}"
+                                    f"{missing:>11}{seconds * 1000:>10.3f}{per_cell:>11}{peak / 2**20:>9.2f}")
+                            old = baseline.get(result_key(result))
+                            if old:
+                                line += f"  x{old['seconds'] / seconds:.2f} к базовому"
+                            print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"config": vars(args), "results": results}, file, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
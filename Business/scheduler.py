@@ -0,0 +1,102 @@
+from model import knn_model
+from data_source import data_source
+from feed import ring_client
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Задачи, живущие в текущем процессе: {task_id: (knn_model, data_source)}
+worker_tasks = {}
+
+
+def init_worker(specs, transport):
+    """
+    Создать задачи в процессе-исполнителе.
+    Модель (в том числе история mape_inter/mape_mean и окно потокового режима)
+    живёт в исполнителе между тиками.
+
+    :param specs: {task_id: (model_kwargs, source_args)}
+    :param transport: "ring" - исполнитель сам читает кольцевые буферы Reciever-а
+    """
+    feed = ring_client() if transport == "ring" else None
+    for task_id, (model_kwargs, source_args) in specs.items():
+        worker_tasks[task_id] = (knn_model(**model_kwargs), data_source(*source_args, feed=feed))
+
+
+def run_task(task_id, batches=None):
+    """
+    Один тик задачи: загрузка -> заполнение -> запись.
+    batches передаётся, если батчи загружены в главном процессе (прямая раздача).
+    """
+    model, source = worker_tasks[task_id]
+    batch, batch_true = source.load_batches() if batches is None else batches
+    batch_filled, metrics = model.imputation(batch, batch_true)
+    source.write_out(batch_filled, metrics, batch)
+    return metrics
+
+
+class task_scheduler:
+    """
+    Раздаёт задачи (установка + режим) по процессам-исполнителям.
+
+    Каждая задача закреплена за одним исполнителем, поэтому её состояние
+    не переезжает между процессами; задачи одного тика выполняются
+    параллельно, а цикл событий (и HTTP-API) в это время свободен.
+    При workers=0 задачи выполняются по очереди в текущем процессе, как раньше.
+    """
+
+    def __init__(self, specs, workers=0, transport="csv", loaders=None):
+        """
+        :param specs: список (model_kwargs, source_args) - аргументы knn_model и data_source
+        :param workers: число процессов-исполнителей (0 - без процессов)
+        :param transport: источник батчей в исполнителях ("csv" или "ring")
+        :param loaders: загрузчики батчей главного процесса (feed_loader), если батчи грузятся здесь (прямая раздача)
+        """
+        self.specs = dict(enumerate(specs))
+        self.transport = transport
+        self.loaders = loaders
+        self.workers = min(workers, len(self.specs))
+
+        # task_id -> номер исполнителя, задачи раскладываются по кругу
+        self.shards = {task_id: task_id % max(self.workers, 1) for task_id in self.specs}
+        self.executors = [self.start_worker(worker) for worker in range(self.workers)]
+        if not self.workers:
+            init_worker(self.specs, transport)
+
+    def start_worker(self, worker):
+        specs = {task_id: spec for task_id, spec in self.specs.items() if self.shards[task_id] == worker}
+        return ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=(specs, self.transport))
+
+    def batches(self, task_id):
+        if self.loaders is None:
+            return None
+        return self.loaders[task_id].load_batches()
+
+    async def tick(self):
+        """Выполнить все задачи один раз и дождаться результатов"""
+        if not self.workers:
+            return [run_task(task_id, self.batches(task_id)) for task_id in self.specs]
+
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(self.executors[self.shards[task_id]], run_task, task_id, self.batches(task_id))
+            for task_id in self.specs
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        broken = set()
+        for task_id, result in zip(self.specs, results):
+            if isinstance(result, BrokenProcessPool):
+                broken.add(self.shards[task_id])
+            elif isinstance(result, Exception):
+                print(f"Ошибка в задаче {task_id}: {result!r}")
+
+        for worker in broken:
+            print(f"Исполнитель {worker} упал, перезапускаем (состояние его задач потеряно)")
+            self.executors[worker] = self.start_worker(worker)
+        return results
+
+    def shutdown(self):
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,24 +1,32 @@
 import os
+import sys
 import requests
-import pandas as pd
 
 import dash
 from dash import dcc, html, dash_table, Input, Output, State
+from flask import Response, request
 import dash_bootstrap_components as dbc
 import aiohttp
 import asyncio
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень проекта
+from restoringvalues.ring_store import ring_reader, ring_path
+from restoringvalues.registry import load_installations
+from restoringvalues.gui_data import shared_cache, series_cache, series_key, batch_table, table_page, SAME, EXTEND
+from restoringvalues.downsample import thin, imputed_mask, budget
+from restoringvalues.rollup import rollup_set, LABELS
+from restoringvalues.gui_push import change_feed, file_version
+from restoringvalues.sink import history_path, history_version, history_columns, read_history
+
 # ----------------------
 #  Константы и настройки
 # ----------------------
 
 BUSINESS_HTTP_BASE = "http://127.0.0.1:8000"
 
-# «Концептуальные» установки с портами (raw, filled/test)
-INSTALLATIONS = {
-    "Установка 1": (8092, 8093),
-    "Установка 2": (8094, 8095),
-}
+# «Концептуальные» установки с портами (raw, filled/test) из реестра установок;
+# у установки без тестового порта результаты Business пишутся под главным портом
+INSTALLATIONS = {inst.name: (inst.port_main, inst.port_test or inst.port_main) for inst in load_installations()}
 
 # ----------------------
 #  Инициализация Dash
@@ -29,6 +37,114 @@ server = app.server
 
 RECIEVER_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Reciever")
 BUSINESS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Business")
+
+# ----------------------
+#  Вспомогательная функция: история порта из бинарного буфера Reciever-а
+# ----------------------
+
+HISTORY_ROWS = int(os.getenv("GUI_HISTORY_ROWS", 1000))  # сколько последних строк истории показывать
+ring_readers = {}  # Формат: {port: ring_reader}
+cache = shared_cache  # Разобранные файлы и история, общие для всех сессий (GUI_CACHE_MB)
+series = series_cache()  # Последние ряды графиков для дельта-обновлений
+
+def port_reader(port: int):
+    """Читатель кольцевого буфера порта (переоткрывается, если Reciever пересоздал файл) или None"""
+    reader = ring_readers.get(port)
+    if reader is None or reader.changed():
+        try:
+            reader = ring_readers[port] = ring_reader(ring_path(RECIEVER_DIR, port))
+        except (OSError, ValueError):
+            ring_readers.pop(port, None)
+            reader = None
+    return reader
+
+def load_port_long(port: int):
+    """
+    История порта: последние HISTORY_ROWS строк из Reciever/ring_port_<port>.bin
+    (без разбора текста), а если буфера нет — из data_port_<port>_long.csv.
+    Если нет ни того, ни другого — None.
+    """
+    reader = port_reader(port)
+    if reader is not None:
+        # Пока в буфер ничего не дописано, история та же
+        return cache.get(("ring", port), (reader.inode, reader.cursor), lambda: reader.frame(HISTORY_ROWS))
+
+    path = os.path.join(RECIEVER_DIR, f"data_port_{port}_long.csv")
+    return cache.read(path)[0]
+
+
+def load_filled_long(path: str, feature):
+    """
+    Последние HISTORY_ROWS строк заполненной истории Business (CSV или Parquet — что пишет
+    Business, restoringvalues.sink): только DateTime и колонка признака, а если её нет —
+    первая колонка. Если истории нет — None.
+    """
+    history = history_path(path)
+    version = history_version(history)
+    if version is None:
+        return None
+    names = cache.get(("history-columns", history), version, lambda: history_columns(history))
+    column = feature if feature in names else next((c for c in names if c != "DateTime"), None)
+    columns = ["DateTime"] + ([column] if column else [])
+    return cache.get(("history", history, column), version, lambda: read_history(history, columns, tail=HISTORY_ROWS))
+
+
+rollups = {}  # Формат: {имя выхода Business: rollup_set}
+
+def load_rollup(name: str, feature, start_date, end_date, width):
+    """
+    Агрегаты Business (Business/rollup_<name>_<разрешение>.bin) признака за выбранный
+    диапазон дат: (разрешение, DataFrame корзин). Если диапазон не задан целиком
+    или агрегатов нет — None (графики строятся по строкам CSV).
+    """
+    if not (feature and start_date and end_date):
+        return None
+    store = rollups.get(name)
+    if store is None:
+        store = rollups[name] = rollup_set(BUSINESS_DIR, name)
+    return store.query(feature, start_date, end_date, budget(width))
+
+# ----------------------
+#  Push-уведомления: поток SSE /updates будит вкладку, когда данные установки изменились
+# ----------------------
+
+POLL_MS = int(os.getenv("GUI_POLL_MS", 30000))  # запасной опрос, если поток обновлений недоступен (0 - выключен)
+
+# События изменений приходят от прямой раздачи Reciever-а (включена вместе с BUSINESS_TRANSPORT=feed
+# или ненулевым RECIEVER_FEED_PORT); без неё источники опрашиваются раз в GUI_PUSH_MS
+FEED_HOST = os.getenv("RECIEVER_FEED_HOST", "127.0.0.1")
+FEED_PORT = int(os.getenv("RECIEVER_FEED_PORT", 8096 if os.getenv("BUSINESS_TRANSPORT") == "feed" else 0))
+
+def installation_version(inst):
+    """Версия всех источников установки: буфер Reciever-а и файлы Reciever-а и Business"""
+    raw_port, filled_port = INSTALLATIONS[inst]
+    reader = port_reader(raw_port)
+    return (
+        (reader.inode, reader.cursor) if reader is not None else None,
+        [file_version(os.path.join(RECIEVER_DIR, name)) for name in (
+            f"data_port_{raw_port}.csv", f"data_port_{raw_port}_long.csv")],
+        history_version(history_path(os.path.join(BUSINESS_DIR, f"data_out_{raw_port}_long.csv"))),
+        file_version(os.path.join(BUSINESS_DIR, f"data_out_{filled_port}.csv")),
+    )
+
+
+def installation_events(inst):
+    """События прямой раздачи, после которых данные установки на экране устаревают"""
+    raw_port, filled_port = INSTALLATIONS[inst]
+    return {(raw_port, "rows"), (raw_port, "filled"), (filled_port, "filled")}
+
+
+feed = change_feed(installation_version, installation_events, f"ws://{FEED_HOST}:{FEED_PORT}" if FEED_PORT else None)
+
+@server.route("/updates")
+def updates():
+    """GET /updates?installation=<имя> — поток SSE: событие на каждое изменение данных установки"""
+    inst = request.args.get("installation")
+    if inst not in INSTALLATIONS:
+        return Response("Неизвестная установка", status=404)
+    return Response(feed.stream(inst), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # ----------------------
 #  Вспомогательная функция: список признаков из «длинного» CSV
 # ----------------------
@@ -40,14 +156,14 @@ def get_feature_options(raw_port: int):
     Если файла нет или не удалось — [].
     """
     path = os.path.join(RECIEVER_DIR, f"data_port_{raw_port}_long.csv")
-    if os.path.exists(path):
-        try:
-            df = pd.read_csv(path, nrows=0)
-            cols = [c for c in df.columns if c != "DateTime"]
-            return [{"label": c, "value": c} for c in cols]
-        except:
-            return []
-    return []
+    try:
+        df, _ = cache.read(path, nrows=0)
+    except:
+        return []
+    if df is None:
+        return []
+    cols = [c for c in df.columns if c != "DateTime"]
+    return [{"label": c, "value": c} for c in cols]
 
 # ----------------------
 #  Layout
@@ -67,7 +183,7 @@ app.layout = html.Div([
                 dcc.Dropdown(
                     id="dropdown-installation",
                     options=[{"label": k, "value": k} for k in INSTALLATIONS.keys()],
-                    value="Установка 1",
+                    value=next(iter(INSTALLATIONS)),
                     clearable=False,
                     style={"backgroundColor": "white", "color": "black"},
                     className="mb-4"
@@ -173,30 +289,97 @@ app.layout = html.Div([
                     {"name": "DateTime", "id": "DateTime"},
                     {"name": "Input", "id": "input"},
                     {"name": "Value", "id": "value"},
+                    {"name": "Imputed", "id": "imputed"},
                 ],
                 data=[],
+                # Страницы и сортировку считает сервер: клиенту уходит только текущая страница
+                page_action="custom",
+                page_current=0,
                 page_size=10,
+                sort_action="custom",
+                sort_mode="single",
+                sort_by=[],
                 style_header={"backgroundColor": "#1A2138", "color": "white"},
                 style_cell={"backgroundColor": "#202946", "color": "white", "textAlign": "left"},
+                style_data_conditional=[{
+                    "if": {"filter_query": '{imputed} = "yes"', "column_id": "value"},
+                    "backgroundColor": "#5A3A1E",
+                }],
                 style_table={"overflowX": "auto"},
             ),
 
             html.Hr(style={"borderColor": "#444", "marginTop": "1rem"}),
 
             # —————————————————————————————————————————
-            # Интервал опроса (каждые 2000 мс)
+            # Обновления приходят по потоку /updates (push-update);
+            # интервал - запасной опрос на случай, если поток недоступен
             # —————————————————————————————————————————
             dcc.Interval(
                 id="interval-update",
-                interval=2000,
+                interval=max(POLL_MS, 1000),
+                disabled=POLL_MS <= 0,
                 n_intervals=0
             ),
         ], width=9, style={"padding": "1rem"}),
-
+    # Версии рядов графиков и таблицы, уже показанные этим клиентом
+    dcc.Store(id="graph-state", data={}),
+    # Версия таблицы обработки батча (файлы, признак, страница), уже показанная клиентом
+    dcc.Store(id="table-state", data=None),
+    # Ширина графиков в пикселях (сообщает браузер) - по ней прореживаются ряды
+    dcc.Store(id="graph-width", data=None),
+    # Номер последнего изменения данных установки из потока /updates и установка, на которую подписан поток
+    dcc.Store(id="push-update", data=None),
+    dcc.Store(id="push-source", data=None),
     ])
 ])
 
 
+# ----------------------
+#  Callback (в браузере): ширина графика для прореживания рядов
+# ----------------------
+
+app.clientside_callback(
+    """
+    function(push, n_intervals) {
+        const graph = document.getElementById("line-chart-raw");
+        return graph ? graph.clientWidth : null;
+    }
+    """,
+    Output("graph-width", "data"),
+    Input("push-update", "data"),
+    Input("interval-update", "n_intervals"),
+)
+
+
+# ----------------------
+#  Callback (в браузере): подписка на поток обновлений выбранной установки
+# ----------------------
+#  Каждое событие /updates записывается в push-update и запускает callback-и ниже;
+#  без изменений данных вкладка не делает запросов. EventSource сам переподключается.
+
+app.clientside_callback(
+    """
+    function(installation) {
+        if (window.pushSource) {
+            window.pushSource.close();
+            window.pushSource = null;
+        }
+        if (!installation || !window.EventSource) {
+            return null;
+        }
+        const source = new EventSource("updates?installation=" + encodeURIComponent(installation));
+        source.onmessage = function(event) {
+            window.dash_clientside.set_props("push-update", {data: installation + ":" + event.data});
+        };
+        window.pushSource = source;
+        return installation;
+    }
+    """,
+    Output("push-source", "data"),
+    Input("dropdown-installation", "value"),
+)
+
+
 # ----------------------
 #  Callback 1: Обновляем список признаков (dropdown-feature)
 # ----------------------
@@ -205,10 +388,11 @@ app.layout = html.Div([
     Output("dropdown-feature", "options"),
     Output("dropdown-feature", "value"),
     Input("dropdown-installation", "value"),
+    Input("push-update", "data"),
     Input("interval-update", "n_intervals"),
     State("dropdown-feature", "value"),
 )
-def update_feature_options(inst, n_intervals, current_feature):
+def update_feature_options(inst, push, n_intervals, current_feature):
     raw_port, _ = INSTALLATIONS[inst]
     opts = get_feature_options(raw_port)
     values = [opt["value"] for opt in opts]
@@ -252,274 +436,254 @@ def apply_interval_all_ports(n_clicks, new_interval):
 
 
 # ----------------------
-#  Callback 3: Строим два графика, метрику, таблицу «out» и таблицу «metrics»
+#  Callback 3: Строим два графика и инфо о записях
 # ----------------------
+#  Графики обновляются дельтами: в graph-state клиент хранит версии нарисованных рядов,
+#  и если с тех пор в ряд только дописаны точки, уходят лишь они (extendData).
+
+def line_figure(title, x, y, name, color):
+    """Фигура с одним рядом в оформлении панели"""
+    return {
+        "data": [{
+            "x": x,
+            "y": y,
+            "type": "line",
+            "name": name,
+            "line": {"color": color}
+        }],
+        "layout": {
+            "title": {"text": title, "font": {"color": "white"}},
+            "paper_bgcolor": "#1A2138",
+            "plot_bgcolor": "#202946",
+            "font": {"color": "white"},
+            "xaxis": {"color": "white", "gridcolor": "#444"},
+            "yaxis": {"color": "white", "gridcolor": "#444"},
+            "margin": {"l": 50, "r": 20, "t": 40, "b": 30}
+        }
+    }
+
+
+def empty_figure(title):
+    """Пустая фигура с надписью"""
+    figure = line_figure(title, [], [], "", "#FFFFFF")
+    figure["data"] = []
+    return figure
+
+
+def graph_output(client_state, graph_state, name, key, x, y, make_figure):
+    """
+    Обновление графика name для клиента: (figure, extendData), ненужное - dash.no_update.
+    client_state - версии, которые клиент показывает сейчас, в graph_state записывается
+    версия, которую он будет показывать после ответа.
+    """
+    client = client_state.get(name) or {}
+    client_token = client.get("token") if client.get("key") == key else None
+    mode, x_send, y_send, token = series.delta(key, x, y, client_token)
+    graph_state[name] = {"key": key, "token": token}
+    if mode == SAME:
+        return dash.no_update, dash.no_update
+    if mode == EXTEND:
+        return dash.no_update, [{"x": [x_send], "y": [y_send]}, [0], len(x)]
+    return make_figure(x_send, y_send), dash.no_update
+
+
+def filter_dates(df, start_date, end_date):
+    if start_date:
+        df = df[df["DateTime"] >= start_date]
+    if end_date:
+        df = df[df["DateTime"] <= end_date]
+    return df
 
-df_out = None
-df_input = None
 
 @app.callback(
     Output("line-chart-raw", "figure"),
+    Output("line-chart-raw", "extendData"),
     Output("line-out-long", "figure"),
+    Output("line-out-long", "extendData"),
     Output("data-info", "children"),
     Output("status-message", "children"),
-    Output("out-table", "data"),
+    Output("graph-state", "data"),
+    Input("push-update", "data"),
     Input("interval-update", "n_intervals"),
-    State("dropdown-installation", "value"),
-    State("dropdown-feature", "value"),
-    State("date-picker", "start_date"),
-    State("date-picker", "end_date"),
+    Input("dropdown-installation", "value"),
+    Input("dropdown-feature", "value"),
+    Input("date-picker", "start_date"),
+    Input("date-picker", "end_date"),
+    State("graph-state", "data"),
+    State("graph-width", "data"),
 )
 
-def update_visualization(n_intervals, inst, feature, start_date, end_date):
+def update_visualization(push, n_intervals, inst, feature, start_date, end_date, graph_state, width):
     raw_port, filled_port = INSTALLATIONS[inst]
+    client_state, graph_state = graph_state or {}, {}
 
-    raw_path = os.path.join(RECIEVER_DIR, f"data_port_{raw_port}_long.csv")
-    input_path = os.path.join(RECIEVER_DIR, f"data_port_{raw_port}.csv")
-    out_path_long = os.path.join(BUSINESS_DIR, f"data_out_{raw_port}_long.csv")
-
-    out_path = os.path.join(BUSINESS_DIR, f"data_out_{filled_port}.csv")
+    def nothing(status):
+        # Графики очищены - при следующих данных клиенту нужны фигуры целиком
+        return {}, dash.no_update, {}, dash.no_update, "", status, {}
 
-    # Путь к metrics-файлу (в папке Business)
-    metrics_path = os.path.join(BUSINESS_DIR, f"data_metrics_{filled_port}.csv")
-
-    # 1) Если нет «длинного» raw – рисуем «пусто»
-    if not os.path.exists(raw_path):
-        return {}, {}, "", "", [],
+    out_path_long = os.path.join(BUSINESS_DIR, f"data_out_{raw_port}_long.csv")
 
-    # 2) Читаем raw_long
+    # 1-2) Читаем raw_long (если его нет – рисуем «пусто»)
     try:
-        df_long = pd.read_csv(raw_path)
+        df_long = load_port_long(raw_port)
     except:
-        return {}, {}, "", "Ошибка при чтении CSV", [],
-
+        return nothing("Ошибка при чтении CSV")
+    if df_long is None:
+        return nothing("")
 
     # Если все DateTime пусты → «Потеря соединения»
     if df_long["DateTime"].isnull().all():
-        return {}, {}, "", "Потеря соединения с установкой", [],
+        return nothing("Потеря соединения с установкой")
 
     # 3) Фильтруем по дате для сырых
-    dff_raw = df_long.copy()
-    if start_date:
-        dff_raw = dff_raw[dff_raw["DateTime"] >= start_date]
-    if end_date:
-        dff_raw = dff_raw[dff_raw["DateTime"] <= end_date]
-
-    # 4) Если feature не в колонках или dff_raw.empty → «Нет данных»
-    if not feature or feature not in dff_raw.columns or dff_raw.empty:
-        return {}, {}, "", "Нет данных для выбранного признака/диапазона", [],
-
-    # 5) Строим график 1: «сырые» данные
-    fig_raw = {
-        "data": [{
-            "x": dff_raw["DateTime"],
-            "y": dff_raw[feature],
-            "type": "line",
-            "name": f"raw: {feature}",
-            "line": {"color": "#FFD700"}
-        }],
-        "layout": {
-            "title": {"text": f"{inst} – сырые '{feature}'", "font": {"color": "white"}},
-            "paper_bgcolor": "#1A2138",
-            "plot_bgcolor": "#202946",
-            "font": {"color": "white"},
-            "xaxis": {"color": "white", "gridcolor": "#444"},
-            "yaxis": {"color": "white", "gridcolor": "#444"},
-            "margin": {"l": 50, "r": 20, "t": 40, "b": 30}
-        }
-    }
-
-    # 6) Поток «заполненные» данные (filled_long) не меняется – он нужен для графика 2
-    fig_out_long = {
-        "data": [],
-        "layout": {
-            "title": {"text": "Нет заполненных данных", "font": {"color": "white"}},
-            "paper_bgcolor": "#1A2138",
-            "plot_bgcolor": "#202946",
-            "font": {"color": "white"},
-            "xaxis": {"color": "white", "gridcolor": "#444"},
-            "yaxis": {"color": "white", "gridcolor": "#444"},
-            "margin": {"l": 50, "r": 20, "t": 40, "b": 30}
-        }
-    }
+    dff_raw = filter_dates(df_long, start_date, end_date)
 
+    # 4) Если feature не в колонках или нет ни строк, ни агрегатов за диапазон → «Нет данных»
+    #    (диапазон старше истории Reciever-а показывается только по агрегатам Business)
+    try:
+        rollup = load_rollup(f"data_out_{raw_port}", feature, start_date, end_date, width)
+    except:
+        rollup = None
+    if not feature or feature not in dff_raw.columns or dff_raw.empty and (rollup is None or rollup[1].empty):
+        return nothing("Нет данных для выбранного признака/диапазона")
+
+    # 5) График 1: «сырые» данные
+    fig_raw, extend_raw = empty_figure("Нет сырых данных за диапазон"), dash.no_update
+    if not dff_raw.empty:
+        fig_raw, extend_raw = graph_output(
+            client_state, graph_state, "raw", series_key(raw_port, feature, start_date, end_date),
+            *thin(dff_raw["DateTime"], dff_raw[feature], width),
+            lambda x, y: line_figure(f"{inst} – сырые '{feature}'", x, y, f"raw: {feature}", "#FFD700"))
+
+    # 6) График 2: «заполненные» данные (filled_long)
+    fig_out_long, extend_out_long = empty_figure("Нет заполненных данных"), dash.no_update
     data_info = ""
-    out_table_data = []
-
-    if os.path.exists(out_path_long):
-        try:
-            df_out_long = pd.read_csv(out_path_long)
-            dff_out_long = df_out_long.copy()
-            if start_date:
-                dff_out_long = dff_out_long[dff_out_long["DateTime"] >= start_date]
-            if end_date:
-                dff_out_long = dff_out_long[dff_out_long["DateTime"] <= end_date]
-
-            # Определяем y_filled
-            if feature in dff_out_long.columns:
-                used_col = feature
-                y_filled = dff_out_long[feature]
-            else:
-                candidates = [c for c in dff_out_long.columns if c != "DateTime"]
-                if candidates:
-                    used_col = candidates[0]
-                    y_filled = dff_out_long[used_col]
-                else:
-                    used_col = None
-                    y_filled = []
-
-            # График 2: «заполненные» данные
-            if not dff_out_long.empty and used_col:
-                fig_out_long = {
-                    "data": [{
-                        "x": dff_out_long["DateTime"],
-                        "y": y_filled,
-                        "type": "line",
-                        "name": f"filled: {used_col}",
-                        "line": {"color": "#FF901E"}
-                    }],
-                    "layout": {
-                        "title": {"text": f"{inst} – заполненные '{used_col}'", "font": {"color": "white"}},
-                        "paper_bgcolor": "#1A2138",
-                        "plot_bgcolor": "#202946",
-                        "font": {"color": "white"},
-                        "xaxis": {"color": "white", "gridcolor": "#444"},
-                        "yaxis": {"color": "white", "gridcolor": "#444"},
-                        "margin": {"l": 50, "r": 20, "t": 40, "b": 30}
-                    }
-                }
-
-                # Информация о записях (filled_long)
-                count = len(dff_out_long)
-                min_date = dff_out_long["DateTime"].min()
-                max_date = dff_out_long["DateTime"].max()
+    try:
+        if rollup is not None:
+            # Выбран диапазон дат: заполненные данные - средние по корзинам агрегатов
+            resolution, agg = rollup
+            if not agg.empty:
+                fig_out_long, extend_out_long = graph_output(
+                    client_state, graph_state, "out_long", series_key(f"data_out_{raw_port}", resolution, feature, start_date, end_date),
+                    agg["DateTime"], agg["mean"],
+                    lambda x, y: line_figure(f"{inst} – заполненные '{feature}' (среднее, корзина: {LABELS[resolution]})", x, y,
+                                             f"filled: {feature}", "#FF901E"))
                 data_info = (
-                    f"Количество записей: {count}. "
-                    f"Первая дата: {min_date}. "
-                    f"Последняя дата: {max_date}."
+                    f"Корзин ({LABELS[resolution]}): {len(agg)}, значений: {agg['count'].sum()}, "
+                    f"из них заполнено: {agg['imputed'].sum()}. "
+                    f"Первая дата: {agg['DateTime'].min()}. "
+                    f"Последняя дата: {agg['DateTime'].max()}."
                 )
             else:
                 data_info = "Нет обработанных данных"
-        except:
-            fig_out_long = {
-                "data": [],
-                "layout": {
-                    "title": {"text": "Нет заполненных данных", "font": {"color": "white"}},
-                    "paper_bgcolor": "#1A2138",
-                    "plot_bgcolor": "#202946",
-                    "font": {"color": "white"},
-                    "xaxis": {"color": "white", "gridcolor": "#444"},
-                    "yaxis": {"color": "white", "gridcolor": "#444"},
-                    "margin": {"l": 50, "r": 20, "t": 40, "b": 30}
-                }
-            }
-            data_info = ""
-    else:
-        fig_out_long = {
-            "data": [],
-            "layout": {
-                "title": {"text": "Нет заполненных данных", "font": {"color": "white"}},
-                "paper_bgcolor": "#1A2138",
-                "plot_bgcolor": "#202946",
-                "font": {"color": "white"},
-                "xaxis": {"color": "white", "gridcolor": "#444"},
-                "yaxis": {"color": "white", "gridcolor": "#444"},
-                "margin": {"l": 50, "r": 20, "t": 40, "b": 30}
-            }
-        }
+        else:
+            df_out_long = load_filled_long(out_path_long, feature)
+            if df_out_long is not None:
+                dff_out_long = filter_dates(df_out_long, start_date, end_date)
+
+                # Определяем используемую колонку
+                if feature in dff_out_long.columns:
+                    used_col = feature
+                else:
+                    candidates = [c for c in dff_out_long.columns if c != "DateTime"]
+                    used_col = candidates[0] if candidates else None
+
+                if not dff_out_long.empty and used_col:
+                    # Заполненные точки (пропуски в сырых данных) при прореживании сохраняются
+                    imputed = None
+                    if used_col in df_long.columns:
+                        imputed = imputed_mask(dff_out_long["DateTime"], df_long["DateTime"], df_long[used_col])
+                    fig_out_long, extend_out_long = graph_output(
+                        client_state, graph_state, "out_long", series_key(out_path_long, used_col, start_date, end_date),
+                        *thin(dff_out_long["DateTime"], dff_out_long[used_col], width, imputed),
+                        lambda x, y: line_figure(f"{inst} – заполненные '{used_col}'", x, y, f"filled: {used_col}", "#FF901E"))
+
+                    # Информация о записях (filled_long)
+                    count = len(dff_out_long)
+                    min_date = dff_out_long["DateTime"].min()
+                    max_date = dff_out_long["DateTime"].max()
+                    data_info = (
+                        f"Количество записей: {count}. "
+                        f"Первая дата: {min_date}. "
+                        f"Последняя дата: {max_date}."
+                    )
+                else:
+                    data_info = "Нет обработанных данных"
+    except:
+        fig_out_long, extend_out_long = empty_figure("Нет заполненных данных"), dash.no_update
         data_info = ""
 
-    # 7) Таблица out: читаем из Business/data_out_<filled_port>.csv
-    if os.path.exists(out_path):
-        try:
-            global df_out, df_input
-
-            if (os.path.getmtime(out_path) >= os.path.getmtime(input_path)) or (df_out is None) or (df_input is None):
-                df_out = pd.read_csv(out_path)
-                df_input = pd.read_csv(input_path)
-
-            # Фильтруем по дате, если нужно
-            dff_out = df_out.copy()
-            dff_input = df_input.copy()
-
-            if start_date:
-                dff_out = dff_out[dff_out["DateTime"] >= start_date]
-                dff_input = dff_input[dff_input["DateTime"] >= start_date]
-            if end_date:
-                dff_out = dff_out[dff_out["DateTime"] <= end_date]
-                dff_input = dff_input[dff_input["DateTime"] <= end_date]
-
-            # Заполняем out_table_data только двумя колонками: DateTime и значение признака
-            out_table_data = []
-            if feature in dff_out.columns:
-                for index, row in dff_out.iterrows():
-                    out_table_data.append({
-                        "DateTime": row["DateTime"],
-                        "input": dff_input.iloc[index][feature],
-                        "value": row[feature]
-                    })
-            else:
-                # Если вдруг в out CSV нет выбранного признака,
-                # то возьмём первый столбец после DateTime
-                cols_out = [c for c in dff_out.columns if c != "DateTime"]
-                if cols_out:
-                    col0 = cols_out[0]
-                    for index, row in dff_out.iterrows():
-                        out_table_data.append({
-                            "DateTime": row["DateTime"],
-                            "input": dff_input.iloc[index][col0],
-                            "value": row[col0]
-                        })
-        except:
-            out_table_data = []
-    else:
-        out_table_data = []
-
-    # 8) Читаем всю историю метрик из Business/data_metrics_<filled_port>.csv
-    metrics_file_columns = []
-    metrics_file_data = []
-    if os.path.exists(metrics_path):
-        try:
-            df_metrics = pd.read_csv(metrics_path)
-            metrics_file_columns = [{"name": col, "id": col} for col in df_metrics.columns]
-            metrics_file_data = df_metrics.to_dict("records")
-        except:
-            metrics_file_columns = []
-            metrics_file_data = []
-    else:
-        metrics_file_columns = []
-        metrics_file_data = []
-
-    # 9) Текущая метрика: последняя строка из Business/data_metrics_<filled_port>.csv
-    metrics_info = ""
-    if os.path.exists(metrics_path):
-        try:
-            dfm_full = pd.read_csv(metrics_path)
-            if not dfm_full.empty:
-                last = dfm_full.iloc[-1]
-                parts = []
-                for col in dfm_full.columns:
-                    parts.append(f"{col} = {last[col]}")
-                metrics_info = ", ".join(parts)
-        except:
-            metrics_info = ""
-
-    # 10) Статус (оставляем пустым, если всё успешно)
+    # 7) Статус (оставляем пустым, если всё успешно)
     status = ""
 
     return (
         fig_raw,
+        extend_raw,
         fig_out_long,
+        extend_out_long,
         data_info,
         status,
-        out_table_data,
+        graph_state,
     )
 
 
+# ----------------------
+#  Callback 4: Таблица обработки батча — страницы и сортировка на сервере
+# ----------------------
+#  Таблица собирается одним соединением Business/data_out_<port>.csv и Reciever/data_port_<port>.csv
+#  по DateTime (в общем кэше, заново - только при изменении файлов), клиенту уходит одна страница.
+
+@app.callback(
+    Output("out-table", "data"),
+    Output("out-table", "page_count"),
+    Output("table-state", "data"),
+    Input("push-update", "data"),
+    Input("interval-update", "n_intervals"),
+    Input("out-table", "page_current"),
+    Input("out-table", "page_size"),
+    Input("out-table", "sort_by"),
+    Input("dropdown-installation", "value"),
+    Input("dropdown-feature", "value"),
+    Input("date-picker", "start_date"),
+    Input("date-picker", "end_date"),
+    State("table-state", "data"),
+)
+def update_table(push, n_intervals, page_current, page_size, sort_by, inst, feature, start_date, end_date, table_state):
+    if not inst:
+        return [], 1, None
+    raw_port, filled_port = INSTALLATIONS[inst]
+    input_path = os.path.join(RECIEVER_DIR, f"data_port_{raw_port}.csv")
+    out_path = os.path.join(BUSINESS_DIR, f"data_out_{filled_port}.csv")
+
+    try:
+        df_out, out_version = cache.read(out_path)
+        df_input, input_version = cache.read(input_path)
+        if df_out is None or df_input is None:
+            return [], 1, None
+
+        # Признак; если его нет в out CSV — первый столбец после DateTime
+        column = feature if feature in df_out.columns else next((c for c in df_out.columns if c != "DateTime"), None)
+        if column is None:
+            return [], 1, None
+
+        # Клиент уже показывает эту страницу этих версий файлов
+        table_key = series_key(out_version, input_version, column, start_date, end_date, page_current, page_size, sort_by)
+        if table_state == table_key:
+            return dash.no_update, dash.no_update, dash.no_update
+
+        table = cache.get(
+            ("table", out_path, input_path, column, start_date, end_date), (out_version, input_version),
+            lambda: batch_table(filter_dates(df_out, start_date, end_date), filter_dates(df_input, start_date, end_date), column))
+        records, page_count = table_page(table, page_current, page_size, sort_by)
+        return records, page_count, table_key
+    except:
+        return [], 1, None
+
+
 # ----------------------
 #  Запуск приложения
 # ----------------------
 
 if __name__ == "__main__":
-    print("Запуск Dash-GUI (Polling-CSV)")
+    print("Запуск Dash-GUI (push-обновления по /updates)")
     app.run(debug=True, host="0.0.0.0", port=8051)
@@ -4,55 +4,226 @@ import json
 import os
 import socket
 import csv
+import signal
+import struct
+import sys
 from collections import deque
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень проекта
+from restoringvalues.ring_store import ring_writer, ring_path, parse_timestamp
+from restoringvalues.registry import load_installations, installation_ports
+from restoringvalues import wire
+
 # Словарь для хранения данных для каждого порта
 port_data = {}  # Формат: {port: {'buffer': deque(maxlen=300), 'names': list, 'columns_count': int}}
 port_data_long = {}  # Формат: {port: {'buffer': deque(maxlen=300), 'names': list, 'columns_count': int}}
 
+# Мультиплексный режим Simulator-а: все порты приходят через одно подключение,
+# номер порта передаётся полем channel (0 - подключаться к каждому порту отдельно)
+mux_port = int(os.getenv("WEBSOCKET_MUX_PORT", 0))
+
+# Формат пакетов от Simulator-а: binary - предложить серверу бинарные кадры, json - как раньше
+subprotocols = [wire.SUBPROTOCOL] if os.getenv("WEBSOCKET_WIRE", "binary") == "binary" else None
+
+# Прямая раздача данных подписчикам (Business, GUI) без записи на диск. Необязательна:
+# 0 - выключена; по умолчанию включается на 8096, только если Business запускается
+# с BUSINESS_TRANSPORT=feed (runner и бенчмарк передают всем модулям одно окружение).
+# На тот же номер порта по UDP Business присылает {"port": порт} после записи
+# результатов, а Reciever пересылает это событие подписчикам порта
+feed_host = os.getenv("RECIEVER_FEED_HOST", "127.0.0.1")
+feed_port = int(os.getenv("RECIEVER_FEED_PORT", 8096 if os.getenv("BUSINESS_TRANSPORT") == "feed" else 0))
+feed_queue_size = 1000  # сколько сообщений держим для медленного подписчика
+feed_clients = {}  # Формат: {websocket: {'ports': set, 'rows': bool, 'queue': asyncio.Queue}}
+
+# Политика сброса буферов на диск: каждые flush_every пакетов порта,
+# раз в flush_period_ms миллисекунд и при завершении работы (0 - политика выключена)
+flush_every = int(os.getenv("RECIEVER_FLUSH_EVERY", 10))
+flush_period_ms = int(os.getenv("RECIEVER_FLUSH_MS", 1000))
+flush_state = {}  # Формат: {port: {'packets': int, 'pending': list, 'long_rows': int, 'lock': asyncio.Lock}}
+
+# Бинарная история порта (ring_port_<port>.bin), которую Business и GUI читают без разбора CSV
+ring_rows = int(os.getenv("RECIEVER_RING_ROWS", 100000))  # 0 - не вести
+port_rings = {}  # Формат: {port: ring_writer}
 
-async def write_csv(port, buffer, filename):
-    """Записывает весь буфер в CSV файл"""
+
+def write_csv(names, rows, filename, mode='w'):
+    """
+    Записывает строки в CSV файл (вызывается в executor-е, не в цикле событий).
+    mode='w' - перезаписать файл с заголовком, mode='a' - дописать строки в конец.
+    """
+    filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
     try:
-        filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
-        with open(filepath, mode='w', newline='') as file:
+        with open(filepath, mode=mode, newline='') as file:
             writer = csv.writer(file)
 
             # Записываем заголовки (timeStamp + имена колонок)
-            if port in port_data:
-                writer.writerow(['DateTime'] + port_data[port]['names'])
+            if mode == 'w':
+                writer.writerow(['DateTime'] + names)
 
-            # Записываем все данные из буфера
-            for row in buffer:
-                writer.writerow(row)
-        print(f"Данные записаны в {filepath} (строк: {len(buffer)})")
+            writer.writerows(rows)
+        print(f"Данные записаны в {filepath} (строк: {len(rows)}, режим: {mode})")
 
     except Exception as e:
         print(f"Ошибка при записи в файл {filepath}: {e}")
 
 
+def reset_flush(port):
+    """Начать запись порта с чистого листа (новый порт или сменились колонки)"""
+    flush_state[port] = {
+        'packets': 0,      # пакетов с последнего сброса на диск
+        'pending': [],     # строки, ещё не дописанные в _long файл
+        'long_rows': 0,    # строк в _long файле (0 - файл нужно перезаписать)
+        'lock': flush_state[port]['lock'] if port in flush_state else asyncio.Lock()
+    }
+
+
+def reset_ring(port):
+    """Пересоздать кольцевой буфер порта под текущие колонки"""
+    if not ring_rows:
+        return
+    if port in port_rings:
+        port_rings.pop(port).close()
+    path = ring_path(os.path.dirname(os.path.abspath(__file__)), port)
+    try:
+        port_rings[port] = ring_writer(path, port_data[port]['names'], ring_rows)
+    except OSError as e:
+        print(f"Ошибка при создании {path}: {e}")
+
+
+def ring_append(port, timestamp, values):
+    """Дописать строку в кольцевой буфер порта"""
+    ring = port_rings.get(port)
+    if ring is None or len(values) != ring.width:
+        return
+    ring.append(parse_timestamp(timestamp),
+                [v if isinstance(v, (int, float)) else float('nan') for v in values])
+
+
+async def flush_port(port):
+    """
+    Сбросить буферы порта на диск.
+    Короткий файл перезаписывается целиком, в _long файл дописываются только
+    новые строки; когда он дорастает до двух maxlen буфера, он перезаписывается
+    содержимым буфера (уплотнение).
+    """
+    state = flush_state[port]
+    async with state['lock']:
+        if not state['packets'] and state['long_rows']:
+            return
+        names = port_data[port]['names']
+        rows = list(port_data[port]['buffer'])
+        pending, state['pending'], state['packets'] = state['pending'], [], 0
+
+        long_buffer = port_data_long[port]['buffer']
+        if state['long_rows'] == 0 or state['long_rows'] + len(pending) > 2 * long_buffer.maxlen:
+            long_rows, long_mode = list(long_buffer), 'w'
+            state['long_rows'] = len(long_rows)
+        else:
+            long_rows, long_mode = pending, 'a'
+            state['long_rows'] += len(pending)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, write_csv, names, rows, f"data_port_{port}.csv")
+        await loop.run_in_executor(None, write_csv, names, long_rows, f"data_port_{port}_long.csv", long_mode)
+
+
+async def flush_all():
+    """Сбросить на диск все порты, в которых есть несохранённые данные"""
+    await asyncio.gather(*(flush_port(port) for port in list(flush_state)))
+
+
+async def flush_loop():
+    """Периодический сброс на диск раз в flush_period_ms"""
+    while True:
+        await asyncio.sleep(flush_period_ms / 1000)
+        await flush_all()
+
+
 async def update_csv(port, values, timestamp=None):
-    """Обновляет данные и периодически записывает в CSV файл"""
+    """Обновляет данные и по политике сброса записывает их в CSV файлы"""
+    await update_rows(port, [(timestamp, values)])
+
+
+async def update_rows(port, rows):
+    """
+    Добавить в буферы порта пачку строк [(timestamp, values), ...] за один шаг:
+    рассылка подписчикам и проверка политики сброса выполняются один раз на пачку.
+    """
     if port not in port_data:
         print(f"Ошибка: данные для порта {port} не инициализированы")
         return
 
     try:
         # Добавляем timestamp в начало данных
-        full_values = [timestamp] + values
+        full_rows = [[timestamp] + values for timestamp, values in rows]
 
         # Добавляем новые данные в буферы
-        port_data[port]['buffer'].append(full_values)
-        port_data_long[port]['buffer'].append(full_values)
+        port_data[port]['buffer'].extend(full_rows)
+        port_data_long[port]['buffer'].extend(full_rows)
+        publish(port, full_rows)
+        for timestamp, values in rows:
+            ring_append(port, timestamp, values)
 
-        # Записываем в файлы только при достижении определенного размера буфера или периодически
-        await write_csv(port, port_data[port]['buffer'], f"data_port_{port}.csv")
-        await write_csv(port, port_data_long[port]['buffer'], f"data_port_{port}_long.csv")
+        # Записываем в файлы только при достижении заданного числа пакетов (или периодически в flush_loop)
+        state = flush_state[port]
+        state['packets'] += len(full_rows)
+        state['pending'].extend(full_rows)
+        if flush_every and state['packets'] >= flush_every:
+            asyncio.create_task(flush_port(port))
 
     except Exception as e:
         print(f"Ошибка при обновлении CSV для порта {port}: {e}")
 
 
+def decode_packet(response, schemas):
+    """
+    Пакет Simulator-а (строка или пачка строк) в виде dict: из JSON или из бинарного кадра.
+    Кадр схемы запоминается в schemas подключения, для него возвращается None.
+    """
+    if isinstance(response, bytes):
+        frame = wire.decode_frame(response, schemas)
+        if frame is None:
+            return None
+        channel, timestamps, values, iterations = frame
+        return wire.to_packet(channel, schemas[channel][0], timestamps, values, iterations)
+    return json.loads(response)
+
+
+async def handle_packet(websocket_port, data):
+    """Обновить буферы порта по разобранному пакету"""
+    # Проверяем наличие необходимых полей
+    if 'names' in data:
+        # Получаем timestamp из пакета или None
+        timestamp = data.get('timeStamp', "None")
+
+        # Если это первый пакет или names изменились, инициализируем
+        if (websocket_port not in port_data or
+               port_data[websocket_port]['names'] != data['names']):
+            port_data[websocket_port] = {
+                'buffer': deque(maxlen=10),
+                'names': data['names'],
+                'columns_count': len(data['names']) + 1  # +1 для timeStamp
+            }
+            port_data_long[websocket_port] = {
+                'buffer': deque(maxlen=1000),
+                'names': data['names'],
+                'columns_count': len(data['names']) + 1  # +1 для timeStamp
+            }
+            reset_flush(websocket_port)
+            reset_ring(websocket_port)
+        if 'None' in data:
+            print(f"Получен None-пакет от порта {websocket_port}")
+            await update_csv(websocket_port, "None", timestamp="None")
+        # Обновляем CSV с новыми данными
+        elif 'values' in data:
+            await update_csv(websocket_port, data['values'], timestamp=timestamp)
+        # Пачка строк одним сообщением
+        elif 'rows' in data:
+            await update_rows(websocket_port, wire.packet_rows(data))
+    else:
+        print(f"Получен некорректный пакет от порта {websocket_port}: {data}")
+
+
 async def receive_data(websocket_port):
     """Получить данные с websocket-порта"""
     host = os.getenv("WEBSOCKET_HOST", socket.gethostbyname(socket.gethostname()))
@@ -60,41 +231,16 @@ async def receive_data(websocket_port):
 
     while True:  # Бесконечный цикл для переподключения
         try:
-            async with websockets.connect(uri) as websocket:
+            async with websockets.connect(uri, subprotocols=subprotocols) as websocket:
                 print(f"Подключено к порту {websocket_port}")
+                schemas = {}  # Схемы бинарных кадров этого подключения
 
                 while True:
                     try:
                         response = await asyncio.wait_for(websocket.recv(), timeout=1.0)
-
-                        data = json.loads(response)
-
-                        # Проверяем наличие необходимых полей
-                        if 'names' in data:
-                            # Получаем timestamp из пакета или None
-                            timestamp = data.get('timeStamp', "None")
-
-                            # Если это первый пакет или names изменились, инициализируем
-                            if (websocket_port not in port_data or
-                                   port_data[websocket_port]['names'] != data['names']):
-                                port_data[websocket_port] = {
-                                    'buffer': deque(maxlen=10),
-                                    'names': data['names'],
-                                    'columns_count': len(data['names']) + 1  # +1 для timeStamp
-                                }
-                                port_data_long[websocket_port] = {
-                                    'buffer': deque(maxlen=1000),
-                                    'names': data['names'],
-                                    'columns_count': len(data['names']) + 1  # +1 для timeStamp
-                                }
-                            if 'None' in data:
-                                print(f"Получен None-пакет от порта {websocket_port}")
-                                await update_csv(websocket_port, "None", timestamp="None")
-                            # Обновляем CSV с новыми данными
-                            elif 'values' in data:
-                                await update_csv(websocket_port, data['values'], timestamp=timestamp)
-                        else:
-                            print(f"Получен некорректный пакет от порта {websocket_port}: {response}")
+                        data = decode_packet(response, schemas)
+                        if data is not None:
+                            await handle_packet(websocket_port, data)
 
                     except asyncio.TimeoutError:
                         continue
@@ -104,23 +250,185 @@ async def receive_data(websocket_port):
                     except json.JSONDecodeError as e:
                         print(f"Ошибка декодирования JSON от порта {websocket_port}: {e}")
                         continue
+                    except (ValueError, KeyError, struct.error) as e:
+                        print(f"Некорректный кадр от порта {websocket_port}: {e!r}")
+                        continue
 
         except Exception as e:
             print(f"Ошибка подключения к порту {websocket_port}: {e}, повторная попытка через 5 секунд...")
             await asyncio.sleep(5)
 
 
+async def receive_mux(ports):
+    """Получить данные всех портов через мультиплексный порт Simulator-а"""
+    host = os.getenv("WEBSOCKET_HOST", socket.gethostbyname(socket.gethostname()))
+    uri = f"ws://{host}:{mux_port}"
+
+    while True:  # Бесконечный цикл для переподключения
+        try:
+            async with websockets.connect(uri, subprotocols=subprotocols) as websocket:
+                await websocket.send(json.dumps({'subscribe': ports}))
+                schemas = {}  # Схемы бинарных кадров этого подключения
+                print(f"Подключено к мультиплексному порту {mux_port}, каналы {ports}")
+
+                async for response in websocket:
+                    try:
+                        data = decode_packet(response, schemas)
+                        if data is not None and data.get('channel') in ports:
+                            await handle_packet(data['channel'], data)
+                    except json.JSONDecodeError as e:
+                        print(f"Ошибка декодирования JSON от мультиплексного порта {mux_port}: {e}")
+                    except (ValueError, KeyError, struct.error) as e:
+                        print(f"Некорректный кадр от мультиплексного порта {mux_port}: {e!r}")
+
+                print(f"Соединение с мультиплексным портом {mux_port} закрыто, переподключаемся...")
+
+        except Exception as e:
+            print(f"Ошибка подключения к мультиплексному порту {mux_port}: {e}, повторная попытка через 5 секунд...")
+            await asyncio.sleep(5)
+
+
+def feed_message(port, rows, reset=False):
+    """Сообщение подписчику: строки буфера порта вместе с именами колонок"""
+    return json.dumps({
+        'port': port,
+        'names': port_data[port]['names'],
+        'rows': list(rows),
+        'reset': reset
+    })
+
+
+def feed_put(client, message):
+    """Положить сообщение в очередь подписчика, при переполнении выбросив самое старое"""
+    queue = feed_clients[client]['queue']
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+def publish(port, rows):
+    """Разослать новые строки порта подписчикам (подписчикам без строк - только событие)"""
+    if not feed_clients:
+        return
+    messages = {}  # {rows: сообщение}
+    for client, state in feed_clients.items():
+        if port in state['ports']:
+            if state['rows'] not in messages:
+                messages[state['rows']] = feed_message(port, rows) if state['rows'] else change_message(port, 'rows')
+            feed_put(client, messages[state['rows']])
+
+
+def change_message(port, source):
+    """Событие без строк: данные порта изменились (rows - у Reciever-а, filled - у Business)"""
+    return json.dumps({'port': port, 'changed': source})
+
+
+def notify(port):
+    """Разослать подписчикам порта событие о записанных результатах Business"""
+    message = None
+    for client, state in feed_clients.items():
+        if port in state['ports']:
+            message = message or change_message(port, 'filled')
+            feed_put(client, message)
+
+
+class change_listener(asyncio.DatagramProtocol):
+    """Уведомления Business о записанных результатах: {"port": порт} по UDP"""
+
+    def datagram_received(self, data, addr):
+        try:
+            port = int(json.loads(data)['port'])
+        except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError, ValueError):
+            print(f"Некорректное уведомление от {addr}: {data[:100]!r}")
+            return
+        notify(port)
+
+
+async def feed_writer(websocket):
+    """Отправлять подписчику сообщения из его очереди"""
+    queue = feed_clients[websocket]['queue']
+    while True:
+        await websocket.send(await queue.get())
+
+
+async def feed_handler(websocket):
+    """
+    Обслужить подписчика прямой раздачи.
+    Подписчик присылает {"subscribe": [порты]}, в ответ получает текущий
+    буфер каждого порта (reset=true), а затем каждую новую строку и события
+    о записанных результатах Business ({"port", "changed": "filled"}).
+    С {"subscribe": [...], "rows": false} (GUI) вместо строк приходят только
+    события {"port", "changed": "rows"}.
+    """
+    feed_clients[websocket] = {'ports': set(), 'rows': True, 'queue': asyncio.Queue(maxsize=feed_queue_size)}
+    writer = asyncio.create_task(feed_writer(websocket))
+    try:
+        async for message in websocket:
+            try:
+                data = json.loads(message)
+                ports = {int(p) for p in data.get('subscribe', [])}
+                rows = bool(data.get('rows', True))
+            except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+                print(f"Некорректная подписка: {message}")
+                continue
+            state = feed_clients[websocket]
+            state['ports'] |= ports
+            state['rows'] = rows
+            for port in ports:
+                if rows and port in port_data:
+                    feed_put(websocket, feed_message(port, port_data[port]['buffer'], reset=True))
+            print(f"Подписчик {websocket.remote_address} подписан на порты {sorted(ports)}")
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        writer.cancel()
+        feed_clients.pop(websocket, None)
+
+
+async def serve_feed():
+    """Запустить сервер прямой раздачи данных (если порт занят - работать без неё)"""
+    try:
+        server = await websockets.serve(feed_handler, feed_host, feed_port)
+    except OSError as e:
+        print(f"Прямая раздача на ws://{feed_host}:{feed_port} не запущена: {e}")
+        return
+    print(f"Прямая раздача данных на ws://{feed_host}:{feed_port}")
+    try:
+        await asyncio.get_running_loop().create_datagram_endpoint(change_listener, local_addr=(feed_host, feed_port))
+    except OSError as e:
+        print(f"Уведомления Business на udp://{feed_host}:{feed_port} не принимаются: {e}")
+    await server.wait_closed()
+
+
 async def listen_ports(ports):
     """Обрабатывать каждый из портов"""
-    tasks = [asyncio.create_task(receive_data(port)) for port in ports]
-    await asyncio.gather(*tasks)
+    loop = asyncio.get_running_loop()
+    try:
+        # terminate() от runner-а тоже должен сбросить буферы на диск
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except (NotImplementedError, RuntimeError):
+        pass  # Windows
+
+    if mux_port:
+        tasks = [asyncio.create_task(receive_mux(ports))]
+    else:
+        tasks = [asyncio.create_task(receive_data(port)) for port in ports]
+    if feed_port:
+        tasks.append(asyncio.create_task(serve_feed()))
+    if flush_period_ms:
+        tasks.append(asyncio.create_task(flush_loop()))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await flush_all()
 
 if __name__ == "__main__":
-    arg = "8092-8093-8094-8095"
-    print(f"Ресивер-коллектор запущен с аргументами: {arg}")#{sys.argv}")
-    ports = [int(p) for p in arg.split('-')]#sys.argv[1].split('-')]
+    # Порты можно передать аргументом ("8092-8093"), по умолчанию - все порты из реестра установок
+    arg = sys.argv[1] if len(sys.argv) > 1 else "-".join(str(p) for p in installation_ports(load_installations()))
+    print(f"Ресивер-коллектор запущен с аргументами: {arg}")
+    ports = [int(p) for p in arg.split('-')]
 
     try:
         asyncio.run(listen_ports(ports))
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("Завершение работы...")
\ No newline at end of file
@@ -1,12 +1,118 @@
 import asyncio
 import websockets
 import json
+import os
+import struct
 import sys
 from collections import defaultdict
 
-port_data = defaultdict(dict) # Данные на каждом из портов
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень проекта
+from restoringvalues import wire
+
+port_data = defaultdict(dict) # Данные на каждом из портов: последний пакет (JSON и/или бинарный кадр) и схема
+schemas = {} # Схемы бинарных кадров издателей: {channel: (names, dtype)}
 port_clients = defaultdict(set) # Список подключенных клиентов
 
+# Мультиплексный режим: один слушатель на все установки, каналом служит номер порта
+# установки (поле channel в пакете), подписчики выбирают каналы сообщением {"subscribe": [...]}.
+# 0 - по слушателю на каждый порт, как раньше
+mux_port = int(os.getenv("WEBSOCKET_MUX_PORT", 0))
+
+# Отправка клиентам через личные очереди: у каждого клиента своя задача-писатель,
+# поэтому медленный клиент не задерживает остальных и не тормозит приём пакетов.
+# При переполнении очереди: drop_oldest - выбросить самое старое сообщение,
+# drop_newest - не ставить новое, disconnect - отключить клиента
+client_queue_size = int(os.getenv("WEBSOCKET_QUEUE_SIZE", 100))
+overflow_policy = os.getenv("WEBSOCKET_OVERFLOW", "drop_oldest")
+stats_period = int(os.getenv("WEBSOCKET_STATS_S", 60)) # Период печати отставания клиентов (0 - не печатать)
+clients = {} # Формат: {websocket: {'queue': asyncio.Queue, 'writer': Task, 'binary': bool, 'schemas': dict, 'sent': int, 'dropped': int}}
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+if overflow_policy not in OVERFLOW_POLICIES:
+    raise ValueError(f"WEBSOCKET_OVERFLOW должен быть одним из {OVERFLOW_POLICIES}, получено {overflow_policy!r}")
+
+
+def register_client(websocket):
+    """Завести клиенту очередь отправки и задачу-писатель"""
+    clients[websocket] = {
+        'queue': asyncio.Queue(maxsize=client_queue_size),
+        'writer': asyncio.create_task(client_writer(websocket)),
+        'binary': websocket.subprotocol == wire.SUBPROTOCOL,  # клиент согласовал бинарный формат
+        'schemas': {},  # схемы, уже отправленные клиенту: {channel: кадр схемы}
+        'sent': 0,     # отправлено сообщений
+        'dropped': 0   # выброшено из-за переполнения очереди
+    }
+
+
+def unregister_client(websocket):
+    """Убрать клиента из очередей и подписок"""
+    state = clients.pop(websocket, None)
+    if state is not None:
+        state['writer'].cancel()
+    for subscribers in port_clients.values():
+        subscribers.discard(websocket)
+
+
+async def client_writer(websocket):
+    """
+    Отправлять клиенту сообщения из его очереди.
+    Бинарный пакет лежит в очереди вместе со схемой канала, схема
+    отправляется перед ним, только если клиент её ещё не получал.
+    """
+    state = clients[websocket]
+    try:
+        while True:
+            message = await state['queue'].get()
+            if isinstance(message, tuple):
+                channel, schema, message = message
+                if state['schemas'].get(channel) != schema:
+                    await websocket.send(schema)
+                    state['schemas'][channel] = schema
+            await websocket.send(message)
+            state['sent'] += 1
+    except websockets.ConnectionClosed:
+        unregister_client(websocket)
+
+
+def enqueue(websocket, message):
+    """Поставить сообщение в очередь клиента с учётом политики переполнения"""
+    state = clients.get(websocket)
+    if state is None:
+        return
+    queue = state['queue']
+    if queue.full():
+        state['dropped'] += 1
+        if overflow_policy == "drop_newest":
+            return
+        if overflow_policy == "disconnect":
+            print(f"Клиент {websocket.remote_address} не успевает получать данные, отключаем")
+            unregister_client(websocket)
+            asyncio.ensure_future(websocket.close(1013, "client too slow"))
+            return
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+def client_stats():
+    """Отставание клиентов: {адрес: {'queued', 'sent', 'dropped'}}"""
+    return {
+        websocket.remote_address: {
+            'queued': state['queue'].qsize(),
+            'sent': state['sent'],
+            'dropped': state['dropped']
+        }
+        for websocket, state in clients.items()
+    }
+
+
+async def stats_loop():
+    """Периодически печатать клиентов, которые отстают или теряют сообщения"""
+    while True:
+        await asyncio.sleep(stats_period)
+        for address, stats in client_stats().items():
+            if stats['queued'] or stats['dropped']:
+                print(f"Клиент {address}: в очереди {stats['queued']}, отправлено {stats['sent']}, выброшено {stats['dropped']}")
+
 async def handle_connection(websocket, path):
     """Обслуживать клиентов на порту"""
     port = websocket.port
@@ -15,27 +121,33 @@ async def handle_connection(websocket, path):
     websocket.ping_interval = 20
     websocket.ping_timeout = 60
 
+    # Пока соединение ничего не прислало, это подписчик; приславший пакет -
+    # издатель (Simulator), ему ничего не рассылается
+    register_client(websocket)
     port_clients[port].add(websocket)
 
     try:
         # Отправка текущих данных новому клиенту
-        if port in port_data and 'latest_data' in port_data[port]:
-            try:
-                await websocket.send(json.dumps(port_data[port]['latest_data']))
-            except websockets.ConnectionClosed:
-                return
+        send_latest(websocket, port)
 
         # Мониторинг активности
         while True:
             try:
                 message = await asyncio.wait_for(websocket.recv(), timeout=60)
+                if websocket in clients:
+                    unregister_client(websocket)
+                    print(f"Издатель {websocket.remote_address} на порту {port}")
                 try:
-                    data = json.loads(message)
-                    port_data[port]['latest_data'] = data
-                    print(f"Получены данные {port}: {data}")
-                    await broadcast_to_port(port, data)
+                    if isinstance(message, bytes):
+                        received = store_packet(port, frame=message)
+                    else:
+                        received = store_packet(port, data=json.loads(message))
+                    if received:
+                        broadcast_to_port(port)
                 except json.JSONDecodeError:
                     print(f"Ошибка декодирования JSON на порту {port}")
+                except (ValueError, KeyError, struct.error) as e:
+                    print(f"Некорректный кадр на порту {port}: {e!r}")
             except asyncio.TimeoutError:
                 # Проверяем соединение
                 try:
@@ -49,47 +161,162 @@ async def handle_connection(websocket, path):
                 break
 
     finally:
-        port_clients[port].discard(websocket)
+        unregister_client(websocket)
         await websocket.close()
 
 
-async def broadcast_to_port(port, data):
-    """Безопасная рассылка с обработкой отключённых клиентов"""
-    if port not in port_clients:
-        return
+async def handle_mux_connection(websocket):
+    """
+    Обслуживать клиента мультиплексного слушателя.
+    Издатель (Simulator) присылает пакеты с полем channel, подписчик (Reciever)
+    присылает {"subscribe": [каналы]} и получает последние пакеты этих каналов,
+    а затем все новые.
+    """
+    print(f"Новое подключение к мультиплексному порту {mux_port}")
+    channels = set()
+    try:
+        async for message in websocket:
+            if isinstance(message, bytes):
+                try:
+                    channel = wire.frame_channel(message)[1]
+                    if store_packet(channel, frame=message):
+                        broadcast_to_port(channel)
+                except (ValueError, KeyError, struct.error) as e:
+                    print(f"Некорректный кадр на мультиплексном порту {mux_port}: {e!r}")
+                continue
 
-    message = json.dumps(data)
-    dead_clients = set()
+            try:
+                data = json.loads(message)
+            except json.JSONDecodeError:
+                print(f"Ошибка декодирования JSON на мультиплексном порту {mux_port}")
+                continue
 
-    for client in port_clients[port]:
-        try:
-            if client.open:
-                await client.send(message)
+            if 'subscribe' in data:
+                try:
+                    new_channels = {int(c) for c in data['subscribe']} - channels
+                except (TypeError, ValueError):
+                    print(f"Некорректная подписка: {message}")
+                    continue
+                if websocket not in clients:
+                    register_client(websocket)  # очередь - только подписчикам, не издателю
+                channels |= new_channels
+                for channel in new_channels:
+                    port_clients[channel].add(websocket)
+                    send_latest(websocket, channel)
+                print(f"Подписчик {websocket.remote_address} подписан на каналы {sorted(channels)}")
+            elif 'channel' in data:
+                if store_packet(data['channel'], data=data):
+                    broadcast_to_port(data['channel'])
             else:
-                dead_clients.add(client)
-        except (websockets.ConnectionClosed, RuntimeError) as e:
-            print(f"Ошибка отправки на порту {port}: {str(e)}")
-            dead_clients.add(client)
+                print(f"Пакет без канала на мультиплексном порту {mux_port}: {message}")
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        unregister_client(websocket)
+
+
+def store_packet(port, frame=None, data=None):
+    """
+    Запомнить пакет издателя (строку или пачку строк) как последний пакет канала.
+    Бинарный кадр хранится как есть, JSON - разобранным; второе представление
+    строится лениво, только если на канале есть клиенты другого формата.
+
+    :return: True - пришли данные, их нужно разослать; False - пришла схема
+    """
+    state = port_data[port]
+    if frame is not None:
+        if frame[0] == wire.FRAME_SCHEMA:
+            wire.decode_frame(frame, schemas)
+            state['schema'] = frame
+            return False
+        state['frame'], state['latest_data'] = frame, None
+        print(f"Получены данные {port}: {len(frame)} байт")
+    else:
+        state['frame'], state['latest_data'] = None, data
+        print(f"Получены данные {port}: {data}")
+    return True
+
+
+def latest_message(port, binary):
+    """
+    Последний пакет канала в формате клиента (None, если пакета ещё нет):
+    строка JSON или (канал, кадр схемы, кадр данных) для бинарного клиента
+    """
+    state = port_data[port]
+    if state.get('frame') is None and state.get('latest_data') is None:
+        return None
+
+    if binary:
+        if state.get('frame') is None:
+            names, timestamps, values, iterations = wire.from_packet(state['latest_data'])
+            if state.get('names') != names:
+                state['names'], state['schema'] = names, wire.encode_schema(port, names)
+            state['frame'] = wire.encode_rows(port, timestamps, values, iterations)
+        return port, state['schema'], state['frame']
+
+    if state.get('latest_data') is None:
+        if wire.frame_channel(state['frame'])[1] not in schemas:
+            return None  # схема издателя ещё не пришла
+        channel, timestamps, values, iterations = wire.decode_frame(state['frame'], schemas)
+        state['latest_data'] = wire.to_packet(channel, schemas[channel][0], timestamps, values, iterations)
+    return json.dumps(state['latest_data'])
+
 
-    # Удаляем мёртвые соединения
-    for client in dead_clients:
-        port_clients[port].discard(client)
+def send_latest(websocket, port):
+    """Отправить новому клиенту последний пакет канала"""
+    message = latest_message(port, clients[websocket]['binary'])
+    if message is not None:
+        enqueue(websocket, message)
+
+
+def broadcast_to_port(port):
+    """
+    Рассылка подписчикам порта.
+    Пакет сериализуется один раз на каждый формат (JSON, бинарный) и ставится
+    в очереди клиентов, отправляют его задачи-писатели, не задерживая отправителя пакета.
+    """
+    if port not in port_clients:
+        return
+
+    messages = {}  # {binary: сообщение}
+    for client in list(port_clients[port]):
+        binary = clients[client]['binary'] if client in clients else False
+        if binary not in messages:
+            messages[binary] = latest_message(port, binary)
+        if messages[binary] is not None:
+            enqueue(client, messages[binary])
 
 
 async def run_servers(ports):
-    """Запустить сервера на каждом из портов"""
+    """Запустить сервера на каждом из портов (или один мультиплексный)"""
     servers = []
+    if mux_port:
+        server = await websockets.serve(
+            handle_mux_connection,
+            "0.0.0.0",
+            mux_port,
+            ping_interval=20,
+            ping_timeout=60,
+            subprotocols=[wire.SUBPROTOCOL]
+        )
+        servers.append(server)
+        print(f"Мультиплексный сервер запущен на порту {mux_port} (каналы {ports})")
+        ports = []
+
     for port in ports:
         server = await websockets.serve(
             handle_connection,
             "0.0.0.0",
             port,
             ping_interval=20,
-            ping_timeout=60
+            ping_timeout=60,
+            subprotocols=[wire.SUBPROTOCOL]
         )
         servers.append(server)
         print(f"Сервер запущен на порту {port}")
 
+    if stats_period:
+        await stats_loop()
     await asyncio.Future()  # Бесконечное ожидание
 
 
@@ -1,17 +1,51 @@
 import json
 import sys
 import numpy as np
-import pandas as pd
 import subprocess
 import websockets, os, socket
 import asyncio
-import random
 import time
 
-files = ["PowerConsumption1.csv", "energydata_complete.csv"]
-ports = [8092, 8093, 8094, 8095]
-chances = [0.0125, 0.025]
-intervals = [5000, 7000]
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # корень проекта
+from restoringvalues.registry import load_installations, installation_ports
+from restoringvalues import wire
+from restoringvalues.dropout import dropout_model
+from restoringvalues.dataset import load_dataset
+
+installations = load_installations()
+ports = installation_ports(installations)
+
+# Мультиплексный режим: все установки шлют пакеты через одно подключение
+# к одному порту server_web, номер порта установки передаётся полем channel (0 - выключен)
+mux_port = int(os.getenv("WEBSOCKET_MUX_PORT", 0))
+mux_client = None # Общее подключение всех установок в мультиплексном режиме
+mux_lock = asyncio.Lock()
+
+# Формат пакетов: binary - схема один раз на подключение, дальше упакованные значения
+# (если server_web его поддерживает), json - как раньше
+wire_format = os.getenv("WEBSOCKET_WIRE", "binary")
+wire_dtype = os.getenv("WEBSOCKET_WIRE_DTYPE", "f8") # f4 - вдвое меньше байт ценой точности
+subprotocols = [wire.SUBPROTOCOL] if wire_format == "binary" else None
+
+# Пачки строк: одно сообщение на batch_rows строк или на все строки окна batch_window секунд
+# времени данных (0 - окно выключено); по умолчанию, как раньше, строка на сообщение
+batch_rows = int(os.getenv("SIMULATOR_BATCH_ROWS", 1))
+batch_window = float(os.getenv("SIMULATOR_BATCH_WINDOW_S", 0))
+
+# Ускоренное воспроизведение: speed - во сколько раз быстрее interval (max - без пауз,
+# так быстро, как принимает server_web), rows - диапазон строк файла "start:end",
+# once - пройти диапазон один раз и завершиться (с замером скорости)
+speed = os.getenv("SIMULATOR_SPEED", "1")
+speed = 0.0 if speed == "max" else float(speed)
+row_range = os.getenv("SIMULATOR_ROWS", "")
+replay_once = os.getenv("SIMULATOR_ONCE", "0") == "1"
+
+# Журнал отправки для замера задержки (restoringvalues-bench): строки "port,timestamp_ns,sent_at"
+send_log_path = os.getenv("SIMULATOR_SEND_LOG", "")
+
+# Зерно генератора пропусков (пусто - случайное); у каждой установки своё: seed + port_main
+seed = os.getenv("SIMULATOR_SEED", "")
+seed = int(seed) if seed else None
 time_format='%Y-%m-%d %H:%M:%S'
 
 class Facility:
@@ -27,43 +61,69 @@ class Facility:
 
     interval = None  # Время в миллисекундах между переходами на следующие строчки
 
-    points = None # Точки, полученные из файла
+    values = None # Значения строк файла (float64)
     columns = None # Список колонок файла
+    stamps = None # Метки времени строк в наносекундах эпохи (для бинарных пакетов)
+    labels = None # Метки времени строк строками time_format в байтах (для JSON-пакетов)
+    schemas = None # Подключение, которому уже отправлена схема канала: {channel: client}
+    send_log = None # Журнал отправки строк главного порта (None - не вести)
 
     chance = None # Вероятность пропуска данных
     chance_seq = None # Мультипликатор вероятости в случае если предыдущая запись - пропуск
-    _is_empty = None # Предыдущая запись - пропуск?
+    dropout = None # Генератор масок пропусков (серийные пропуски и отказы всей установки)
 
-    def __init__(self, port_main, port_test, file_path, interval, chance, time_format):
+    def __init__(self, port_main, port_test, file_path, interval, chance, time_format,
+                 chance_seq=1.0, outage_chance=0.0, outage_length=1.0):
         self.port_main = port_main
         self.port_test = port_test
         self.file_path = file_path
         self.interval = interval
         self.chance = chance
+        self.chance_seq = chance_seq
+        self.schemas = {}
+        if send_log_path:
+            self.send_log = open(send_log_path, "a", buffering=1)
 
-        self.read_file()
         self.time_format = time_format
-        _is_empty = False
+        self.read_file()
+        self.dropout = dropout_model(len(self.columns), chance, chance_seq, outage_chance, outage_length,
+                                     seed=None if seed is None else seed + port_main)
         asyncio.get_event_loop().run_until_complete(self.run_websocket_main())
-        asyncio.get_event_loop().run_until_complete(self.run_websocket_test())
+        if self.port_test is not None:
+            asyncio.get_event_loop().run_until_complete(self.run_websocket_test())
 
     def read_file(self):
-        """Считать данные из .csv файла"""
+        """
+        Открыть данные .csv файла через кэш рядом с ним: массивы отображаются в память
+        (np.memmap), в памяти процесса оказываются только отправляемые строки
+        """
         csv_path = os.path.join(os.path.dirname(__file__), self.file_path)
-        data = pd.read_csv(csv_path).dropna()
+        data = load_dataset(csv_path, self.time_format)
 
-        self.points = data.values #self.data.iloc[:, [0, 1]].values
-        self.columns = data.columns[1:]
-        self.row_min = self.row_cur = 0
-        self.row_max = data.iloc[:, 1].size - 5
+        self.values = data.values
+        self.columns = data.names
+        self.stamps = data.stamps
+        self.labels = data.labels
+        self.row_min = 0
+        self.row_max = len(data) - 5
+        if row_range:
+            start, _, end = row_range.partition(":")
+            self.row_min = max(int(start or 0), 0)
+            self.row_max = min(int(end), self.row_max) if end else self.row_max
+            if self.row_min >= self.row_max:
+                raise ValueError(f"Пустой диапазон строк {row_range} для {self.file_path}")
+        self.row_cur = self.row_min - 1
 
     async def run_websocket_main(self):
         """Подключиться к главному порту"""
+        if mux_port:
+            self.client_main = await mux_connect()
+            return
         host = os.getenv("WEBSOCKET_HOST", socket.gethostbyname(socket.gethostname()))
         url_main = f"ws://{host}:{self.port_main}"
         print(f"Подключаюсь к {url_main}")
         try:
-            self.client_main = await websockets.connect(url_main)
+            self.client_main = await websockets.connect(url_main, subprotocols=subprotocols)
             print("Подключение установлено")
         except Exception as e:
             print(f"Ошибка подключения: {e}")
@@ -71,87 +131,136 @@ class Facility:
 
     async def run_websocket_test(self):
         """Подключиться к тестовому порту"""
+        if mux_port:
+            self.client_test = await mux_connect()
+            return
         host = os.getenv("WEBSOCKET_HOST", socket.gethostbyname(socket.gethostname()))
         url_test = f"ws://{host}:{self.port_test}"
         print(f"Подключаюсь к {url_test}")
         try:
-            self.client_test = await websockets.connect(url_test)
+            self.client_test = await websockets.connect(url_test, subprotocols=subprotocols)
             print("Подключение установлено")
         except Exception as e:
             print(f"Ошибка подключения: {e}")
             raise
-    def parse_timestamp(self, timestamp):
-        """Привести временную метку к единому формату"""
-        return pd.to_datetime(timestamp).strftime(self.time_format)
-    async def upload_main(self, res):
+    async def send(self, client, channel, rows, values):
+        """
+        Отправить строки rows (значения values) одним сообщением
+        в согласованном с сервером формате: бинарном или JSON
+        """
+        if client.subprotocol == wire.SUBPROTOCOL:
+            if self.schemas.get(channel) is not client:
+                await client.send(wire.encode_schema(channel, self.columns, wire_dtype))
+                self.schemas[channel] = client
+            await client.send(wire.encode_rows(channel, self.stamps[rows], values, rows, wire_dtype))
+            return
+
+        if len(rows) == 1:
+            res = { #Формирование пакета данных
+                'names': self.columns,
+                'values': values[0],
+                'timeStamp': self.labels[rows[0]].decode(),
+                'iteration': rows[0],
+                'channel': channel
+            }
+        else:
+            res = { #Формирование пачки строк
+                'names': self.columns,
+                'rows': values,
+                'timeStamps': self.labels[rows].astype(str).tolist(),
+                'iterations': rows,
+                'channel': channel
+            }
+        await client.send(json.dumps(res))
+
+    async def upload_main(self, rows, values):
         """Загрузить пакет данных на главный порт"""
         try:
             if self.client_main is None or not self.client_main.open:
                 await self.run_websocket_main()
-            await self.client_main.send(json.dumps(res))
+            await self.send(self.client_main, self.port_main, rows, values)
+            if self.send_log is not None:
+                sent_at = time.time()
+                self.send_log.writelines(f"{self.port_main},{self.stamps[row]},{sent_at:.6f}\n" for row in rows)
         except Exception as e:
             print(f"Ошибка отправки (main): {e}")
             await self.run_websocket_main()  # Переподключение
 
-    async def upload_test(self, res):
+    async def upload_test(self, rows, values):
         """Загрузить пакет данных на тестовый порт"""
         try:
             if self.client_test is None or not self.client_test.open:
                 await self.run_websocket_test()
-            await self.client_test.send(json.dumps(res))
+            await self.send(self.client_test, self.port_test, rows, values)
         except Exception as e:
             print(f"Ошибка отправки (test): {e}")
             await self.run_websocket_test()  # Переподключение
 
+    def next_rows(self):
+        """Следующие строки файла для одного сообщения: batch_rows строк или окно batch_window секунд"""
+        rows = []
+        while True:
+            self.row_cur += 1
+            if self.row_cur >= self.row_max:
+                self.row_cur = self.row_min
+            rows.append(self.row_cur)
+
+            if self.row_cur + 1 >= self.row_max or len(rows) >= self.row_max - self.row_min:
+                return rows  # пачка не переходит через начало файла
+            if batch_window:
+                if self.stamps[self.row_cur + 1] - self.stamps[rows[0]] >= batch_window * 1e9:
+                    return rows
+            elif len(rows) >= batch_rows:
+                return rows
+
+    def drop_values(self, rows):
+        """Значения строк с пропусками"""
+        values = self.values[rows]
+        values[self.dropout.take(len(rows))] = np.nan
+        return values.tolist()
+
     async def simulation(self):
         """Имитация работы установки"""
+        sent, started = 0, time.time()
         while True:
             try:
-                self.row_cur += 1
-                if self.row_cur >= self.row_max:
-                    self.row_cur = self.row_min
-
-                res = { #Формирование пакета данных
-                    'names': self.columns.tolist(),
-                    'values': self.points[self.row_cur, 1:].tolist(),
-                    'timeStamp': self.parse_timestamp(self.points[self.row_cur, 0]),
-                    'iteration': self.row_cur
-                }
-
-                await self.upload_test(res)
-
-                points_out = []
-                for i in range(1, self.points.shape[1]):
-                    if random.random() <= self.chance:
-                        points_out.append(np.nan)
-                    else:
-                        points_out.append(self.points[self.row_cur, i])
-
-                res = {'names': self.columns.tolist(),
-                       'values': points_out,
-                       'timeStamp': self.parse_timestamp(self.points[self.row_cur, 0]),
-                       'iteration': self.row_cur
-                       }
-
-                await self.upload_main(res)
+                rows = self.next_rows()
+
+                if self.port_test is not None:
+                    await self.upload_test(rows, self.values[rows].tolist())
+
+                await self.upload_main(rows, self.drop_values(rows))
+                sent += len(rows)
 
             except Exception as e:
                 print(f"Критическая ошибка в simulation: {e}")
                 await asyncio.sleep(5)
                 continue
 
-            await asyncio.sleep(self.interval / 1000)
+            if replay_once and self.row_cur + 1 >= self.row_max:
+                elapsed = time.time() - started
+                print(f"Установка {self.port_main}: отправлено {sent} строк за {elapsed:.1f} с ({sent / max(elapsed, 1e-9):.0f} строк/с)")
+                return
+
+            # Пачка из нескольких строк занимает столько же времени, сколько строки по одной
+            await asyncio.sleep(self.interval / 1000 * len(rows) / speed if speed else 0)
+
+async def mux_connect():
+    """Общее подключение к мультиплексному порту (переподключается, если закрыто)"""
+    global mux_client
+    async with mux_lock:
+        if mux_client is None or not mux_client.open:
+            host = os.getenv("WEBSOCKET_HOST", socket.gethostbyname(socket.gethostname()))
+            url = f"ws://{host}:{mux_port}"
+            print(f"Подключаюсь к {url}")
+            mux_client = await websockets.connect(url, subprotocols=subprotocols)
+            print("Подключение установлено")
+    return mux_client
 
 async def run_simulation():
-    """Запустить параллельно симуляцию обеих установок"""
-    await asyncio.gather(facility_1.simulation(), facility_2.simulation())
+    """Запустить параллельно симуляцию всех установок"""
+    await asyncio.gather(*(facility.simulation() for facility in facilities))
 
-if __name__ == "__main__":
-    print(sys.executable)
-    print(sys.path)
-    server_app = os.path.join(os.path.dirname(__file__), 'server_web.py')
-    subprocess.Popen([sys.executable, server_app, f"{ports[0]}-{ports[1]}-{ports[2]}-{ports[3]}"])
-    
 def wait_port(host: str, port: int, timeout: int = 15) -> None:
     t0 = time.time()
     while time.time() - t0 < timeout:
@@ -167,31 +276,28 @@ if __name__ == "__main__":
     os.environ.setdefault("WEBSOCKET_HOST", "127.0.0.1")
 
     server_app = os.path.join(os.path.dirname(__file__), 'server_web.py')
-    subprocess.Popen([sys.executable, server_app, f"{ports[0]}-{ports[1]}-{ports[2]}-{ports[3]}"])
+    subprocess.Popen([sys.executable, server_app, "-".join(str(p) for p in ports)])
 
     host = os.getenv("WEBSOCKET_HOST", "127.0.0.1")
-    for p in ports:
+    for p in ([mux_port] if mux_port else ports):
         wait_port(host, p, timeout=15)
 
     loop = asyncio.get_event_loop()
 
-    facility_1 = Facility(
-        port_main=ports[0],
-        port_test=ports[1],
-        file_path=files[0],
-        interval=intervals[0],
-        chance=chances[0],
-        time_format=time_format
+    facilities = [
+        Facility(
+            port_main=inst.port_main,
+            port_test=inst.port_test,
+            file_path=inst.file,
+            interval=inst.interval,
+            chance=inst.chance,
+            time_format=time_format,
+            chance_seq=inst.chance_seq,
+            outage_chance=inst.outage_chance,
+            outage_length=inst.outage_length
         )
-
-    facility_2 = Facility(
-        port_main=ports[2],
-        port_test=ports[3],
-        file_path=files[1],
-        interval=intervals[1],
-        chance=chances[1],
-        time_format=time_format
-    )
+        for inst in installations
+    ]
 
     try:
         loop.run_until_complete(run_simulation())
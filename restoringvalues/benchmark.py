@@ -0,0 +1,336 @@
+"""
+Нагрузочный замер всего конвейера: Simulator -> server_web -> Reciever -> Business.
+
+Поднимает модули локально на синтетических установках (число установок, колонок
+и темп строк задаются параметрами), после прогрева измеряет:
+    - пропускную способность каждой стадии (строк в секунду):
+        simulator - строки, отправленные главными портами (журнал SIMULATOR_SEND_LOG),
+        reciever  - строки, попавшие в кольцевые буферы Reciever-а,
+        business  - строки, впервые записанные в data_out_<port>.csv;
+    - сквозную задержку строки: отправка Simulator-ом -> запись заполненной строки
+      Business-ом (время записи - mtime файла), перцентили в миллисекундах.
+
+Результат пишется в JSON, прошлый результат можно передать как --baseline:
+при падении пропускной способности или росте p99 больше --tolerance
+команда завершается с кодом 1 (для поиска регрессий).
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from restoringvalues.registry import REGISTRY_ENV
+from restoringvalues.ring_store import ring_reader, ring_path
+from restoringvalues.rollup import rollup_path, RESOLUTIONS
+from restoringvalues.sink import parquet_path, history_path, read_history
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECIEVER_DIR = os.path.join(ROOT, "Reciever")
+BUSINESS_DIR = os.path.join(ROOT, "Business")
+BUSINESS_API = "http://127.0.0.1:8000/set_interval"
+
+
+def start(script: str, env: Dict[str, str], log) -> subprocess.Popen:
+    # Своя группа процессов: вместе с Simulator-ом гасится и запущенный им server_web
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, script)], env=env,
+                            stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def stop(procs: List[subprocess.Popen]) -> None:
+    for pr in procs:
+        try:
+            os.killpg(pr.pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+    for pr in procs:
+        try:
+            pr.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            os.killpg(pr.pid, signal.SIGKILL)
+
+
+def make_source(path: str, rows: int, columns: int, seed: int) -> None:
+    """Синтетический файл установки: DateTime с шагом в минуту и columns гладких рядов с шумом"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(rows)
+    data = {"DateTime": pd.date_range("2020-01-01", periods=rows, freq="min").strftime("%Y-%m-%d %H:%M:%S")}
+    for c in range(columns):
+        period = rng.uniform(60, 1440)
+        data[f"Sensor {c + 1}"] = 100 + 50 * np.sin(2 * np.pi * t / period + rng.uniform(0, 6.3)) + rng.normal(0, 2, rows)
+    pd.DataFrame(data).to_csv(path, index=False)
+
+
+def bench_files(port: int) -> List[str]:
+    """Файлы модулей, которые создаёт установка на порту port"""
+    return [
+        os.path.join(RECIEVER_DIR, f"data_port_{port}.csv"),
+        os.path.join(RECIEVER_DIR, f"data_port_{port}_long.csv"),
+        ring_path(RECIEVER_DIR, port),
+        os.path.join(BUSINESS_DIR, f"data_out_{port}.csv"),
+        os.path.join(BUSINESS_DIR, f"data_out_{port}_long.csv"),
+        parquet_path(os.path.join(BUSINESS_DIR, f"data_out_{port}_long.csv")),
+    ] + [rollup_path(BUSINESS_DIR, f"data_out_{port}", resolution) for resolution, _, _ in RESOLUTIONS]
+
+
+def remove_files(ports: List[int]) -> None:
+    for port in ports:
+        for path in bench_files(port):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+
+
+def history_rows(port: int) -> int:
+    """Сколько строк в заполненной истории Business (CSV или Parquet) - читается только DateTime"""
+    try:
+        return len(read_history(history_path(os.path.join(BUSINESS_DIR, f"data_out_{port}_long.csv")), ["DateTime"]))
+    except (OSError, ValueError):
+        return 0
+
+
+def set_business_period(period_ms: int, timeout: float = 30) -> None:
+    """Период тика Business через его HTTP-API (ждём, пока API поднимется)"""
+    body = json.dumps({"period_ms": period_ms}).encode()
+    t0 = time.time()
+    while True:
+        try:
+            request = urllib.request.Request(BUSINESS_API, data=body, headers={"Content-Type": "application/json"})
+            urllib.request.urlopen(request, timeout=2).read()
+            return
+        except OSError:
+            if time.time() - t0 > timeout:
+                raise RuntimeError(f"Business API не ответил за {timeout} с")
+            time.sleep(0.5)
+
+
+def ring_rows(port: int) -> int:
+    """Сколько строк порта Reciever записал в кольцевой буфер за всё время"""
+    try:
+        return ring_reader(ring_path(RECIEVER_DIR, port)).cursor
+    except (OSError, ValueError):
+        return 0
+
+
+class output_watcher:
+    """Следит за data_out_<port>.csv и запоминает, когда каждая строка была записана впервые"""
+
+    def __init__(self, port: int):
+        self.path = os.path.join(BUSINESS_DIR, f"data_out_{port}.csv")
+        self.mtime = None
+        self.written = {}  # {timestamp_ns: время записи}
+
+    def poll(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self.mtime:
+                return
+            with open(self.path, newline="") as file:
+                rows = list(csv.reader(file))[1:]
+        except (OSError, csv.Error):
+            return
+        self.mtime = mtime
+        for row in rows:
+            if not row:
+                continue
+            try:
+                stamp = int(np.datetime64(row[0], "ns").astype(np.int64))
+            except ValueError:
+                continue
+            self.written.setdefault(stamp, mtime)
+
+
+def read_send_log(path: str) -> Dict[int, Dict[int, float]]:
+    """Журнал Simulator-а: {port: {timestamp_ns: время отправки}}"""
+    sent = {}
+    if not os.path.exists(path):
+        return sent
+    with open(path) as file:
+        for line in file:
+            try:
+                port, stamp, sent_at = line.split(",")
+                sent.setdefault(int(port), {}).setdefault(int(stamp), float(sent_at))
+            except ValueError:
+                continue  # недописанная строка
+    return sent
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values)
+    return {
+        "count": int(values.size),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Регрессии относительно прошлого прогона"""
+    problems = []
+    for stage, stats in result["stages"].items():
+        old = baseline.get("stages", {}).get(stage, {}).get("rows_per_s")
+        if old and stats["rows_per_s"] < old * (1 - tolerance):
+            problems.append(f"{stage}: {stats['rows_per_s']:.1f} строк/с против {old:.1f}")
+    old_p99 = baseline.get("latency_ms", {}).get("p99")
+    new_p99 = result["latency_ms"].get("p99")
+    if old_p99 and new_p99 is not None and new_p99 > old_p99 * (1 + tolerance):
+        problems.append(f"p99 задержки: {new_p99:.0f} мс против {old_p99:.0f} мс")
+    return problems
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Замер пропускной способности и задержки конвейера")
+    p.add_argument("--installations", type=int, default=2, help="Число синтетических установок.")
+    p.add_argument("--columns", type=int, default=6, help="Число колонок у каждой установки.")
+    p.add_argument("--rate", type=float, default=5.0, help="Строк в секунду на установку.")
+    p.add_argument("--chance", type=float, default=0.05, help="Вероятность пропуска значения.")
+    p.add_argument("--chance-seq", type=float, default=1.0,
+                   help="Мультипликатор вероятности пропуска после пропуска (1 - независимые пропуски).")
+    p.add_argument("--batch-rows", type=int, default=1, help="Строк в одном сообщении Simulator-а.")
+    p.add_argument("--wire", choices=["binary", "json"], default="binary", help="Формат пакетов.")
+    p.add_argument("--transport", choices=["csv", "feed", "ring"], default="csv", help="BUSINESS_TRANSPORT.")
+    p.add_argument("--sink", choices=["csv", "parquet"], default="csv", help="BUSINESS_SINK (история Business).")
+    p.add_argument("--business-period-ms", type=int, default=1000, help="Период тика Business (не меньше 100).")
+    p.add_argument("--base-port", type=int, default=18100, help="Порт первой установки.")
+    p.add_argument("--warmup", type=float, default=10, help="Прогрев перед замером, секунд.")
+    p.add_argument("--duration", type=float, default=60, help="Длительность замера, секунд.")
+    p.add_argument("--poll-ms", type=int, default=20, help="Период опроса файлов Business.")
+    p.add_argument("--output", default=None, help="JSON с результатом (по умолчанию benchmark_<время>.json).")
+    p.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения.")
+    p.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение относительно --baseline.")
+    p.add_argument("--keep-files", action="store_true", help="Не удалять файлы модулей после замера.")
+    args = p.parse_args()
+
+    ports = [args.base_port + i for i in range(args.installations)]
+    workdir = tempfile.mkdtemp(prefix="restoringvalues-bench-")
+    rows = int(args.rate * (args.warmup + args.duration) * 1.5) + 1000  # без перехода через начало файла
+
+    # Синтетические установки без тестового порта: по одной задаче Business на установку
+    installations = []
+    for i, port in enumerate(ports):
+        source = os.path.join(workdir, f"source_{port}.csv")
+        make_source(source, rows, args.columns, seed=i)
+        installations.append({"name": f"Бенчмарк {i + 1}", "port_main": port, "file": source,
+                              "chance": args.chance, "chance_seq": args.chance_seq, "interval": 1000})
+    registry = os.path.join(workdir, "installations.json")
+    with open(registry, "w", encoding="utf-8") as file:
+        json.dump({"installations": installations}, file, ensure_ascii=False)
+
+    send_log = os.path.join(workdir, "send_log.csv")
+    env = dict(os.environ)
+    env.update({
+        REGISTRY_ENV: registry,
+        "WEBSOCKET_HOST": "127.0.0.1",
+        "WEBSOCKET_WIRE": args.wire,
+        "SIMULATOR_SPEED": str(args.rate),  # interval 1000 мс / speed = 1 / rate секунд на строку
+        "SIMULATOR_BATCH_ROWS": str(args.batch_rows),
+        "SIMULATOR_SEND_LOG": send_log,
+        "BUSINESS_TRANSPORT": args.transport,
+        "BUSINESS_SINK": args.sink,
+    })
+
+    remove_files(ports)
+    procs: List[subprocess.Popen] = []
+    logs = {name: open(os.path.join(workdir, f"{name}.log"), "w") for name in ("simulator", "reciever", "business")}
+    print(f"Установки: {ports}, колонок: {args.columns}, {args.rate} строк/с на установку, логи в {workdir}")
+
+    try:
+        procs.append(start("Simulator/simulator.py", env, logs["simulator"]))
+        time.sleep(1.5)
+        procs.append(start("Reciever/reciever.py", env, logs["reciever"]))
+        procs.append(start("Business/business.py", env, logs["business"]))
+        set_business_period(max(args.business_period_ms, 100))
+
+        watchers = {port: output_watcher(port) for port in ports}
+
+        def poll_until(deadline: float) -> None:
+            while time.time() < deadline:
+                for watcher in watchers.values():
+                    watcher.poll()
+                for pr in procs:
+                    if pr.poll() is not None:
+                        raise RuntimeError(f"Процесс завершился: {pr.args} code={pr.returncode}")
+                time.sleep(args.poll_ms / 1000)
+
+        poll_until(time.time() + args.warmup)
+        t_start = time.time()
+        rings_start = {port: ring_rows(port) for port in ports}
+        poll_until(t_start + args.duration)
+        t_end = time.time()
+        rings_end = {port: ring_rows(port) for port in ports}
+    finally:
+        stop(procs)
+        for log in logs.values():
+            log.close()
+
+    # Сводим результаты окна замера [t_start, t_end)
+    sent = read_send_log(send_log)
+    elapsed = t_end - t_start
+    sent_rows = sum(1 for port in ports for sent_at in sent.get(port, {}).values() if t_start <= sent_at < t_end)
+    recieved_rows = sum(rings_end[port] - rings_start[port] for port in ports)
+    latencies, written_rows = [], 0
+    for port in ports:
+        for stamp, written_at in watchers[port].written.items():
+            if not t_start <= written_at < t_end:
+                continue
+            written_rows += 1
+            sent_at = sent.get(port, {}).get(stamp)
+            if sent_at is not None:
+                latencies.append((written_at - sent_at) * 1000)
+
+    result = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t_start)),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "keep_files")},
+        "duration_s": elapsed,
+        "stages": {
+            "simulator": {"rows": sent_rows, "rows_per_s": sent_rows / elapsed},
+            "reciever": {"rows": recieved_rows, "rows_per_s": recieved_rows / elapsed},
+            "business": {"rows": written_rows, "rows_per_s": written_rows / elapsed},
+        },
+        "latency_ms": percentiles(latencies),
+        "history_rows": sum(history_rows(port) for port in ports),
+    }
+
+    output = args.output or f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+
+    for stage, stats in result["stages"].items():
+        print(f"{stage:>10}: {stats['rows']} строк, {stats['rows_per_s']:.1f} строк/с")
+    latency = result["latency_ms"]
+    if latency["count"]:
+        print(f"Задержка, мс: p50 {latency['p50']:.0f}, p90 {latency['p90']:.0f}, p99 {latency['p99']:.0f}, max {latency['max']:.0f}")
+    print(f"Строк в истории Business ({args.sink}): {result['history_rows']}")
+    print(f"Результат записан в {output}")
+
+    if not args.keep_files:
+        remove_files(ports)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            problems = compare(result, json.load(file), args.tolerance)
+        for problem in problems:
+            print(f"Регрессия: {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
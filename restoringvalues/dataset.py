@@ -0,0 +1,178 @@
+"""
+Кэш исходных файлов установок в двоичном виде.
+
+CSV один раз разбирается pandas-ом по частям (CHUNK_ROWS строк) и сохраняется рядом
+с источником в каталог <файл>.cache: матрица значений float64, метки времени
+в наносекундах эпохи (int64) и готовые строки меток в формате TIME_FORMAT для
+JSON-пакетов - сырыми массивами и meta.json с их формой. Simulator открывает
+массивы через np.memmap: в памяти процесса оказываются только отправляемые строки,
+поэтому размер исходного файла ограничен диском, а не памятью, а несколько
+процессов с одним файлом делят страницы кэша ОС.
+
+Кэш действителен, пока у источника те же размер и время изменения; если они
+поменялись, а содержимое (sha1) то же, кэш не пересобирается, а только
+запоминает новые размер и время. Переменная окружения SIMULATOR_CACHE=0
+отключает кэш (файл целиком разбирается в память при каждом запуске).
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+VERSION = 2 # Версия формата кэша: при изменении формата старые кэши пересобираются
+CACHE_ENV = "SIMULATOR_CACHE"
+CHUNK_ROWS = int(os.getenv("SIMULATOR_CHUNK_ROWS", 100000)) # Строк CSV, разбираемых за раз
+
+
+class dataset:
+    names = None # Список колонок значений
+    values = None # Матрица значений (строк x колонок), float64
+    stamps = None # Метки времени строк в наносекундах эпохи (до секунд), int64
+    labels = None # Метки времени строк строками TIME_FORMAT (байты ASCII)
+
+    def __init__(self, names, values, stamps, labels):
+        self.names = list(names)
+        self.values = values
+        self.stamps = stamps
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.values)
+
+
+def cache_path(csv_path):
+    return csv_path + ".cache"
+
+
+def file_hash(path):
+    """sha1 содержимого файла"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_chunks(csv_path, time_format=TIME_FORMAT, chunk_rows=CHUNK_ROWS):
+    """
+    Разобрать исходный CSV по частям: первая колонка - время, остальные - значения;
+    строки с пропусками отбрасываются.
+
+    :return: генератор (names, values, stamps, labels) по частям
+    """
+    for data in pd.read_csv(csv_path, chunksize=chunk_rows):
+        data = data.dropna()
+        times = pd.to_datetime(data.iloc[:, 0]).dt.floor("s")
+        yield (list(data.columns[1:]),
+               data.iloc[:, 1:].to_numpy(dtype=np.float64),
+               times.values.astype("datetime64[ns]").astype(np.int64),
+               times.dt.strftime(time_format).to_numpy(dtype=bytes))
+
+
+def parse_csv(csv_path, time_format=TIME_FORMAT):
+    """Разобрать исходный CSV целиком в память"""
+    chunks = list(parse_chunks(csv_path, time_format))
+    return dataset(chunks[0][0], *(np.concatenate([chunk[i] for chunk in chunks]) for i in (1, 2, 3)))
+
+
+def build_cache(path, csv_path, stat, time_format):
+    """Разобрать CSV по частям в каталог кэша (через временный каталог)"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        write_arrays(tmp, csv_path, stat, time_format)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def write_arrays(tmp, csv_path, stat, time_format):
+    """Записать массивы и meta.json кэша в каталог tmp"""
+    names, rows, width = None, 0, 0
+    with open(os.path.join(tmp, "values.bin"), "wb") as values, \
+            open(os.path.join(tmp, "stamps.bin"), "wb") as stamps, \
+            open(os.path.join(tmp, "labels.bin"), "wb") as labels:
+        for chunk_names, chunk_values, chunk_stamps, chunk_labels in parse_chunks(csv_path, time_format):
+            if names is None:
+                names, width = chunk_names, chunk_labels.dtype.itemsize
+            if chunk_labels.dtype.itemsize > width:
+                raise ValueError(f"Формат времени {time_format!r} даёт строки разной длины")
+            values.write(chunk_values.tobytes())
+            stamps.write(chunk_stamps.tobytes())
+            labels.write(chunk_labels.astype(f"S{width}").tobytes())
+            rows += len(chunk_values)
+
+    meta = {"version": VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "source_hash": file_hash(csv_path), "time_format": time_format,
+            "names": names, "rows": rows, "label_width": width}
+    write_meta(tmp, meta)
+
+
+def write_meta(path, meta):
+    tmp = os.path.join(path, f"meta.json.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as file:
+        json.dump(meta, file, ensure_ascii=False)
+    os.replace(tmp, os.path.join(path, "meta.json"))
+
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def cache_valid(path, meta, csv_path, stat, time_format):
+    """Соответствует ли кэш источнику (если источник только трогали - обновляет meta.json)"""
+    if meta is None or meta.get("version") != VERSION or meta.get("time_format") != time_format:
+        return False
+    if meta["size"] == stat.st_size and meta["mtime_ns"] == stat.st_mtime_ns:
+        return True
+    # Файл трогали, но содержимое могло не измениться
+    if meta["size"] == stat.st_size and file_hash(csv_path) == meta["source_hash"]:
+        meta["mtime_ns"] = stat.st_mtime_ns
+        try:
+            write_meta(path, meta)
+        except OSError as e:
+            print(f"Не удалось обновить кэш {path}: {e}")
+        return True
+    return False
+
+
+def open_cache(path, meta):
+    """Массивы кэша через np.memmap (пустой файл np.memmap открыть не может)"""
+    rows, columns = meta["rows"], len(meta["names"])
+
+    def open_array(name, dtype, shape):
+        if rows == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=shape)
+
+    return dataset(meta["names"],
+                   open_array("values.bin", np.float64, (rows, columns)),
+                   open_array("stamps.bin", np.int64, (rows,)),
+                   open_array("labels.bin", f"S{meta['label_width']}", (rows,)))
+
+
+def load_dataset(csv_path, time_format=TIME_FORMAT):
+    """Данные исходного файла: из кэша, если он действителен, иначе с предварительной сборкой кэша"""
+    if os.getenv(CACHE_ENV, "1") == "0":
+        return parse_csv(csv_path, time_format)
+
+    path = cache_path(csv_path)
+    stat = os.stat(csv_path)
+    if not cache_valid(path, read_meta(path), csv_path, stat, time_format):
+        print(f"Собираю кэш {path}")
+        try:
+            build_cache(path, csv_path, stat, time_format)
+        except OSError as e:
+            print(f"Не удалось записать кэш {path}: {e}")
+            return parse_csv(csv_path, time_format)
+    return open_cache(path, read_meta(path))
@@ -0,0 +1,120 @@
+"""
+Прореживание рядов графиков GUI на стороне сервера.
+
+Браузеру не нужно больше пары точек на пиксель графика, поэтому ряд длиннее
+бюджета (ширина графика * POINTS_PER_PIXEL) прореживается:
+    lttb   - Largest-Triangle-Three-Buckets: сохраняет форму ряда, когда точек
+             на пиксель немного;
+    minmax - минимум и максимум в каждой корзине: дешевле и не теряет выбросы,
+             когда точек на пиксель много (широкий диапазон дат).
+Метод выбирается по плотности: больше MINMAX_DENSITY точек на пиксель - minmax.
+
+Точки, которые нельзя потерять, сохраняются всегда: границы пропусков (NaN и
+соседние с ним точки - разрыв линии остаётся на месте) и переданные keep
+(например, заполненные Business-ом значения).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+POINTS_PER_PIXEL = float(os.getenv("GUI_POINTS_PER_PIXEL", 2)) # Бюджет точек на пиксель ширины графика
+DEFAULT_WIDTH = 1000 # Ширина графика в пикселях, пока браузер её не сообщил
+MAX_WIDTH = 4000 # Больше пикселей не учитывается (LTTB идёт по корзинам циклом)
+MINMAX_DENSITY = 8 # Точек на пиксель, начиная с которых используется minmax
+
+
+def numeric(x):
+    """Метки ряда как float (время - в наносекундах)"""
+    x = np.asarray(x)
+    if x.dtype.kind in "mM":
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    if x.dtype.kind in "OUS":
+        return pd.to_datetime(x).values.astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb(x, y, points):
+    """Индексы points точек ряда по алгоритму LTTB (первая и последняя - всегда)"""
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64) # границы points - 2 корзин
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        # Точка корзины, образующая с выбранной и средним следующей корзины наибольший треугольник
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y, buckets):
+    """Индексы минимума и максимума в каждой из buckets равных по числу точек корзин"""
+    n = len(y)
+    if 2 * buckets >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    ids = np.repeat(np.arange(buckets), np.diff(edges))
+    order = np.lexsort((y, ids)) # внутри корзины - по возрастанию значения
+    return np.union1d(order[edges[:-1]], order[edges[1:] - 1])
+
+
+def gap_edges(y):
+    """Индексы, сохраняющие пропуски видимыми: первый NaN каждой серии и соседние с серией точки"""
+    missing = np.isnan(y)
+    if not missing.any():
+        return np.empty(0, dtype=np.int64)
+    change = np.diff(missing.astype(np.int8))
+    starts = np.flatnonzero(change == 1) + 1
+    ends = np.flatnonzero(change == -1) # последний NaN серии
+    if missing[0]:
+        starts = np.concatenate([[0], starts])
+    if missing[-1]:
+        ends = np.concatenate([ends, [len(y) - 1]])
+    edges = np.concatenate([starts, starts - 1, ends + 1])
+    return edges[(edges >= 0) & (edges < len(y))]
+
+
+def budget(width):
+    """Бюджет точек для графика шириной width пикселей"""
+    return max(int(min(width or DEFAULT_WIDTH, MAX_WIDTH) * POINTS_PER_PIXEL), 3)
+
+
+def thin(x, y, width=None, keep=None):
+    """
+    Проредить ряд под график шириной width пикселей.
+
+    :param keep: булева маска точек, которые нужно сохранить (например, заполненные)
+    :return: (x, y) прореженного ряда (без изменений, если он укладывается в бюджет)
+    """
+    points = budget(width)
+    if len(y) <= points:
+        return x, y
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+
+    finite = np.flatnonzero(np.isfinite(y))
+    if len(finite) > MINMAX_DENSITY * points:
+        chosen = finite[minmax(y[finite], points // 2)]
+    else:
+        chosen = finite[lttb(numeric(x[finite]), y[finite], points)]
+
+    extra = [gap_edges(y)]
+    if keep is not None:
+        extra.append(np.flatnonzero(np.asarray(keep)))
+    index = np.union1d(chosen, np.concatenate(extra).astype(np.int64))
+    return x[index], y[index]
+
+
+def imputed_mask(times, raw_times, raw_values):
+    """
+    Какие строки заполненного ряда были пропусками в сырых данных:
+    метка времени times совпадает с меткой сырой строки, где значение - NaN.
+    """
+    missing = pd.to_datetime(pd.Series(raw_times)[np.isnan(np.asarray(raw_values, dtype=np.float64))])
+    return pd.to_datetime(pd.Series(times)).isin(missing).to_numpy()
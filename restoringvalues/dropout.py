@@ -0,0 +1,96 @@
+"""
+Генератор пропусков данных с серийными выпадениями (модель Гильберта-Эллиота).
+
+Каждая колонка - цепь Маркова из двух состояний: "норма" (значение приходит)
+и "сбой" (значение пропадает). Параметры цепи подбираются так, что средняя доля
+пропусков равна chance, а вероятность пропуска сразу после пропуска равна
+chance * chance_seq (chance_seq = 1 - независимые пропуски, как раньше).
+Поверх колонок работает такая же цепь для всей строки: с вероятностью
+outage_chance начинается отказ установки средней длины outage_length строк,
+на время которого пропадают все колонки.
+
+Серии генерируются сразу длинами (геометрическое распределение) через NumPy,
+маски заранее считаются блоками по block строк. Состояние цепей переносится
+между блоками; при одинаковых seed и block последовательность масок одна и та же,
+сколько бы строк ни запрашивалось за раз.
+"""
+import numpy as np
+
+RUNS = 64 # Серий за один вызов генератора (чётное число)
+
+
+def markov_runs(rng, state, enter, leave, count):
+    """
+    Маска count шагов цепи "норма/сбой", начиная с состояния state (True - сбой).
+
+    :param enter: вероятность перейти из нормы в сбой
+    :param leave: вероятность выйти из сбоя
+    :return: (маска длины count, состояние шага, следующего за маской)
+    """
+    if not state and enter <= 0 or state and leave <= 0:
+        return np.full(count, state), state  # поглощающее состояние
+
+    # Благодаря отсутствию памяти текущая серия просто начинается заново;
+    # вероятности выхода чередуются начиная с текущего состояния (в пачке чётное число серий)
+    exits = np.resize([leave, enter] if state else [enter, leave], RUNS)
+    lengths, total = [], 0
+    while total <= count:
+        lengths.append(rng.geometric(exits))
+        total += int(lengths[-1].sum())
+    lengths = np.concatenate(lengths)
+    full = np.repeat(np.resize([state, not state], len(lengths)), lengths)
+    return full[:count], bool(full[count])
+
+
+class dropout_model:
+    chance = None # Средняя доля пропусков в колонке
+    chance_seq = None # Мультипликатор вероятности пропуска, если предыдущая запись - пропуск
+    outage_chance = None # Вероятность начала отказа всей установки на строке
+    outage_length = None # Средняя длина отказа всей установки, строк
+    block = None # Строк в заранее посчитанном блоке масок
+
+    def __init__(self, columns, chance, chance_seq=1.0, outage_chance=0.0, outage_length=1.0, seed=None, block=1024):
+        self.columns = columns
+        self.chance = chance
+        self.chance_seq = chance_seq
+        self.outage_chance = outage_chance
+        self.outage_length = outage_length
+        self.block = block
+        self.rng = np.random.default_rng(seed)
+
+        # Пропуск после пропуска - с вероятностью chance * chance_seq, выход из сбоя - остальное;
+        # вход в сбой такой, чтобы доля времени в сбое была равна chance
+        if chance >= 1:
+            self.enter, self.leave = 1.0, 0.0
+        else:
+            self.leave = max(1.0 - chance * chance_seq, 1e-6)
+            self.enter = min(chance * self.leave / (1.0 - chance), 1.0)
+        self.outage_leave = 1.0 / max(outage_length, 1.0)
+
+        # Начальное состояние - из стационарного распределения цепей
+        self.state = self.rng.random(columns) < chance
+        self.outage_state = bool(self.rng.random() < self.stationary_outage())
+        self.masks = np.zeros((0, columns), dtype=bool)
+
+    def stationary_outage(self):
+        """Доля времени, которую установка проводит в отказе"""
+        if self.outage_chance <= 0:
+            return 0.0
+        return self.outage_chance / (self.outage_chance + self.outage_leave)
+
+    def generate(self, count):
+        """Посчитать маски следующих count строк (True - пропуск)"""
+        masks = np.empty((count, self.columns), dtype=bool)
+        for c in range(self.columns):
+            masks[:, c], self.state[c] = markov_runs(self.rng, self.state[c], self.enter, self.leave, count)
+        outage, self.outage_state = markov_runs(self.rng, self.outage_state, self.outage_chance, self.outage_leave, count)
+        masks |= outage[:, None]
+        return masks
+
+    def take(self, count):
+        """Маски пропусков следующих count строк из заранее посчитанного блока"""
+        if len(self.masks) < count:
+            blocks = -(-(count - len(self.masks)) // self.block)
+            self.masks = np.concatenate([self.masks] + [self.generate(self.block) for _ in range(blocks)])
+        masks, self.masks = self.masks[:count], self.masks[count:]
+        return masks
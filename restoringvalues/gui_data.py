@@ -0,0 +1,215 @@
+"""
+Кэш данных GUI и дельта-обновления графиков.
+
+frame_cache - общий для всех сессий процесса кэш разобранных данных (CSV, история
+кольцевого буфера) с версией у каждого ключа: CSV перечитывается только при смене
+времени изменения или размера файла, и один раз на изменение, сколько бы панелей ни
+было открыто - остальные сессии ждут первой и берут её результат. Объём кэша
+ограничен GUI_CACHE_MB мегабайтами, при превышении вытесняются давно не читанные
+ключи (LRU), в том числе других установок.
+Шапка CSV (nrows=0) хранится отдельным ключом.
+
+series_cache помнит последний ряд (x, y) каждого графика и его версию (token).
+Клиент хранит версию, которую уже нарисовал (dcc.Store); если с тех пор в ряд
+только дописаны точки справа, клиенту уходят лишь они (extendData), если клиент
+уже в курсе - ничего, иначе - фигура целиком. Модуль не зависит от Dash: приложения
+сами переводят ответ в dash.no_update / extendData.
+
+batch_table собирает таблицу обработки батча одним соединением заполненного и
+исходного файлов по DateTime, table_page отдаёт из неё одну страницу в нужном
+порядке (серверные страницы и сортировка DataTable, page_action="custom").
+"""
+import itertools
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+SAME = "same" # Клиент уже показывает этот ряд
+EXTEND = "extend" # Клиенту нужно дописать новые точки
+FULL = "full" # Клиенту нужна фигура целиком
+
+GUI_CACHE_MB = float(os.getenv("GUI_CACHE_MB", 256)) # Ограничение общего кэша GUI
+SERIES_MAX = 512 # Сколько рядов графиков помнить для дельта-обновлений
+
+
+def frame_bytes(value):
+    """Сколько памяти занимает значение кэша (DataFrame - вместе со строками)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return 0
+
+
+class frame_cache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # Формат: {key: (version, value, nbytes)}, в порядке обращений
+        self.loading = {} # Блокировки загрузки по ключам: ключ загружается одной сессией
+        self.total = 0 # Байт в кэше
+        self.lock = threading.Lock()
+
+    def lookup(self, key, version):
+        """Значение нужной версии из кэша или None (вызывается под self.lock)"""
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get(self, key, version, load):
+        """
+        Значение ключа нужной версии: из кэша или load() (одна загрузка на версию
+        на весь процесс - параллельные запросы ждут её результата).
+        """
+        with self.lock:
+            entry = self.lookup(key, version)
+            if entry is not None:
+                return entry[1]
+            key_lock = self.loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                entry = self.lookup(key, version)
+            if entry is not None:
+                return entry[1]  # пока ждали, значение загрузила другая сессия
+
+            value = load()
+            nbytes = frame_bytes(value)
+            with self.lock:
+                old = self.entries.pop(key, None)
+                if old is not None:
+                    self.total -= old[2]
+                self.entries[key] = (version, value, nbytes)
+                self.total += nbytes
+                self.evict()
+        return value
+
+    def evict(self):
+        """Вытеснить давно не читанные ключи сверх max_bytes (последний прочитанный остаётся)"""
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            key, (_, _, nbytes) = self.entries.popitem(last=False)
+            self.loading.pop(key, None)
+            self.total -= nbytes
+
+    def read(self, path, nrows=None):
+        """
+        CSV по пути (nrows - только первые строки): из кэша, если файл не менялся.
+
+        :return: (DataFrame или None, если файла нет; версия файла)
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None, None
+        version = (stat.st_mtime_ns, stat.st_size)
+        return self.get((path, nrows), version, lambda: pd.read_csv(path, nrows=nrows)), version
+
+
+shared_cache = frame_cache(int(GUI_CACHE_MB * 2**20)) # Общий кэш всех сессий процесса
+
+
+def same_values(a, b):
+    """Совпадают ли ряды (NaN равны NaN)"""
+    a, b = np.asarray(a), np.asarray(b)
+    if a.shape != b.shape:
+        return False
+    if a.dtype.kind == "f" and b.dtype.kind == "f":
+        return np.array_equal(a, b, equal_nan=True)
+    return np.array_equal(a, b)
+
+
+class series_cache:
+    def __init__(self, max_series=SERIES_MAX):
+        self.max_series = max_series
+        self.series = OrderedDict() # Формат: {key: (token, previous_token, x, y, appended)}
+        self.tokens = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def appended(self, old_x, old_y, x, y):
+        """Сколько точек дописано справа к старому ряду (None - ряд изменился не только справа)"""
+        if len(old_x) == 0 or len(x) == 0:
+            return None
+        added = int(np.count_nonzero(x > old_x[-1]))
+        kept = len(x) - added
+        if kept > len(old_x) or not np.all(x[kept:] > old_x[-1]):
+            return None
+        if not same_values(x[:kept], old_x[len(old_x) - kept:]) or not same_values(y[:kept], old_y[len(old_y) - kept:]):
+            return None
+        return added
+
+    def delta(self, key, x, y, client_token):
+        """
+        Что отправить клиенту, у которого нарисована версия client_token ряда key.
+
+        :param x: отсортированные по возрастанию метки ряда (numpy/pandas)
+        :return: (SAME / EXTEND / FULL, x и y для отправки, новая версия ряда)
+        """
+        x, y = np.asarray(x), np.asarray(y)
+        with self.lock:
+            entry = self.series.get(key)
+            if entry is None:
+                entry = self.series[key] = (next(self.tokens), None, x, y, None)
+            elif not (same_values(entry[2], x) and same_values(entry[3], y)):
+                entry = self.series[key] = (next(self.tokens), entry[0], x, y,
+                                            self.appended(entry[2], entry[3], x, y))
+            self.series.move_to_end(key)
+            if len(self.series) > self.max_series:
+                self.series.popitem(last=False)  # клиенту давно не читанного ряда уйдёт фигура целиком
+        token, previous, _, _, added = entry
+
+        if client_token == token:
+            return SAME, None, None, token
+        if client_token is not None and client_token == previous and added:
+            return EXTEND, x[-added:], y[-added:], token
+        return FULL, x, y, token
+
+
+def series_key(*parts):
+    """Ключ ряда графика для кэша и dcc.Store (строка JSON)"""
+    return json.dumps([str(part) for part in parts], ensure_ascii=False)
+
+
+def batch_table(out, source, column):
+    """
+    Таблица обработки батча: строки заполненного файла out со значением column
+    и исходным значением из source в строке с тем же DateTime.
+
+    :return: DataFrame с колонками DateTime, input, value, imputed ("yes" - значение
+             в исходной строке пропущено и заполнено)
+    """
+    table = pd.DataFrame({
+        "DateTime": out["DateTime"],
+        "key": pd.to_datetime(out["DateTime"], errors="coerce"),
+        "value": out[column],
+    })
+    if column in source.columns:
+        inputs = pd.DataFrame({
+            "key": pd.to_datetime(source["DateTime"], errors="coerce"),
+            "input": source[column],
+        }).drop_duplicates(subset="key", keep="last")
+        table = table.merge(inputs, on="key", how="left", indicator=True)
+        imputed = (table["_merge"] == "both") & table["input"].isna() & table["value"].notna()
+    else:
+        table["input"], imputed = np.nan, False
+    table["imputed"] = np.where(imputed, "yes", "")
+    return table[["DateTime", "input", "value", "imputed"]]
+
+
+def table_page(table, page_current, page_size, sort_by):
+    """
+    Страница таблицы для DataTable с page_action="custom" / sort_action="custom".
+
+    :param sort_by: [{"column_id": ..., "direction": "asc" | "desc"}] от DataTable
+    :return: (записи страницы, число страниц)
+    """
+    for sort in reversed(sort_by or []):
+        if sort["column_id"] in table.columns:
+            table = table.sort_values(sort["column_id"], ascending=sort["direction"] == "asc",
+                                      kind="stable", na_position="last")
+    page_current, page_size = page_current or 0, page_size or 10
+    page = table.iloc[page_current * page_size:(page_current + 1) * page_size]
+    page = page.astype(object).where(page.notna(), None)  # NaN -> пустая ячейка
+    return page.to_dict("records"), max(-(-len(table) // page_size), 1)
@@ -0,0 +1,181 @@
+"""
+Push-уведомления GUI об изменении данных установок (Server-Sent Events).
+
+Источник событий - прямая раздача Reciever-а (ws://RECIEVER_FEED_HOST:RECIEVER_FEED_PORT):
+change_feed держит на процесс GUI одно подключение, подписанное без строк
+({"subscribe": [...], "rows": false}) на порты установок, которые сейчас кто-то
+смотрит. Reciever присылает событие rows на каждую новую строку порта, а после
+записи результатов Business (data_source.write_out) - событие filled. По событию
+change_feed будит подписчиков тех установок, которым оно нужно. Каждая вкладка
+держит один поток SSE (/updates?installation=...) и получает событие с номером
+версии; callback-и Dash запускаются только по нему. Без вкладок подключение
+закрыто и поток спит.
+
+Если раздача выключена или Reciever недоступен, change_feed опрашивает версии
+источников (курсор буфера, время изменения и размер файлов) каждые GUI_PUSH_MS
+миллисекунд и раз в RETRY_S секунд снова пробует подключиться.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+import websockets
+
+PUSH_MS = float(os.getenv("GUI_PUSH_MS", 50)) # Период опроса версий источников, если раздача Reciever-а недоступна
+RETRY_S = 5 # Через сколько секунд опроса снова подключаться к раздаче
+KEEPALIVE_S = 15 # Комментарий в поток SSE, если событий нет (чтобы прокси не закрыл соединение)
+
+
+def file_version(path):
+    """Версия файла: (время изменения, размер) или None, если файла нет"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class change_feed:
+    def __init__(self, version, events=None, uri=None, interval=PUSH_MS / 1000):
+        """
+        :param version: функция topic -> версия источников темы (любое сравнимое значение),
+                        нужна для опроса, когда раздача недоступна
+        :param events: функция topic -> события раздачи, которые меняют тему:
+                       множество пар (порт, "rows" или "filled")
+        :param uri: адрес прямой раздачи Reciever-а (None - только опрос)
+        """
+        self.version = version
+        self.events = events
+        self.uri = uri if events is not None else None
+        self.interval = interval
+        self.subscribers = {} # Формат: {topic: число подписчиков}
+        self.versions = {} # Формат: {topic: (версия источников, номер изменения)}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.wakeup = None # (цикл, asyncio.Event) подключения к раздаче, пока оно открыто
+
+    def changed(self, topics):
+        """Отметить изменение тем и разбудить их подписчиков (вызывается под self.condition)"""
+        for topic in topics:
+            if topic in self.subscribers:
+                old = self.versions.get(topic)
+                self.versions[topic] = (old[0] if old else None, old[1] + 1 if old else 1)
+        if topics:
+            self.condition.notify_all()
+
+    def watch(self):
+        """Поток событий: слушать раздачу Reciever-а, а если она недоступна - опрашивать версии"""
+        while True:
+            with self.condition:
+                while not self.subscribers:
+                    self.condition.wait()
+
+            if self.uri is not None:
+                try:
+                    asyncio.run(self.listen())
+                    continue  # подписчики разошлись
+                except Exception as e:
+                    print(f"Раздача {self.uri} недоступна ({e!r}), опрашиваем источники {RETRY_S} с")
+            self.poll(RETRY_S if self.uri is not None else None)
+
+    async def listen(self):
+        """Будить подписчиков по событиям раздачи, пока они есть"""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        async with websockets.connect(self.uri) as websocket:
+            with self.condition:
+                self.wakeup = (loop, wake)
+                self.changed(list(self.subscribers))  # пока подключались, события не приходили
+            try:
+                subscribed = set()
+                receive = None
+                while True:
+                    with self.condition:
+                        topics = list(self.subscribers)
+                    if not topics:
+                        return
+                    ports = {port for topic in topics for port, _ in self.events(topic)} - subscribed
+                    if ports:
+                        await websocket.send(json.dumps({"subscribe": sorted(ports), "rows": False}))
+                        subscribed |= ports
+
+                    receive = receive or asyncio.ensure_future(websocket.recv())
+                    waiter = asyncio.ensure_future(wake.wait())
+                    done, _ = await asyncio.wait({receive, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                    waiter.cancel()
+                    wake.clear()
+                    if receive in done:
+                        event = json.loads(receive.result())
+                        event = (event.get("port"), event.get("changed"))
+                        receive = None
+                        with self.condition:
+                            self.changed([topic for topic in self.subscribers if event in self.events(topic)])
+            finally:
+                with self.condition:
+                    self.wakeup = None
+                if receive is not None:
+                    receive.cancel()
+
+    def poll(self, duration=None):
+        """Опрашивать версии источников duration секунд (None - пока есть подписчики)"""
+        until = None if duration is None else time.monotonic() + duration
+        while until is None or time.monotonic() < until:
+            with self.condition:
+                topics = list(self.subscribers)
+            if not topics:
+                return
+
+            versions = {}
+            for topic in topics:
+                try:
+                    versions[topic] = self.version(topic)
+                except Exception as e:
+                    print(f"Не удалось проверить версию {topic}: {e}")
+
+            with self.condition:
+                changed = False
+                for topic, version in versions.items():
+                    old = self.versions.get(topic)
+                    if topic in self.subscribers and (old is None or old[0] != version):
+                        self.versions[topic] = (version, old[1] + 1 if old else 1)
+                        changed = True
+                if changed:
+                    self.condition.notify_all()
+            time.sleep(self.interval)
+
+    def wake(self):
+        """Сообщить подключению к раздаче, что набор тем изменился (вызывается под self.condition)"""
+        if self.wakeup is not None:
+            loop, event = self.wakeup
+            loop.call_soon_threadsafe(event.set)
+
+    def stream(self, topic):
+        """Генератор событий SSE для одной вкладки: номер изменения данных темы"""
+        with self.condition:
+            self.subscribers[topic] = self.subscribers.get(topic, 0) + 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.watch, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+            self.wake()
+        try:
+            sent = None
+            yield "retry: 1000\n\n"
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.versions.get(topic, (None, sent))[1] != sent, KEEPALIVE_S)
+                    current = self.versions.get(topic, (None, sent))[1]
+                if current == sent:
+                    yield ": keepalive\n\n"
+                    continue
+                sent = current
+                yield f"data: {current}\n\n"
+        finally:
+            with self.condition:
+                self.subscribers[topic] -= 1
+                if not self.subscribers[topic]:
+                    del self.subscribers[topic]
+                    self.versions.pop(topic, None)
+                    self.wake()
@@ -0,0 +1,75 @@
+"""
+Реестр установок: какие установки симулируются, на каких портах и из каких файлов.
+
+По умолчанию читается restoringvalues/installations.json, другой файл можно
+указать переменной окружения RESTORINGVALUES_INSTALLATIONS. Реестр читают все
+модули (Simulator, Reciever, Business, GUI) и restoringvalues-run.
+"""
+import json
+import os
+
+REGISTRY_ENV = "RESTORINGVALUES_INSTALLATIONS"
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "installations.json")
+
+
+class installation:
+    name = None # Название установки в GUI
+    port_main = None # Порт для имитации реальной работы установки (с пропусками)
+    port_test = None # Порт для отправки данных без помех (None - без эталона и метрик)
+    file = None # Файл с исходными данными в каталоге Simulator
+    chance = None # Вероятность пропуска данных
+    chance_seq = None # Мультипликатор вероятности пропуска, если предыдущая запись - пропуск (1 - независимые)
+    outage_chance = None # Вероятность начала отказа всей установки на строке
+    outage_length = None # Средняя длина отказа всей установки, строк
+    interval = None # Время в миллисекундах между переходами на следующие строчки
+
+    def __init__(self, name, port_main, file, chance, interval, port_test=None,
+                 chance_seq=1.0, outage_chance=0.0, outage_length=1.0):
+        self.name = name
+        self.port_main = int(port_main)
+        self.port_test = None if port_test is None else int(port_test)
+        self.file = file
+        self.chance = float(chance)
+        self.interval = int(interval)
+        self.chance_seq = float(chance_seq)
+        self.outage_chance = float(outage_chance)
+        self.outage_length = float(outage_length)
+
+    @property
+    def ports(self):
+        """Порты установки: главный и, если есть, тестовый"""
+        return [self.port_main] if self.port_test is None else [self.port_main, self.port_test]
+
+    def __repr__(self):
+        return f"installation({self.name!r}, ports={self.ports}, file={self.file!r})"
+
+
+def registry_path(path=None):
+    """Путь к файлу реестра: явный, из переменной окружения или по умолчанию"""
+    return path or os.getenv(REGISTRY_ENV) or DEFAULT_PATH
+
+
+def load_installations(path=None):
+    """
+    Прочитать реестр установок.
+
+    :return: список installation в порядке файла
+    :raises ValueError: если названия или порты установок повторяются
+    """
+    with open(registry_path(path), encoding="utf-8") as file:
+        data = json.load(file)
+
+    installations = [installation(**item) for item in data["installations"]]
+
+    names = [inst.name for inst in installations]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Названия установок повторяются: {names}")
+    ports = installation_ports(installations)
+    if len(set(ports)) != len(ports):
+        raise ValueError(f"Порты установок повторяются: {ports}")
+    return installations
+
+
+def installation_ports(installations):
+    """Все порты установок в порядке реестра"""
+    return [port for inst in installations for port in inst.ports]
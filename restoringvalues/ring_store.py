@@ -0,0 +1,144 @@
+"""
+Кольцевой буфер истории порта в бинарном файле, отображаемом в память.
+
+Формат файла (little-endian):
+    заголовок (header_size байт, кратно 4096):
+        0   magic       8 байт  b"RVRING01"
+        8   header_size int64
+        16  capacity    int64   сколько строк помещается в кольцо
+        24  width       int64   число колонок значений
+        32  cursor      int64   сколько строк записано за всё время
+        40  names_len   int64
+        48  names       JSON со списком имён колонок
+    timestamps: int64[capacity]          - время строки в наносекундах эпохи (NaT = int64 min)
+    values:     float64[capacity, width] - значения, NaN на месте пропусков
+
+Пишет Reciever (ring_writer), читают Business и GUI (ring_reader) -
+без разбора текста, последние строки отдаются видами на отображённый файл.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"RVRING01"
+PAGE = 4096
+NAT = np.iinfo(np.int64).min
+
+
+def ring_path(directory, port):
+    """Путь к кольцевому буферу порта в каталоге Reciever-а"""
+    return os.path.join(directory, f"ring_port_{port}.bin")
+
+
+def parse_timestamp(timestamp):
+    """Метка времени пакета в наносекунды эпохи (NaT, если разобрать не удалось)"""
+    try:
+        return np.datetime64(timestamp, "ns").astype(np.int64)
+    except (ValueError, TypeError):
+        return NAT
+
+
+class ring_file:
+    """Общая часть писателя и читателя: разметка отображённого файла"""
+
+    def map(self, path, mode):
+        self.path = path
+        self.inode = os.stat(path).st_ino
+        self.buf = np.memmap(path, dtype=np.uint8, mode=mode)
+        self.header = self.buf[:48].view("<i8")
+        if self.buf[:8].tobytes() != MAGIC:
+            raise ValueError(f"{path} не является кольцевым буфером")
+
+        header_size, self.capacity, self.width = (int(v) for v in self.header[1:4])
+        names_len = int(self.header[5])
+        self.names = json.loads(self.buf[48:48 + names_len].tobytes().decode("utf-8"))
+
+        times_end = header_size + 8 * self.capacity
+        self.times = self.buf[header_size:times_end].view("<i8")
+        self.values = self.buf[times_end:times_end + 8 * self.capacity * self.width].view("<f8")
+        self.values = self.values.reshape(self.capacity, self.width)
+
+    @property
+    def cursor(self):
+        return int(self.header[4])
+
+
+class ring_writer(ring_file):
+    """Писатель кольцевого буфера (один на файл)"""
+
+    def __init__(self, path, names, capacity):
+        # История, накопленная до перезапуска, сохраняется, если файл подходит
+        if os.path.exists(path):
+            try:
+                self.map(path, "r+")
+                if self.names == list(names) and self.capacity == capacity:
+                    return
+                del self.buf
+            except (OSError, ValueError):
+                pass
+
+        names_json = json.dumps(list(names)).encode("utf-8")
+        header_size = -(-(48 + len(names_json)) // PAGE) * PAGE
+        size = header_size + 8 * capacity * (1 + len(names))
+
+        # Новый файл собирается рядом и подменяет старый целиком:
+        # читатели со старым отображением увидят смену inode и переоткроют файл
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as file:
+            file.truncate(size)
+            file.write(MAGIC)
+            file.write(np.array([header_size, capacity, len(names), 0, len(names_json)], dtype="<i8").tobytes())
+            file.write(names_json)
+        os.replace(tmp, path)
+        self.map(path, "r+")
+
+    def append(self, timestamp, values):
+        """Дописать строку: сначала данные, затем курсор - читатель не увидит недописанную строку"""
+        cursor = self.cursor
+        row = cursor % self.capacity
+        self.times[row] = timestamp
+        self.values[row] = values
+        self.header[4] = cursor + 1
+
+    def close(self):
+        self.buf.flush()
+        del self.buf
+
+
+class ring_reader(ring_file):
+    """Читатель кольцевого буфера"""
+
+    def __init__(self, path):
+        self.map(path, "r")
+
+    def changed(self):
+        """Файл был пересоздан писателем (например, сменились колонки)"""
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return False
+
+    def latest(self, rows):
+        """
+        Последние rows строк: times (datetime64[ns]) и values (float64).
+        Пока окно не пересекает границу кольца, это виды на файл без копирования;
+        писатель может перезаписать их через capacity - rows новых строк.
+        """
+        cursor = self.cursor
+        rows = min(rows, cursor, self.capacity)
+        start, end = (cursor - rows) % self.capacity, cursor % self.capacity
+        if rows and end <= start:
+            times = np.concatenate((self.times[start:], self.times[:end]))
+            values = np.concatenate((self.values[start:], self.values[:end]))
+        else:
+            times, values = self.times[start:start + rows], self.values[start:start + rows]
+        return times.view("datetime64[ns]"), values
+
+    def frame(self, rows):
+        """Последние rows строк в виде DataFrame с колонкой DateTime, как в CSV Reciever-а"""
+        times, values = self.latest(rows)
+        frame = pd.DataFrame(values, columns=self.names, copy=True)
+        frame.insert(0, "DateTime", times)
+        return frame
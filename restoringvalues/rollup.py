@@ -0,0 +1,201 @@
+"""
+Агрегаты заполненных данных по минутам, часам и суткам для длинных диапазонов GUI.
+
+Business при каждой записи заполненного батча дописывает новые строки в агрегаты
+установки (rollup_writer.fold): для каждой колонки и корзины времени хранятся
+минимум, максимум, сумма, число значений и число заполненных Business-ом значений
+(среднее = сумма / число). Строки учитываются один раз - по возрастанию времени,
+после последней учтённой строки (водяной знак); значения, которые потоковая
+модель уточнит позже, в агрегатах остаются такими, какими были записаны впервые.
+
+Каждое разрешение - отдельный файл в формате кольцевого буфера (ring_store):
+    timestamps - начало корзины в наносекундах эпохи (NaT - слот пуст),
+    values     - колонки "<признак>:<статистика>" по STATS на каждый признак,
+    cursor     - водяной знак (время последней учтённой строки, NaT - ещё ничего).
+Слот корзины - её номер по модулю ёмкости, поэтому запрос диапазона читает только
+корзины диапазона, сколько бы истории ни накопилось; корзина старше ёмкости
+разрешения перезаписывается новой.
+
+GUI берёт самое подробное разрешение, которое ещё хранит начало диапазона и число
+корзин которого в диапазоне укладывается в бюджет точек графика (rollup_set.query).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from restoringvalues.ring_store import ring_file, ring_writer, NAT
+
+MINUTE, HOUR, DAY = 60 * 10**9, 3600 * 10**9, 86400 * 10**9
+# Разрешения от подробного к грубому: (имя, шаг корзины в нс, ёмкость в корзинах)
+RESOLUTIONS = [
+    ("minute", MINUTE, 31 * 24 * 60),  # месяц
+    ("hour", HOUR, 366 * 24),  # год
+    ("day", DAY, 10 * 366),  # десять лет
+]
+STATS = ["min", "max", "sum", "count", "imputed"]
+LABELS = {"minute": "минута", "hour": "час", "day": "сутки"}  # Подписи разрешений для GUI
+
+
+def rollup_path(directory, name, resolution):
+    """Путь к файлу агрегатов name (например, data_out_8092) с разрешением resolution"""
+    return os.path.join(directory, f"rollup_{name}_{resolution}.bin")
+
+
+def stat_names(features):
+    return [f"{feature}:{stat}" for feature in features for stat in STATS]
+
+
+class rollup_writer(ring_writer):
+    """Агрегаты одного разрешения, пополняемые Business-ом (один писатель на файл)"""
+
+    def __init__(self, path, features, step, capacity):
+        super().__init__(path, stat_names(features), capacity)
+        self.step = step
+        self.stats = self.values.reshape(capacity, len(features), len(STATS))
+        if self.cursor == 0:
+            # Новый файл: слоты пусты, ничего не учтено
+            self.times[:] = NAT
+            self.header[4] = NAT
+
+    def fold(self, stamps, values, imputed):
+        """
+        Учесть строки новее водяного знака.
+
+        :param stamps: время строк в наносекундах эпохи (int64), по возрастанию
+        :param values: значения (строк x признаков), NaN не учитываются
+        :param imputed: маска значений, заполненных Business-ом
+        """
+        new = stamps > self.cursor
+        stamps, values, imputed = stamps[new], values[new], imputed[new]
+        if not len(stamps):
+            return
+
+        buckets = stamps // self.step
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        known = ~np.isnan(values)
+        batch = np.stack([
+            np.fmin.reduceat(values, starts),
+            np.fmax.reduceat(values, starts),
+            np.add.reduceat(np.where(known, values, 0.0), starts),
+            np.add.reduceat(known, starts).astype(np.float64),
+            np.add.reduceat(imputed & known, starts).astype(np.float64),
+        ], axis=-1)
+
+        # Из пачки длиннее кольца остаются последние capacity корзин - слоты не повторяются
+        buckets, batch = buckets[starts][-self.capacity:], batch[-self.capacity:]
+        slots, begins = buckets % self.capacity, buckets * self.step
+        stale = slots[self.times[slots] != begins]
+        if len(stale):
+            # Слоты заняты старыми корзинами (или пусты) - начинаем заново
+            self.times[stale] = NAT
+            self.stats[stale] = [np.nan, np.nan, 0.0, 0.0, 0.0]
+        old = self.stats[slots]
+        old[..., 0] = np.fmin(old[..., 0], batch[..., 0])
+        old[..., 1] = np.fmax(old[..., 1], batch[..., 1])
+        old[..., 2:] += batch[..., 2:]
+        self.stats[slots] = old
+        self.times[slots] = begins  # ключи - последними: читатель не увидит недописанную корзину
+        self.header[4] = int(stamps[-1])
+
+
+class rollup_reader(ring_file):
+    """Агрегаты одного разрешения для чтения (GUI)"""
+
+    def __init__(self, path, step):
+        self.map(path, "r")
+        self.step = step
+        self.features = [name.rsplit(":", 1)[0] for name in self.names[::len(STATS)]]
+        self.stats = self.values.reshape(self.capacity, len(self.features), len(STATS))
+
+    def changed(self):
+        """Файл был пересоздан писателем (например, сменились колонки)"""
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return False
+
+    def query(self, feature, start, end):
+        """
+        Корзины признака feature с началом в [start, end] (нс эпохи), только непустые.
+
+        :return: DataFrame с колонками DateTime, min, max, mean, count, imputed
+        """
+        first = max(-(-start // self.step), end // self.step - self.capacity + 1)
+        buckets = np.arange(first, end // self.step + 1, dtype=np.int64)
+        slots = buckets % self.capacity
+        present = self.times[slots] == buckets * self.step
+        stats = self.stats[slots[present], self.features.index(feature)]
+        count = stats[:, 3]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, stats[:, 2] / count, np.nan)
+        return pd.DataFrame({
+            "DateTime": (buckets[present] * self.step).view("datetime64[ns]"),
+            "min": stats[:, 0], "max": stats[:, 1], "mean": mean,
+            "count": count.astype(np.int64), "imputed": stats[:, 4].astype(np.int64),
+        })
+
+
+class rollup_set:
+    """Все разрешения агрегатов одного выхода Business (data_out_<port>)"""
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.writers = None  # Пополняются Business-ом
+        self.readers = {}  # Формат: {resolution: rollup_reader}, открываются GUI по требованию
+
+    def fold(self, filled, raw=None):
+        """
+        Учесть заполненный батч (DataFrame с колонкой DateTime).
+        raw - батч до заполнения: значения, пропущенные в нём, считаются заполненными.
+        """
+        filled = filled.dropna(subset=["DateTime"])
+        features = [c for c in filled.columns if c != "DateTime"]
+        times = pd.to_datetime(filled["DateTime"])
+        order = np.argsort(times.to_numpy(), kind="stable")
+        stamps = times.to_numpy().astype("datetime64[ns]").astype(np.int64)[order]
+        values = filled[features].to_numpy(dtype=np.float64)[order]
+
+        imputed = np.zeros(values.shape, dtype=bool)
+        if raw is not None:
+            raw = raw.assign(DateTime=pd.to_datetime(raw["DateTime"])).drop_duplicates(subset="DateTime", keep="last")
+            raw = raw.set_index("DateTime").reindex(times.iloc[order])
+            imputed = raw.reindex(columns=features).isna().to_numpy() & ~np.isnan(values)
+
+        if self.writers is None or self.writers[0][1].names != stat_names(features):
+            self.writers = [(resolution, rollup_writer(rollup_path(self.directory, self.name, resolution),
+                                                       features, step, capacity))
+                            for resolution, step, capacity in RESOLUTIONS]
+        for _, writer in self.writers:
+            writer.fold(stamps, values, imputed)
+
+    def reader(self, resolution, step):
+        """Читатель разрешения (None, если агрегатов ещё нет)"""
+        reader = self.readers.get(resolution)
+        if reader is None or reader.changed():
+            try:
+                reader = self.readers[resolution] = rollup_reader(rollup_path(self.directory, self.name, resolution), step)
+            except (OSError, ValueError):
+                self.readers.pop(resolution, None)
+                return None
+        return reader
+
+    def query(self, feature, start_date, end_date, points):
+        """
+        Агрегаты признака за диапазон дат в самом подробном разрешении, которое
+        ещё хранит начало диапазона и даёт не больше points корзин.
+
+        :return: (имя разрешения, DataFrame из rollup_reader.query) или None, если агрегатов нет
+        """
+        start, end = pd.Timestamp(start_date).value, pd.Timestamp(end_date).value
+        found = None
+        for resolution, step, capacity in RESOLUTIONS:
+            reader = self.reader(resolution, step)
+            if reader is None or feature not in reader.features:
+                return None
+            found = resolution, reader
+            if end // step - start // step + 1 <= points and start // step > reader.cursor // step - capacity:
+                break
+        resolution, reader = found
+        return resolution, reader.query(feature, start, end)
@@ -1,9 +1,12 @@
 import argparse
+import os
 import subprocess
 import sys
 import time
 from typing import List
 
+from restoringvalues.registry import REGISTRY_ENV, load_installations
+
 
 def start(cmd: List[str]) -> subprocess.Popen:
     # Запускаем процесс и НЕ блокируемся
@@ -16,8 +19,20 @@ def main() -> int:
     p.add_argument("--no-gui", action="store_true")
     p.add_argument("--duration", type=int, default=0,
                    help="Сколько секунд работать и завершиться. 0 = работать бесконечно.")
+    p.add_argument("--installations", default=None,
+                   help="Файл реестра установок (по умолчанию restoringvalues/installations.json).")
     args = p.parse_args()
 
+    # Реестр читают все дочерние процессы, поэтому путь передаётся через окружение
+    if args.installations:
+        os.environ[REGISTRY_ENV] = os.path.abspath(args.installations)
+    for inst in load_installations():
+        print(f"Установка: {inst}")
+
+    # GUI получает события изменений от прямой раздачи Reciever-а, а не опрашивает файлы
+    if not args.no_gui:
+        os.environ.setdefault("RECIEVER_FEED_PORT", "8096")
+
     procs: List[subprocess.Popen] = []
 
     # Важно: после добавления __init__.py можно запускать как модуль: python -m Simulator.simulator
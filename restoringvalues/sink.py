@@ -0,0 +1,254 @@
+"""
+Хранилище заполненной истории Business (data_out_<port>_long).
+
+Business пишет историю через sink (data_source.write_out):
+    csv_sink     - как раньше: последние OUT_LONG_ROWS строк целиком переписываются
+                   в data_out_<port>_long.csv на каждом тике;
+    parquet_sink - каталог data_out_<port>_long.parquet, разбитый по дням
+                   (date=YYYY-MM-DD/part-<n>.parquet). На тике дописывается по одной
+                   части на день только из новых и пересчитанных строк, прошлые части
+                   не переписываются; строка с тем же DateTime в более поздней части
+                   заменяет прежнюю (upsert). Список частей хранится в _manifest.json,
+                   который подменяется атомарно, - читатель видит только дописанные
+                   части. Когда частей одного дня больше COMPACT_PARTS, этот день
+                   (и только он) сжимается в одну часть.
+Вид выбирается переменной окружения BUSINESS_SINK (csv по умолчанию). Для parquet
+нужен pyarrow (необязательная зависимость): если его нет, Business пишет CSV.
+
+read_history читает историю любого вида с выбором колонок и диапазона дат (из
+Parquet - только нужные колонки и дни), history_path находит, что пишет Business,
+history_version даёт версию для кэшей GUI.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+SINK = os.getenv("BUSINESS_SINK", "csv") # Вид хранилища истории: csv или parquet
+OUT_LONG_ROWS = int(os.getenv("BUSINESS_OUT_LONG_ROWS", 1000)) # Строк истории в CSV
+COMPACT_PARTS = 64 # Частей одного дня, после которых день сжимается в одну часть
+RECENT_ROWS = 10000 # Сколько последних записанных строк помнить для поиска пересчитанных
+MANIFEST = "_manifest.json"
+
+
+def parquet_path(csv_path):
+    """Каталог Parquet для истории, которая в виде CSV лежала бы в csv_path"""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+class csv_sink:
+    def __init__(self, path):
+        self.path = path
+        self.out_long = None
+
+    def write(self, batch):
+        """Дописать батч и переписать последние OUT_LONG_ROWS строк истории"""
+        if self.out_long is None:
+            self.out_long = batch.copy()
+        self.out_long = pd.concat([self.out_long, batch]).drop_duplicates(subset="DateTime", keep="last").sort_values("DateTime").tail(OUT_LONG_ROWS)
+        self.out_long.to_csv(self.path, index=False)
+
+
+class parquet_sink:
+    def __init__(self, path):
+        if pq is None:
+            raise ImportError("Для BUSINESS_SINK=parquet нужен pyarrow")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.manifest = read_manifest(path) or {"version": 1, "next": 0, "parts": {}}
+        self.recent = None # Последние записанные строки (индекс - DateTime) для поиска изменений
+
+    def changed_rows(self, batch):
+        """Строки батча, которых ещё нет в истории или значения которых пересчитаны"""
+        if self.recent is None:
+            return batch
+        if list(self.recent.columns) != list(batch.columns):
+            return batch  # сменились колонки - пишем батч целиком
+        old = self.recent.reindex(batch.index).to_numpy(dtype=np.float64)
+        new = batch.to_numpy(dtype=np.float64)
+        same = ((old == new) | (np.isnan(old) & np.isnan(new))).all(axis=1)
+        return batch[~(batch.index.isin(self.recent.index) & same)]
+
+    def write(self, batch):
+        """Дописать новые и пересчитанные строки батча частями по дням"""
+        batch = batch.assign(DateTime=pd.to_datetime(batch["DateTime"], errors="coerce")).dropna(subset=["DateTime"])
+        batch = batch.drop_duplicates(subset="DateTime", keep="last").set_index("DateTime").sort_index()
+        rows = self.changed_rows(batch)
+        if rows.empty:
+            return
+
+        for day, part in rows.groupby(rows.index.strftime("%Y-%m-%d")):
+            name = f"part-{self.manifest['next']:06d}.parquet"
+            self.manifest["next"] += 1
+            write_part(self.path, day, name, part.reset_index())
+            self.manifest["parts"].setdefault(day, []).append(name)
+            if len(self.manifest["parts"][day]) > COMPACT_PARTS:
+                self.compact(day)
+        self.manifest["columns"] = ["DateTime"] + list(batch.columns)
+        old_parts = self.manifest.pop("obsolete", [])
+        write_manifest(self.path, self.manifest)
+        for day, name in old_parts:
+            # Сжатые части удаляются после того, как манифест на них больше не ссылается
+            try:
+                os.remove(os.path.join(self.path, f"date={day}", name))
+            except OSError:
+                pass
+
+        recent = pd.concat([self.recent, batch]) if self.recent is not None else batch
+        self.recent = recent[~recent.index.duplicated(keep="last")].sort_index().tail(RECENT_ROWS)
+
+    def compact(self, day):
+        """Переписать части дня одной частью (последняя версия каждой строки)"""
+        names = self.manifest["parts"][day]
+        frame = dedupe(pd.concat([pq.read_table(os.path.join(self.path, f"date={day}", name)).to_pandas() for name in names]))
+        name = f"part-{self.manifest['next']:06d}.parquet"
+        self.manifest["next"] += 1
+        write_part(self.path, day, name, frame)
+        self.manifest["parts"][day] = [name]
+        self.manifest.setdefault("obsolete", []).extend((day, old) for old in names)
+
+
+def write_part(path, day, name, frame):
+    """Записать часть дня (через временный файл: половину части читатель не увидит)"""
+    directory = os.path.join(path, f"date={day}")
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+def write_manifest(path, manifest):
+    tmp = os.path.join(path, f"{MANIFEST}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def dedupe(frame):
+    """Последняя версия каждой строки (части читаются по порядку записи), по возрастанию DateTime"""
+    return frame.drop_duplicates(subset="DateTime", keep="last").sort_values("DateTime").reset_index(drop=True)
+
+
+def make_sink(csv_path, kind=SINK):
+    """Хранилище истории Business: CSV в csv_path или Parquet рядом с ним"""
+    if kind == "parquet":
+        if pq is not None:
+            return parquet_sink(parquet_path(csv_path))
+        print("BUSINESS_SINK=parquet: pyarrow не установлен, история пишется в CSV")
+    return csv_sink(csv_path)
+
+
+def history_path(csv_path):
+    """
+    Путь к истории, которую пишет Business: каталог Parquet или CSV - что обновлялось
+    последним (Parquet - только если есть pyarrow)
+    """
+    path = parquet_path(csv_path)
+    if pq is None or history_version(path) is None:
+        return csv_path
+    if history_version(csv_path) is not None and history_version(csv_path) > history_version(path):
+        return csv_path
+    return path
+
+
+def history_version(path):
+    """Версия истории (меняется на каждой записи Business) или None, если истории нет"""
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def history_columns(path):
+    """Колонки истории без чтения данных"""
+    if os.path.isdir(path):
+        manifest = read_manifest(path)
+        return manifest.get("columns", []) if manifest else []
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_history(path, columns=None, start=None, end=None, tail=None):
+    """
+    История заполненных данных: DateTime и колонки columns (None - все), строки
+    с DateTime в [start, end] (из Parquet читаются только дни диапазона),
+    tail - только последние tail строк (из Parquet - только последние дни).
+
+    :return: DataFrame, отсортированный по DateTime
+    """
+    start = pd.Timestamp(start) if start else None
+    end = pd.Timestamp(end) if end else None
+    if not os.path.isdir(path):
+        frame = pd.read_csv(path, usecols=None if columns is None else (lambda c: c in columns or c == "DateTime"))
+        times = pd.to_datetime(frame["DateTime"], errors="coerce")
+        inside = pd.Series(True, index=frame.index)
+        if start is not None:
+            inside &= times >= start
+        if end is not None:
+            inside &= times <= end
+        frame = frame[inside]
+        return frame.tail(tail) if tail else frame
+
+    # Сжатие дня удаляет старые части: если манифест устарел, пока читали, - читаем заново
+    for attempt in range(3):
+        try:
+            frame = read_parts(path, read_manifest(path) or {"parts": {}}, columns, start, end, tail)
+            break
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+    if start is not None:
+        frame = frame[frame["DateTime"] >= start]
+    if end is not None:
+        frame = frame[frame["DateTime"] <= end]
+    return frame.tail(tail) if tail else frame
+
+
+def read_parts(path, manifest, columns, start, end, tail):
+    """Части Parquet дней диапазона (с конца, пока не наберётся tail строк), последние версии строк"""
+    if columns is not None:
+        columns = [c for c in manifest.get("columns", []) if c in columns or c == "DateTime"]
+    days = sorted(day for day in manifest["parts"]
+                  if (start is None or day >= start.strftime("%Y-%m-%d")) and (end is None or day <= end.strftime("%Y-%m-%d")))
+
+    frames, rows = [], 0
+    for day in reversed(days):
+        times = []
+        for name in manifest["parts"][day]:
+            part = pq.read_table(os.path.join(path, f"date={day}", name), columns=columns).to_pandas()
+            frames.append((day, name, part))
+            times.append(part["DateTime"])
+        if tail:
+            # Пересчитанная строка лежит в нескольких частях дня: считаем различные
+            # DateTime из диапазона (дни не пересекаются - суммы по дням достаточно)
+            times = pd.concat(times, ignore_index=True)
+            if start is not None:
+                times = times[times >= start]
+            if end is not None:
+                times = times[times <= end]
+            rows += times.nunique()
+            if rows >= tail:
+                break
+    if not frames:
+        return pd.DataFrame(columns=columns or manifest.get("columns", ["DateTime"]))
+
+    # По порядку записи: дни по возрастанию, внутри дня - части по номеру
+    frames.sort(key=lambda item: (item[0], item[1]))
+    return dedupe(pd.concat([part for _, _, part in frames], ignore_index=True))
@@ -0,0 +1,166 @@
+"""
+Бинарный формат пакетов датчиков между Simulator, server_web и Reciever.
+
+Формат согласуется при подключении подпротоколом WebSocket SUBPROTOCOL:
+если сервер его не выбрал, клиент остаётся на JSON, как раньше.
+
+Кадры (little-endian):
+    схема  - отправляется один раз на подключение и при смене колонок:
+        0  type     uint8   FRAME_SCHEMA
+        1  channel  int32   номер порта установки
+        5  dtype    2 байта b"f8" или b"f4" - тип упакованных значений
+        7  names    JSON со списком имён колонок
+    данные:
+        0  type      uint8  FRAME_DATA
+        1  channel   int32
+        5  timestamp int64  время строки в наносекундах эпохи (NaT = int64 min)
+        13 iteration int64  номер строки исходного файла
+        21 bitmap    ceil(n / 8) байт, бит i = 1 - значение i пропущено
+           values    значения без пропусков, dtype из схемы
+    пачка строк (одно сообщение на k строк):
+        0  type       uint8  FRAME_BATCH
+        1  channel    int32
+        5  count      int32  число строк k
+        9  timestamps int64[k]
+           iterations int64[k]
+           bitmaps    uint8[k, ceil(n / 8)]
+           values     значения без пропусков построчно, dtype из схемы
+
+JSON-пакет пачки: {"names", "rows": [[...], ...], "timeStamps": [...], "iterations": [...], "channel"}.
+"""
+import json
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from restoringvalues.ring_store import NAT, parse_timestamp
+
+SUBPROTOCOL = "restoringvalues.binary.v1"
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+EPOCH = datetime(1970, 1, 1)
+
+FRAME_SCHEMA = 1
+FRAME_DATA = 2
+FRAME_BATCH = 3
+SCHEMA = struct.Struct("<Bi2s")
+DATA = struct.Struct("<Biqq")
+BATCH = struct.Struct("<Bii")
+
+
+def encode_schema(channel, names, dtype="f8"):
+    """Кадр схемы канала"""
+    return SCHEMA.pack(FRAME_SCHEMA, channel, dtype.encode()) + json.dumps(list(names)).encode("utf-8")
+
+
+def encode_values(channel, timestamp, values, iteration=0, dtype="f8"):
+    """Кадр данных: метка времени (нс), значения (NaN - пропуск), номер строки"""
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    return (DATA.pack(FRAME_DATA, channel, timestamp, iteration)
+            + np.packbits(missing, bitorder="little").tobytes()
+            + values[~missing].astype("<" + dtype).tobytes())
+
+
+def encode_batch(channel, timestamps, values, iterations, dtype="f8"):
+    """Кадр пачки строк: timestamps и iterations длины k, values - матрица k x n"""
+    timestamps = np.asarray(timestamps, dtype="<i8")
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    return (BATCH.pack(FRAME_BATCH, channel, len(timestamps))
+            + timestamps.tobytes()
+            + np.asarray(iterations, dtype="<i8").tobytes()
+            + np.packbits(missing, axis=1, bitorder="little").tobytes()
+            + values[~missing].astype("<" + dtype).tobytes())
+
+
+def encode_rows(channel, timestamps, values, iterations, dtype="f8"):
+    """Одна строка - обычный кадр данных, несколько - кадр пачки"""
+    if len(timestamps) == 1:
+        return encode_values(channel, int(timestamps[0]), values[0], int(iterations[0]), dtype)
+    return encode_batch(channel, timestamps, values, iterations, dtype)
+
+
+def frame_channel(frame):
+    """Тип и канал кадра без разбора остального"""
+    kind, channel = struct.unpack_from("<Bi", frame)
+    return kind, channel
+
+
+def decode_frame(frame, schemas):
+    """
+    Разобрать бинарный кадр.
+    Кадр схемы запоминается в schemas ({channel: (names, dtype)}) и возвращает None,
+    кадр данных или пачки возвращает (channel, timestamps, values, iterations):
+    массивы длины k и матрицу значений k x n (k = 1 для кадра данных).
+
+    :raises KeyError: если схема канала ещё не получена
+    :raises ValueError: если тип кадра неизвестен
+    """
+    kind = frame[0]
+    if kind == FRAME_SCHEMA:
+        _, channel, dtype = SCHEMA.unpack_from(frame)
+        schemas[channel] = (json.loads(bytes(frame[SCHEMA.size:]).decode("utf-8")), dtype.decode())
+        return None
+    if kind == FRAME_DATA:
+        _, channel, timestamp, iteration = DATA.unpack_from(frame)
+        timestamps, iterations = np.array([timestamp]), np.array([iteration])
+        offset = DATA.size
+    elif kind == FRAME_BATCH:
+        _, channel, count = BATCH.unpack_from(frame)
+        timestamps = np.frombuffer(frame, "<i8", count, BATCH.size)
+        iterations = np.frombuffer(frame, "<i8", count, BATCH.size + 8 * count)
+        offset = BATCH.size + 16 * count
+    else:
+        raise ValueError(f"Неизвестный тип кадра {kind}")
+
+    names, dtype = schemas[channel]
+    count, width = len(timestamps), len(names)
+    nbytes = (width + 7) // 8
+    bitmaps = np.frombuffer(frame, np.uint8, count * nbytes, offset).reshape(count, nbytes)
+    missing = np.unpackbits(bitmaps, axis=1, count=width, bitorder="little").astype(bool)
+    values = np.full((count, width), np.nan)
+    values[~missing] = np.frombuffer(frame, "<" + dtype, offset=offset + count * nbytes)
+    return channel, timestamps, values, iterations
+
+
+def format_timestamp(timestamp):
+    """Наносекунды эпохи в строку TIME_FORMAT ("None" для NaT), как в JSON-пакетах"""
+    if timestamp == NAT:
+        return "None"
+    return (EPOCH + timedelta(microseconds=int(timestamp) // 1000)).strftime(TIME_FORMAT)
+
+
+def to_packet(channel, names, timestamps, values, iterations):
+    """Разобранный кадр в виде JSON-пакета: одна строка - обычный пакет, несколько - пачка"""
+    if len(timestamps) == 1:
+        return {
+            'names': names,
+            'values': values[0].tolist(),
+            'timeStamp': format_timestamp(timestamps[0]),
+            'iteration': int(iterations[0]),
+            'channel': channel
+        }
+    return {
+        'names': names,
+        'rows': values.tolist(),
+        'timeStamps': [format_timestamp(t) for t in timestamps],
+        'iterations': iterations.tolist(),
+        'channel': channel
+    }
+
+
+def packet_rows(packet):
+    """Строки JSON-пакета (обычного или пачки): список (timeStamp, values)"""
+    if 'rows' in packet:
+        return list(zip(packet['timeStamps'], packet['rows']))
+    return [(packet.get('timeStamp', "None"), packet['values'])]
+
+
+def from_packet(packet):
+    """JSON-пакет в (names, timestamps, values, iterations) для бинарных кадров"""
+    rows = packet_rows(packet)
+    iterations = packet['iterations'] if 'rows' in packet else [packet.get('iteration', 0)]
+    timestamps = [parse_timestamp(timestamp) for timestamp, _ in rows]
+    values = [[v if isinstance(v, (int, float)) else np.nan for v in row] for _, row in rows]
+    return packet['names'], timestamps, np.array(values, dtype=np.float64), iterations
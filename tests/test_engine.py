@@ -0,0 +1,105 @@
+"""
+Векторный движок заполнения (Business/engine.py) против прежней поячеечной
+реализации knn_model (reference_fill - её копия без подсчёта MAPE).
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Business"))
+from engine import batch_to_matrix, fill_matrix
+from model import knn_model
+
+ROWS = 60
+COLUMNS = 6
+
+
+def reference_knn_impute(df, target_col, time_col="DateTime", k=3):
+    """Прежний knn_model.time_based_knn_impute"""
+    df = df.copy()
+    df[time_col] = pd.to_datetime(df[time_col])
+    df["TimeNumeric"] = (df[time_col] - df[time_col].min()).dt.total_seconds()
+
+    for idx in df[df[target_col].isna()].index:
+        time_i = df.loc[idx, "TimeNumeric"]
+        known = df[df[target_col].notna()].copy()
+        known["TimeDiff"] = np.abs(known["TimeNumeric"] - time_i)
+        neighbors = known.nsmallest(k, "TimeDiff")
+        weights = 1 / (neighbors["TimeDiff"] + 1e-5)
+        df.at[idx, target_col] = np.average(neighbors[target_col], weights=weights)
+
+    return df.drop(columns=["TimeNumeric"], errors="ignore")
+
+
+def reference_fill(batch, k=3):
+    """Прежний knn_model.compare_fill_methods_and_calculate_mape_knn (режим standard)"""
+    batch_interpolation = batch.copy()
+    for col_idx, col in enumerate(batch.columns[1:], start=1):
+        for idx in range(len(batch)):
+            if pd.isna(batch.iloc[idx, col_idx]):
+                interpolated_value = None
+                if 0 < idx < len(batch) - 1:
+                    prev_val = batch_interpolation.iloc[idx - 1, col_idx]
+                    next_val = batch_interpolation.iloc[idx + 1, col_idx]
+                    if not pd.isna(prev_val) and not pd.isna(next_val):
+                        interpolated_value = (prev_val + next_val) / 2
+                        batch_interpolation.iat[idx, col_idx] = interpolated_value
+                if interpolated_value is None:
+                    temp_df = batch_interpolation[[batch.columns[0], col]].rename(columns={batch.columns[0]: "DateTime"})
+                    temp_df = reference_knn_impute(temp_df, target_col=col, time_col="DateTime", k=k)
+                    batch_interpolation.iat[idx, col_idx] = temp_df.loc[idx, col]
+    return batch_interpolation
+
+
+def make_batch(seed, pattern):
+    """Батч с неравномерным шагом времени и пропусками по шаблону"""
+    rng = np.random.default_rng(seed)
+    step = rng.integers(1, 30, ROWS).cumsum()
+    stamps = pd.Timestamp("2024-01-01") + pd.to_timedelta(step, unit="s")
+    values = rng.normal(100, 20, (ROWS, COLUMNS))
+
+    if pattern == "isolated":
+        mask = rng.random(values.shape) < 0.2
+        mask[1:] &= ~mask[:-1]
+        mask[[0, -1]] = False
+    elif pattern == "runs":
+        starts = rng.random(values.shape) < 0.05
+        mask = np.zeros(values.shape, dtype=bool)
+        for offset in range(5):
+            mask[offset:] |= starts[:ROWS - offset]
+    else:  # edge
+        mask = np.zeros(values.shape, dtype=bool)
+        mask[:4] = mask[-4:] = True
+    mask[ROWS // 2] = False  # хотя бы одно известное значение в колонке
+    values[mask] = np.nan
+
+    batch = pd.DataFrame(values, columns=[f"x{c}" for c in range(COLUMNS)])
+    batch.insert(0, "DateTime", stamps.strftime("%Y-%m-%d %H:%M:%S"))
+    return batch
+
+
+@pytest.mark.parametrize("pattern", ["isolated", "runs", "edge"])
+@pytest.mark.parametrize("seed", range(3))
+def test_fill_matrix_matches_reference(pattern, seed):
+    batch = make_batch(seed, pattern)
+    expected = reference_fill(batch).iloc[:, 1:].to_numpy(dtype=np.float64)
+
+    times, values = batch_to_matrix(batch)
+    filled, _ = fill_matrix(times, values)
+    assert np.isnan(values).any()
+    assert np.allclose(filled, expected, rtol=1e-9, atol=0)
+
+
+@pytest.mark.parametrize("pattern", ["isolated", "runs", "edge"])
+def test_knn_model_matches_reference(pattern):
+    batch = make_batch(7, pattern)
+    expected = reference_fill(batch)
+
+    filled, _, _ = knn_model().compare_fill_methods_and_calculate_mape_knn(batch)
+    assert list(filled.columns) == list(expected.columns)
+    assert (filled["DateTime"] == expected["DateTime"]).all()
+    assert np.allclose(filled.iloc[:, 1:].to_numpy(dtype=np.float64),
+                       expected.iloc[:, 1:].to_numpy(dtype=np.float64), rtol=1e-9, atol=0)
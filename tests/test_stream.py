@@ -0,0 +1,115 @@
+"""
+Потоковое заполнение (engine.stream_imputer) против fill_matrix по тому же окну.
+Батчи подаются как у Reciever-а: последние 10 строк, из них несколько новых.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Business"))
+from engine import fill_matrix, stream_imputer
+
+
+def make_frame(rng, rows, columns, late=False):
+    """Кадр с пропусками: одиночные, серии, долгое молчание колонки; late - строки из прошлого"""
+    step = rng.integers(1, 20, rows).cumsum().astype(np.float64)
+    if late:
+        moved = rng.integers(5, rows, 3)
+        step[moved] -= rng.integers(1, 60, 3)
+    stamps = pd.Timestamp("2024-01-01") + pd.to_timedelta(step, unit="s")
+    values = rng.normal(50, 10, (rows, columns))
+    gaps = rng.random(values.shape) < rng.uniform(0.05, 0.5)
+    for _ in range(rng.integers(0, 4)):
+        start = rng.integers(0, rows)
+        gaps[start:start + rng.integers(2, 15), rng.integers(0, columns)] = True
+    if rng.random() < 0.3:
+        gaps[:rng.integers(1, rows), rng.integers(0, columns)] = True
+    values[gaps] = np.nan
+
+    frame = pd.DataFrame(values, columns=[f"x{c}" for c in range(columns)])
+    frame.insert(0, "DateTime", stamps.strftime("%Y-%m-%d %H:%M:%S"))
+    return frame.drop_duplicates(subset="DateTime").reset_index(drop=True)
+
+
+def window_reference(stream):
+    """fill_matrix по строкам, которые сейчас лежат в окне"""
+    filled, _ = fill_matrix(stream.times[:stream.size], stream.raw[:stream.size], k=stream.k)
+    return filled
+
+
+def batch_rows(stream, batch):
+    return [stream.seqs[stamp] - stream.base for stamp in batch["DateTime"]]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_stream_matches_fill_matrix(seed):
+    rng = np.random.default_rng(seed)
+    frame = make_frame(rng, int(rng.integers(20, 150)), int(rng.integers(1, 5)), late=seed % 4 == 0)
+    stream = stream_imputer(window=10**6)
+
+    pos = 0
+    while pos < len(frame):
+        pos += int(rng.integers(1, 6)) if rng.random() < 0.9 else int(rng.integers(10, 40))
+        batch = frame.iloc[max(pos - 10, 0):pos].reset_index(drop=True)
+        out = stream.update(batch)
+
+        expected = window_reference(stream)
+        assert np.allclose(stream.filled[:stream.size], expected, rtol=1e-9, atol=0, equal_nan=True)
+        assert np.allclose(out, expected[batch_rows(stream, batch)], rtol=1e-9, atol=0, equal_nan=True)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_stream_after_eviction(seed):
+    """
+    Окно меньше потока: строки батча совпадают с fill_matrix по оставшемуся окну,
+    а колонка, молчавшая дольше окна, с первым значением перезаполняется по окну целиком.
+    """
+    rng = np.random.default_rng(1000 + seed)
+    rows, window = 400, int(rng.integers(30, 80))
+    stamps = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(rows) * 10, unit="s")
+    values = rng.normal(50, 10, (rows, 3))
+    values[rng.random(values.shape) < 0.15] = np.nan
+    dead = int(rng.integers(2 * window + 10, 4 * window))
+    values[:dead, 0] = np.nan
+    values[dead, 0] = 42.0
+    frame = pd.DataFrame(values, columns=["a", "b", "c"])
+    frame.insert(0, "DateTime", stamps.strftime("%Y-%m-%d %H:%M:%S"))
+    stream = stream_imputer(window=window)
+
+    pos, woken = 0, False
+    while pos < rows:
+        new = int(rng.integers(1, 4))
+        pos += new
+        batch = frame.iloc[max(pos - 10, 0):pos].reset_index(drop=True)
+        out = stream.update(batch)
+
+        expected = window_reference(stream)
+        assert np.allclose(out[:, 1:], expected[batch_rows(stream, batch), 1:], rtol=1e-9, atol=0, equal_nan=True)
+        if pos - new <= dead < pos:
+            woken = True
+            assert stream.base > 0
+            assert not np.isnan(stream.filled[:stream.size, 0]).any()
+            assert np.allclose(stream.filled[:stream.size, 0], expected[:, 0], rtol=1e-9, atol=0)
+    assert woken
+    assert stream.size <= 2 * window
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_stream_k_change_refills_window(seed):
+    """Смена k посреди потока перезаполняет всё окно, а не только новые ячейки"""
+    rng = np.random.default_rng(2000 + seed)
+    frame = make_frame(rng, 120, 3)
+    stream = stream_imputer(window=10**6)
+
+    for pos in range(5, len(frame) + 1, 5):
+        k = 3 if pos <= len(frame) // 2 else 5
+        batch = frame.iloc[max(pos - 10, 0):pos].reset_index(drop=True)
+        out = stream.update(batch, k=k)
+
+        expected = window_reference(stream)
+        assert stream.k == k
+        assert np.allclose(stream.filled[:stream.size], expected, rtol=1e-9, atol=0, equal_nan=True)
+        assert np.allclose(out, expected[batch_rows(stream, batch)], rtol=1e-9, atol=0, equal_nan=True)